@@ -8,6 +8,9 @@ import logging
 
 from amaranth import *
 from amaranth.lib import enum, data, io, stream, wiring
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.memory import Memory
 from amaranth.lib.wiring import In, Out, flipped
 
 from glasgow.applet import GlasgowAppletV2
@@ -16,9 +19,9 @@ from glasgow.support.endpoint import ServerEndpoint
 from obi.applet.open_beam_interface.modules.structs import Transforms
 from obi.commands import *
 from obi.applet.open_beam_interface.modules import (
-    Transforms, BlankRequest,BusSignature, DwellTime, DACStream, SuperDACStream, 
+    Transforms, BlankRequest,BusSignature, DwellTime, DACStream, SuperDACStream, RasterRegion,
     PipelinedLoopbackAdapter, BusController, FastBusController, 
-    Supersampler, RasterScanner, CommandParser)
+    Supersampler, RasterScanner, CommandParser, FlushTimer)
 
 # Overview of (linear) processing pipeline:
 # 1. PC software (in: user input, out: bytes)
@@ -52,17 +55,36 @@ class CommandExecutor(wiring.Component):
     blank_enable: Out(1, init=1)
 
     #Input to Serializer
-    output_mode: Out(2)
+    output_mode: Out(OutputMode)
+
+    # Trigger inputs for `RasterRegion` commands with `line_sync` or `frame_sync`
+    line_trigger: In(1)
+    frame_trigger: In(1)
 
 
     def __init__(self, *, out_only:bool=False, adc_latency=8, ext_delay_cyc=960000,
-                transforms: Transforms=Transforms(False, False, False)):
+                transforms: Transforms=Transforms(False, False, False), timestamp_interval:int=0,
+                adc_half_period:int=3, skip_y_write:bool=False, pattern_depth:int=PATTERN_MEMORY_DEPTH,
+                has_line_trigger:bool=True, has_frame_trigger:bool=True):
         self.adc_latency = adc_latency
+        # Points of vector patterns stored for `PatternReplayCommand`
+        self.pattern_depth = pattern_depth
+        # Bus timing, see `BusController`
+        self.adc_half_period = adc_half_period
+        self.skip_y_write = skip_y_write
+        # Pixels between timestamp records, or 0 to never send them
+        self.timestamp_interval = timestamp_interval
         # Time for external control relay/switch to actuate
         self.ext_delay_cyc = ext_delay_cyc
+        # Without a trigger input, `line_sync` and `frame_sync` are ignored instead of waiting forever
+        self.has_line_trigger = has_line_trigger
+        self.has_frame_trigger = has_frame_trigger
         self.transforms = transforms
 
         self.supersampler = Supersampler()
+        # The shortest pixel that is divided has 3 samples, see `Supersampler`
+        assert 3 * (adc_half_period * 2) >= Supersampler.DIVIDE_CYCLES, \
+            f"ADC period of {adc_half_period * 2} cycles is too short to average 3 samples"
 
         self.out_only = out_only
         super().__init__()
@@ -78,7 +100,8 @@ class CommandExecutor(wiring.Component):
         if self.out_only:
             m.submodules.bus_controller = bus_controller = FastBusController()
         else:
-            m.submodules.bus_controller = bus_controller = BusController(adc_half_period=3, adc_latency=self.adc_latency, transforms=self.transforms)
+            m.submodules.bus_controller = bus_controller = BusController(adc_half_period=self.adc_half_period, adc_latency=self.adc_latency,
+                transforms=self.transforms, skip_y_write=self.skip_y_write)
         m.submodules.raster_scanner = self.raster_scanner = RasterScanner()
         m.submodules.supersampler = self.supersampler
 
@@ -86,11 +109,15 @@ class CommandExecutor(wiring.Component):
         wiring.connect(m, bus_controller.adc_stream, self.supersampler.super_adc_stream)
         wiring.connect(m, flipped(self.bus), bus_controller.bus)
         m.d.comb += self.inline_blank.eq(bus_controller.inline_blank)
+        m.d.comb += [
+            self.raster_scanner.line_trigger.eq(self.line_trigger),
+            self.raster_scanner.frame_trigger.eq(self.frame_trigger),
+        ]
 
         vector_stream = stream.Signature(DACStream).create()
 
         raster_mode = Signal()
-        output_mode = Signal(2)
+        output_mode = Signal(OutputMode)
         command = Signal.like(self.cmd_stream.payload)
         with m.If(raster_mode):
             wiring.connect(m, self.raster_scanner.dac_stream, self.supersampler.dac_stream)
@@ -121,7 +148,7 @@ class CommandExecutor(wiring.Component):
                 m.d.sync += async_blank.request.eq(0)
 
         run_length = Signal.like(command.payload.raster_pixel_run.length)
-        raster_region = Signal.like(command.payload.raster_region.roi)
+        raster_region = Signal(RasterRegion)
         m.d.comb += [
             self.raster_scanner.roi_stream.payload.eq(raster_region),
             vector_stream.payload.dac_x_code.eq(command.payload.vector_pixel.x_coord),
@@ -132,6 +159,102 @@ class CommandExecutor(wiring.Component):
         sync_req = Signal()
         sync_ack = Signal()
 
+        # Timestamp records are sent in 16-bit output mode, before the first pixel after every
+        # `timestamp_interval` pixels. Pixels always have the low 2 bits clear, so the marker word cannot be
+        # mistaken for a pixel, and the other words carry 14 bits each, shifted like pixels.
+        timestamp = Signal(42) # free-running, in cycles of the system clock
+        m.d.sync += timestamp.eq(timestamp + 1)
+        sequence = Signal(42) # pixels sent since synchronization
+        interval_count = Signal(range(max(self.timestamp_interval, 2)))
+        record_pending = Signal()
+        record_timestamp = Signal(42)
+        record_sequence = Signal(42)
+        record_words = Array([C(TIMESTAMP_MARKER, 16)] +
+            [Cat(C(0, 2), field[offset:offset + 14])
+                for field in (record_timestamp, record_sequence) for offset in (28, 14, 0)])
+        record_index = Signal(range(len(record_words)))
+
+        # In `RasterPixelFreeRun`, a frame marker is sent in 16-bit output mode before the first pixel
+        # of every frame. Pixels in flight are flagged if they start a frame; bit 0 is the next pixel to retire.
+        at_frame_start = Signal()
+        frame_start_submit = Signal()
+        frame_marker_sent = Signal()
+        frame_start_flags = Signal(1 << len(in_flight_pixels))
+        with m.If(self.raster_scanner.roi_stream.valid & self.raster_scanner.roi_stream.ready):
+            m.d.sync += at_frame_start.eq(1)
+        with m.Elif(submit_pixel & raster_mode):
+            m.d.sync += at_frame_start.eq(0)
+        frame_start_retired = Mux(retire_pixel, frame_start_flags >> 1,
+            Cat(frame_start_flags[0] & ~frame_marker_sent, frame_start_flags[1:]))
+        with m.If(frame_start_submit):
+            m.d.sync += frame_start_flags.eq(frame_start_retired | (1 << (in_flight_pixels - retire_pixel).as_unsigned()))
+        with m.Else():
+            m.d.sync += frame_start_flags.eq(frame_start_retired)
+
+        # Pattern memory. While `pattern_loading`, vector pixels are stored instead of executed.
+        # Points past the end of the memory are dropped rather than wrapped around to its start,
+        # and replays that reach past the end are not executed at all.
+        m.submodules.pattern_memory = pattern_memory = Memory(shape=data.StructLayout({
+            "x_coord": 14, "y_coord": 14, "dwell_time": 16,
+        }), depth=self.pattern_depth, init=[])
+        pattern_write = pattern_memory.write_port()
+        pattern_read = pattern_memory.read_port()
+        pattern_loading = Signal()
+        pattern_load_count = Signal(16)
+        pattern_load_address = Signal(17)
+        m.d.comb += [
+            pattern_write.addr.eq(pattern_load_address),
+            pattern_write.data.x_coord.eq(command.payload.vector_pixel.x_coord),
+            pattern_write.data.y_coord.eq(command.payload.vector_pixel.y_coord),
+            pattern_write.data.dwell_time.eq(command.payload.vector_pixel.dwell_time),
+        ]
+        # `replay_index` is the point in the read port, once `replay_primed`
+        replay_index = Signal(16)
+        replay_pass = Signal(16)
+        replay_primed = Signal()
+        replay_dwell = Signal(32)
+        m.d.comb += pattern_read.en.eq(0)
+        m.d.comb += replay_dwell.eq((pattern_read.data.dwell_time * command.payload.extended.scale) >> 8)
+        replay_in_range = Signal()
+        m.d.comb += replay_in_range.eq(
+            command.payload.extended.address + command.payload.extended.length < self.pattern_depth)
+
+        # Performance counters, sent in response to `ReadCountersCommand` in the order of `PerformanceCounters`.
+        # They wrap around at 32 bits, except the skid buffer high-water mark, which is reset when read.
+        fetch_idle_cycles = Signal(32)
+        output_stalled_cycles = Signal(32)
+        cmd_counts = [Signal(32, name=f"{cmdtype.name}_count") for cmdtype in CmdType]
+        retiring = Signal()
+        counters_req = Signal()
+        counters_ack = Signal()
+        counter_words = []
+        counter_is_low = []
+        def add_counter(counter):
+            counter_words.extend([counter[16:], counter[:16]])
+            counter_is_low.extend([0, 1])
+        for counter in [fetch_idle_cycles, self.supersampler.stall_cycles, output_stalled_cycles]:
+            add_counter(counter)
+        counter_words.append(bus_controller.skid_max_level if not self.out_only else C(0, 16))
+        counter_is_low.append(0)
+        for counter in cmd_counts:
+            add_counter(counter)
+        assert len(counter_words) == COUNTER_WORDS
+        # the low word of a counter is latched with its high word, so that a carry between them is not lost
+        counter_words = Array(counter_words + [C(0, 16)])
+        counter_is_low = Array(C(is_low, 1) for is_low in counter_is_low)
+        counter_index = Signal(range(COUNTER_WORDS))
+        counter_low = Signal(16)
+
+        def retire():
+            # Latch the next command as the current one retires, so that back-to-back commands
+            # execute without a `Fetch` cycle between them.
+            m.d.comb += retiring.eq(1)
+            m.d.comb += self.cmd_stream.ready.eq(1)
+            with m.If(self.cmd_stream.valid):
+                m.d.sync += command.eq(self.cmd_stream.payload)
+            with m.Else():
+                m.next = "Fetch"
+
         self.is_executing = Signal()
         with m.FSM() as fsm:
             m.d.comb += self.is_executing.eq(fsm.ongoing("Execute"))
@@ -151,23 +274,23 @@ class CommandExecutor(wiring.Component):
                         with m.If(sync_ack):
                             #m.d.sync += raster_mode.eq(command.payload.synchronize.mode.raster)
                             m.d.sync += output_mode.eq(command.payload.synchronize.mode.output)
-                            m.next = "Fetch"
+                            retire()
 
                     with m.Case(CmdType.Abort):
                         m.d.sync += self.flush.eq(1)
                         m.d.comb += self.raster_scanner.abort.eq(1)
-                        m.next = "Fetch"
+                        retire()
 
                     with m.Case(CmdType.Flush):
                         m.d.sync += self.flush.eq(1)
-                        m.next = "Fetch"
+                        retire()
 
                     with m.Case(CmdType.Delay):
                         # if inline delay
                         #     m.d.sync += inline_delay_counter.eq(command.payload.delay.delay)
                         with m.If(delay_counter == command.payload.delay.delay):
                             m.d.sync += delay_counter.eq(0)
-                            m.next = "Fetch"
+                            retire()
                         with m.Else():
                             m.d.sync += delay_counter.eq(delay_counter + 1)
                     
@@ -184,7 +307,7 @@ class CommandExecutor(wiring.Component):
                                 m.d.sync += ext_switch_delay_counter.eq(0)
                                 with m.If(~command.payload.external_ctrl.enable):
                                     m.d.sync += self.ext_ctrl_enabled.eq(0)
-                                m.next = "Fetch"
+                                retire()
                             with m.Else():
                                 m.d.sync += ext_switch_delay_counter.eq(ext_switch_delay_counter + 1)
                     
@@ -192,31 +315,41 @@ class CommandExecutor(wiring.Component):
                         #Don't change control in the middle of previously submitted pixels
                         with m.If(self.supersampler.dac_stream.ready):
                             m.d.sync += self.beam_type.eq(command.payload.beam_select.beam_type)
-                            m.next = "Fetch"
+                            retire()
 
                     with m.Case(CmdType.Blank):
                         with m.If(command.payload.blank.inline):
                             m.d.sync += sync_blank.enable.eq(command.payload.blank.enable)
                             m.d.sync += sync_blank.request.eq(1)
-                            m.next = "Fetch"
+                            retire()
                         with m.Else():
                             #Don't blank in the middle of previously submitted pixels
                             with m.If(self.supersampler.dac_stream.ready):
                                 m.d.sync += async_blank.enable.eq(command.payload.blank.enable)
                                 m.d.sync += async_blank.request.eq(1)
-                                m.next = "Fetch"
+                                retire()
 
                     with m.Case(CmdType.RasterRegion):
+                        line_sync = command.payload.raster_region.line_sync if self.has_line_trigger else 0
+                        frame_sync = command.payload.raster_region.frame_sync if self.has_frame_trigger else 0
                         m.d.comb += raster_mode.eq(1)
                         m.d.sync += raster_region.eq(command.payload.raster_region.roi)
+                        m.d.sync += [
+                            raster_region.serpentine.eq(command.payload.raster_region.serpentine),
+                            raster_region.line_sync.eq(line_sync),
+                            raster_region.frame_sync.eq(frame_sync),
+                        ]
                         m.d.comb += [
                             self.raster_scanner.roi_stream.valid.eq(1),
                             self.raster_scanner.roi_stream.payload.eq(command.payload.raster_region.roi),
+                            self.raster_scanner.roi_stream.payload.serpentine.eq(command.payload.raster_region.serpentine),
+                            self.raster_scanner.roi_stream.payload.line_sync.eq(line_sync),
+                            self.raster_scanner.roi_stream.payload.frame_sync.eq(frame_sync),
                         ]
                         
                         m.d.comb += self.raster_scanner.abort.eq(1)
                         with m.If(self.raster_scanner.roi_stream.ready):
-                            m.next = "Fetch"
+                            retire()
 
                     with m.Case(CmdType.RasterPixel):
                         m.d.comb += raster_mode.eq(1)
@@ -227,7 +360,7 @@ class CommandExecutor(wiring.Component):
                         ]
                         with m.If(self.raster_scanner.dwell_stream.ready):
                             m.d.comb += submit_pixel.eq(1)
-                            m.next = "Fetch"
+                            retire()
 
                     with m.Case(CmdType.RasterPixelRun):
                         m.d.comb += raster_mode.eq(1)
@@ -240,7 +373,7 @@ class CommandExecutor(wiring.Component):
                             m.d.comb += submit_pixel.eq(1)
                             with m.If(run_length == command.payload.raster_pixel_run.length):
                                 m.d.sync += run_length.eq(0)
-                                m.next = "Fetch"
+                                retire()
                             with m.Else():
                                 m.d.sync += run_length.eq(run_length + 1)
                     
@@ -249,7 +382,7 @@ class CommandExecutor(wiring.Component):
                         with m.If(self.raster_scanner.dwell_stream.ready):
                             m.d.comb += submit_pixel.eq(1)
                         with m.If(self.raster_scanner.roi_stream.ready):
-                            m.next = "Fetch"
+                            retire()
                         with m.Else():
                             m.d.comb += [
                                 self.raster_scanner.dwell_stream.valid.eq(1),
@@ -262,45 +395,172 @@ class CommandExecutor(wiring.Component):
                         m.d.comb += raster_mode.eq(1)
                         m.d.comb += [
                             self.raster_scanner.roi_stream.payload.eq(raster_region),
-                            self.raster_scanner.dwell_stream.payload.dwell_time.eq(command.payload.raster_pixel.dwell_time),
+                            self.raster_scanner.dwell_stream.payload.dwell_time.eq(command.payload.raster_pixel_free_run.dwell_time),
                             self.raster_scanner.dwell_stream.payload.blank.eq(sync_blank)
                         ]
                         with m.If(self.cmd_stream.valid):
                             m.d.comb += self.raster_scanner.abort.eq(1)
                             # `abort` only takes effect on the next opportunity!
                             with m.If(in_flight_pixels == 0):
-                                m.next = "Fetch"
+                                retire()
                         with m.Else():
                             # resynchronization is mandatory after this command
                             m.d.comb += self.raster_scanner.roi_stream.valid.eq(1)
                             m.d.comb += self.raster_scanner.dwell_stream.valid.eq(1)
                             with m.If(self.raster_scanner.dwell_stream.ready):
                                 m.d.comb += submit_pixel.eq(1)
+                                m.d.comb += frame_start_submit.eq(at_frame_start & (output_mode == OutputMode.SixteenBit))
 
 
                     with m.Case(CmdType.VectorPixel, CmdType.VectorPixelMinDwell):
-                        m.d.comb += vector_stream.valid.eq(1)
-                        m.d.comb += vector_stream.payload.blank.eq(sync_blank)
-                        m.d.comb += vector_stream.payload.delay.eq(inline_delay_counter)
-                        with m.If(vector_stream.ready):
-                            m.d.sync += inline_delay_counter.eq(0)
-                            m.d.comb += submit_pixel.eq(1)
-                            m.next = "Fetch"
+                        with m.If(pattern_loading):
+                            m.d.comb += pattern_write.en.eq(pattern_load_address < self.pattern_depth)
+                            m.d.sync += pattern_load_address.eq(pattern_load_address + 1)
+                            with m.If(pattern_load_count == 0):
+                                m.d.sync += pattern_loading.eq(0)
+                            with m.Else():
+                                m.d.sync += pattern_load_count.eq(pattern_load_count - 1)
+                            retire()
+                        with m.Else():
+                            m.d.comb += vector_stream.valid.eq(1)
+                            m.d.comb += vector_stream.payload.blank.eq(sync_blank)
+                            m.d.comb += vector_stream.payload.delay.eq(inline_delay_counter)
+                            with m.If(vector_stream.ready):
+                                m.d.sync += inline_delay_counter.eq(0)
+                                m.d.comb += submit_pixel.eq(1)
+                                retire()
+
+                    with m.Case(CmdType.Extended):
+                        with m.Switch(command.payload.extended.op):
+                            with m.Case(ExtendedOp.PatternLoad):
+                                m.d.sync += [
+                                    pattern_load_address.eq(command.payload.extended.address),
+                                    pattern_load_count.eq(command.payload.extended.length),
+                                    pattern_loading.eq(1),
+                                ]
+                                retire()
+
+                            with m.Case(ExtendedOp.PatternReplay):
+                                with m.If(~replay_in_range):
+                                    retire()
+                                with m.Elif(~replay_primed):
+                                    # read the first point
+                                    m.d.comb += pattern_read.addr.eq(command.payload.extended.address)
+                                    m.d.comb += pattern_read.en.eq(1)
+                                    m.d.sync += replay_index.eq(0)
+                                    m.d.sync += replay_primed.eq(1)
+                                with m.Else():
+                                    m.d.comb += [
+                                        vector_stream.valid.eq(1),
+                                        vector_stream.payload.dac_x_code.eq(pattern_read.data.x_coord),
+                                        vector_stream.payload.dac_y_code.eq(pattern_read.data.y_coord),
+                                        vector_stream.payload.blank.eq(sync_blank),
+                                        vector_stream.payload.delay.eq(inline_delay_counter),
+                                    ]
+                                    with m.If(replay_dwell[16:] != 0):
+                                        m.d.comb += vector_stream.payload.dwell_time.eq(0xffff)
+                                    with m.Else():
+                                        m.d.comb += vector_stream.payload.dwell_time.eq(replay_dwell)
+                                    with m.If(vector_stream.ready):
+                                        m.d.sync += inline_delay_counter.eq(0)
+                                        m.d.comb += submit_pixel.eq(1)
+                                        # read the next point
+                                        next_index = Signal.like(replay_index)
+                                        m.d.comb += next_index.eq(replay_index + 1)
+                                        with m.If(replay_index == command.payload.extended.length):
+                                            m.d.comb += next_index.eq(0)
+                                            m.d.sync += replay_pass.eq(replay_pass + 1)
+                                        m.d.comb += pattern_read.addr.eq(command.payload.extended.address + next_index)
+                                        m.d.comb += pattern_read.en.eq(1)
+                                        m.d.sync += replay_index.eq(next_index)
+                                        with m.If((replay_index == command.payload.extended.length) &
+                                                  (replay_pass == command.payload.extended.repeat)):
+                                            m.d.sync += replay_pass.eq(0)
+                                            m.d.sync += replay_primed.eq(0)
+                                            retire()
+
+                            with m.Case(ExtendedOp.ReadCounters):
+                                m.d.comb += counters_req.eq(1)
+                                with m.If(counters_ack):
+                                    retire()
+
+                            with m.Default():
+                                retire()
 
         with m.FSM():
             with m.State("Imaging"):
+                m.d.comb += self.output_mode.eq(output_mode) #input to Serializer
+                with m.If(frame_start_flags[0]):
+                    # hold the first pixel of the frame until the marker before it has been sent
+                    m.d.comb += [
+                        self.img_stream.payload.eq(FRAME_MARKER),
+                        self.img_stream.valid.eq(self.supersampler.adc_stream.valid),
+                        frame_marker_sent.eq(self.supersampler.adc_stream.valid & self.img_stream.ready),
+                    ]
+                with m.Elif(record_pending):
+                    # hold the next pixel until the timestamp record before it has been sent
+                    with m.If(self.supersampler.adc_stream.valid):
+                        m.d.sync += [
+                            record_pending.eq(0),
+                            record_timestamp.eq(timestamp),
+                            record_sequence.eq(sequence),
+                        ]
+                        m.next = "Write_timestamp"
+                with m.Elif(output_mode == OutputMode.RawSum):
+                    # the high word of the sum, then the low word
+                    m.d.comb += [
+                        self.img_stream.payload.eq(self.supersampler.adc_sum[16:]),
+                        self.img_stream.valid.eq(self.supersampler.adc_stream.valid),
+                    ]
+                    with m.If(self.supersampler.adc_stream.valid & self.img_stream.ready):
+                        m.next = "Write_sum_low"
+                with m.Else():
+                    m.d.comb += [
+                        self.img_stream.payload.eq(self.supersampler.adc_stream.payload.adc_code << 2),
+                        self.img_stream.valid.eq(self.supersampler.adc_stream.valid),
+                        self.supersampler.adc_stream.ready.eq(self.img_stream.ready),
+                    ]
+                with m.If((in_flight_pixels == 0) & sync_req):
+                    m.next = "Write_FFFF"
+                with m.If((in_flight_pixels == 0) & counters_req):
+                    m.next = "Write_counters"
+
+            with m.State("Write_sum_low"):
                 m.d.comb += [
-                    self.img_stream.payload.eq(self.supersampler.adc_stream.payload.adc_code << 2),
-                    self.img_stream.valid.eq(self.supersampler.adc_stream.valid),
+                    self.output_mode.eq(output_mode),
+                    self.img_stream.payload.eq(self.supersampler.adc_sum[:16]),
+                    self.img_stream.valid.eq(1),
                     self.supersampler.adc_stream.ready.eq(self.img_stream.ready),
-                    self.output_mode.eq(output_mode) #input to Serializer
                 ]
-                if self.out_only:
-                    m.d.comb += retire_pixel.eq(submit_pixel)
-                else:
-                    m.d.comb += retire_pixel.eq(self.supersampler.adc_stream.valid & self.img_stream.ready)
-                with m.If((in_flight_pixels == 0) & sync_req):
-                    m.next = "Write_FFFF"
+                with m.If(self.img_stream.ready):
+                    m.next = "Imaging"
+
+            with m.State("Write_timestamp"):
+                m.d.comb += [
+                    self.img_stream.payload.eq(record_words[record_index]),
+                    self.img_stream.valid.eq(1),
+                ]
+                with m.If(self.img_stream.ready):
+                    with m.If(record_index == len(record_words) - 1):
+                        m.d.sync += record_index.eq(0)
+                        m.next = "Imaging"
+                    with m.Else():
+                        m.d.sync += record_index.eq(record_index + 1)
+
+            with m.State("Write_counters"):
+                m.d.comb += self.img_stream.valid.eq(1)
+                with m.If(counter_is_low[counter_index]):
+                    m.d.comb += self.img_stream.payload.eq(counter_low)
+                with m.Else():
+                    m.d.comb += self.img_stream.payload.eq(counter_words[counter_index])
+                with m.If(self.img_stream.ready):
+                    m.d.sync += counter_low.eq(counter_words[counter_index + 1])
+                    with m.If(counter_index == COUNTER_WORDS - 1):
+                        m.d.comb += counters_ack.eq(1)
+                        m.d.sync += counter_index.eq(0)
+                        m.next = "Imaging"
+                    with m.Else():
+                        m.d.sync += counter_index.eq(counter_index + 1)
 
             with m.State("Write_FFFF"):
                 m.d.comb += [
@@ -317,30 +577,143 @@ class CommandExecutor(wiring.Component):
                 ]
                 with m.If(self.img_stream.ready):
                     m.d.comb += sync_ack.eq(1)
+                    m.d.sync += [
+                        sequence.eq(0),
+                        interval_count.eq(0),
+                        record_pending.eq(0),
+                        frame_start_flags.eq(0),
+                    ]
                     m.next = "Imaging"
 
+        with m.If(~self.is_executing):
+            m.d.sync += fetch_idle_cycles.eq(fetch_idle_cycles + 1)
+        with m.If(self.img_stream.valid & ~self.img_stream.ready):
+            m.d.sync += output_stalled_cycles.eq(output_stalled_cycles + 1)
+        with m.If(retiring):
+            with m.Switch(command.type):
+                for cmdtype, counter in zip(CmdType, cmd_counts):
+                    with m.Case(cmdtype):
+                        m.d.sync += counter.eq(counter + 1)
+        if not self.out_only:
+            m.d.comb += bus_controller.skid_max_level_reset.eq(counters_ack)
+
+        if self.out_only:
+            m.d.comb += retire_pixel.eq(submit_pixel)
+        else:
+            m.d.comb += retire_pixel.eq(self.supersampler.adc_stream.valid & self.supersampler.adc_stream.ready)
+        if self.timestamp_interval:
+            with m.If(retire_pixel):
+                m.d.sync += sequence.eq(sequence + 1)
+                with m.If(interval_count == self.timestamp_interval - 1):
+                    m.d.sync += interval_count.eq(0)
+                    m.d.sync += record_pending.eq(output_mode == OutputMode.SixteenBit)
+                with m.Else():
+                    m.d.sync += interval_count.eq(interval_count + 1)
+
         return m
 
 #=========================================================================
 class ImageSerializer(wiring.Component):
+    """
+    Serializes 16-bit image words into bytes, according to the output mode.
+
+    In the packed output modes, only the highest bits of each word are kept, and they are packed
+    into a continuous bitstream, first pixel in the most significant bit:
+
+    - :attr:`OutputMode.FourteenBitPacked`: the 14-bit ADC code, 4 pixels in 7 bytes
+    - :attr:`OutputMode.FourBit`: 2 pixels in each byte
+    - :attr:`OutputMode.OneBit`: the pixel thresholded at half of full scale, 8 pixels in each byte
+
+    A partially filled byte is padded with zeros when the output mode changes,
+    which happens before the response to every :class:`SynchronizeCommand`.
+
+    In :attr:`OutputMode.Compressed`, each pixel is rotated right by 2 bits, so that the ADC code
+    is in the low bits, and the difference from the previous rotated pixel (modulo 65536)
+    is sent as a code of 1 to 3 bytes, similar to UTF-8:
+
+    - ``0ddddddd``: differences from -64 to 63
+    - ``110ddddd 10dddddd``: differences from -1024 to 1023
+    - ``1110dddd 10dddddd 10dddddd``: any difference
+
+    The previous pixel is 0 at the start of each synchronization, so that the stream can be decoded exactly.
+
+    In :attr:`OutputMode.RawSum`, the executor sends two words for each pixel, which are serialized
+    like :attr:`OutputMode.SixteenBit`.
+    """
     img_stream: In(stream.Signature(unsigned(16)))
     usb_stream: Out(stream.Signature(8))
-    output_mode: In(2)
+    output_mode: In(OutputMode)
 
     def elaborate(self, platform):
         m = Module()
 
         low = Signal(8)
 
+        ## packed bits are aligned to the top of the accumulator
+        acc = Signal(24)
+        acc_bits = Signal(range(25))
+        acc_mode = Signal(OutputMode)
+
+        packed = Signal()
+        width = Signal(range(25))
+        aligned = Signal(24)
+
+        prev = Signal(16)
+        rotated = Cat(self.img_stream.payload[2:16], self.img_stream.payload[0:2])
+        delta = Signal(signed(16))
+        m.d.comb += delta.eq(rotated - prev)
+        with m.If(self.output_mode != OutputMode.Compressed):
+            m.d.sync += prev.eq(0)
+
+        with m.Switch(self.output_mode):
+            with m.Case(OutputMode.FourteenBitPacked):
+                m.d.comb += [packed.eq(1), width.eq(14), aligned.eq(self.img_stream.payload[2:16] << 10)]
+            with m.Case(OutputMode.FourBit):
+                m.d.comb += [packed.eq(1), width.eq(4), aligned.eq(self.img_stream.payload[12:16] << 20)]
+            with m.Case(OutputMode.OneBit):
+                m.d.comb += [packed.eq(1), width.eq(1), aligned.eq(self.img_stream.payload[15] << 23)]
+            with m.Case(OutputMode.Compressed):
+                ## codes are whole bytes, so they are always aligned to the top of an empty accumulator
+                m.d.comb += packed.eq(1)
+                with m.If((delta >= -64) & (delta < 64)):
+                    m.d.comb += [width.eq(8), aligned.eq(Cat(C(0, 16), delta[0:7], C(0, 1)))]
+                with m.Elif((delta >= -1024) & (delta < 1024)):
+                    m.d.comb += [width.eq(16), aligned.eq(Cat(C(0, 8),
+                        delta[0:6], C(0b10, 2), delta[6:11], C(0b110, 3)))]
+                with m.Else():
+                    m.d.comb += [width.eq(24), aligned.eq(Cat(
+                        delta[0:6], C(0b10, 2), delta[6:12], C(0b10, 2), delta[12:16], C(0b1110, 4)))]
+
         with m.FSM():
             with m.State("High"):
-                with m.If(self.output_mode == OutputMode.NoOutput):
+                with m.If(acc_bits >= 8):
+                    m.d.comb += self.usb_stream.payload.eq(acc[16:24])
+                    m.d.comb += self.usb_stream.valid.eq(1)
+                    with m.If(self.usb_stream.ready):
+                        m.d.sync += acc.eq(acc << 8)
+                        m.d.sync += acc_bits.eq(acc_bits - 8)
+                with m.Elif((acc_bits != 0) & (self.output_mode != acc_mode)):
+                    # pad the last partial byte of the previous output mode
+                    m.d.comb += self.usb_stream.payload.eq(acc[16:24])
+                    m.d.comb += self.usb_stream.valid.eq(1)
+                    with m.If(self.usb_stream.ready):
+                        m.d.sync += acc.eq(0)
+                        m.d.sync += acc_bits.eq(0)
+                with m.Elif(packed):
+                    m.d.comb += self.img_stream.ready.eq(1)
+                    with m.If(self.img_stream.valid):
+                        m.d.sync += acc.eq(acc | (aligned >> acc_bits))
+                        m.d.sync += acc_bits.eq(acc_bits + width)
+                        m.d.sync += acc_mode.eq(self.output_mode)
+                        with m.If(self.output_mode == OutputMode.Compressed):
+                            m.d.sync += prev.eq(rotated)
+                with m.Elif(self.output_mode == OutputMode.NoOutput):
                     m.d.comb += self.img_stream.ready.eq(1) #consume and destroy image stream
                 with m.Else():
                     m.d.comb += self.usb_stream.payload.eq(self.img_stream.payload[8:16])
                     m.d.comb += self.usb_stream.valid.eq(self.img_stream.valid)
                     m.d.comb += self.img_stream.ready.eq(self.usb_stream.ready)
-                    with m.If(self.output_mode == OutputMode.SixteenBit):
+                    with m.If((self.output_mode == OutputMode.SixteenBit) | (self.output_mode == OutputMode.RawSum)):
                         m.d.sync += low.eq(self.img_stream.payload[0:8])
                         with m.If(self.usb_stream.ready & self.img_stream.valid):
                             m.next = "Low"
@@ -385,7 +758,8 @@ class OBIComponent(wiring.Component):
 
     def __init__(self, ports, 
                 xflip: bool, yflip: bool, rotate90: bool, ext_switch_delay_ms=None,
-                loopback=False, out_only=False, **kwargs):
+                loopback=False, out_only=False, timestamp_interval=None, cmd_fifo_depth=16,
+                adc_half_period=None, skip_y_write=False, flush_timeout_us=None, **kwargs):
         self.ports            = ports
 
         if ext_switch_delay_ms:
@@ -393,10 +767,19 @@ class OBIComponent(wiring.Component):
         else:
             self.ext_delay_cyc = 0
 
+        # Pixels are sent to the host once none have followed for this long, without a `FlushCommand`
+        if flush_timeout_us is None:
+            flush_timeout_us = 100
+        self.flush_timeout_cyc = max(1, int(flush_timeout_us * pow(10, -6) / (1/(48 * pow(10,6)))))
+
         self.transforms       = Transforms(xflip, yflip, rotate90)
         self.loopback         = loopback
         self.out_only         = out_only
-
+        self.timestamp_interval = timestamp_interval or 0
+        self.adc_half_period  = adc_half_period or 3
+        self.skip_y_write     = bool(skip_y_write)
+        # Commands parsed ahead of the executor
+        self.cmd_fifo_depth   = cmd_fifo_depth
 
         super().__init__()
 
@@ -405,10 +788,25 @@ class OBIComponent(wiring.Component):
 
         ## core modules and interconnections
         m.submodules.parser     = parser     = CommandParser()
-        m.submodules.executor   = executor   = CommandExecutor(out_only=self.out_only, ext_delay_cyc=self.ext_delay_cyc, transforms=self.transforms)
+        m.submodules.executor   = executor   = CommandExecutor(out_only=self.out_only, ext_delay_cyc=self.ext_delay_cyc, transforms=self.transforms,
+                                                                timestamp_interval=self.timestamp_interval,
+                                                                adc_half_period=self.adc_half_period, skip_y_write=self.skip_y_write,
+                                                                has_line_trigger=getattr(self.ports, "line_clock", None) is not None,
+                                                                has_frame_trigger=getattr(self.ports, "frame_clock", None) is not None)
         m.submodules.serializer = serializer = ImageSerializer()
+        m.submodules.flush_timer = flush_timer = FlushTimer(self.flush_timeout_cyc)
 
-        wiring.connect(m, parser.cmd_stream, executor.cmd_stream)
+        # The parser takes a cycle for every byte of a command, so it works ahead of the executor to keep
+        # consecutive short commands (such as `VectorPixelMinDwell`) from leaving gaps in the DAC stream.
+        m.submodules.cmd_fifo   = cmd_fifo   = SyncFIFOBuffered(width=Shape.cast(Command).width, depth=self.cmd_fifo_depth)
+        m.d.comb += [
+            cmd_fifo.w_data.eq(parser.cmd_stream.payload),
+            cmd_fifo.w_en.eq(parser.cmd_stream.valid),
+            parser.cmd_stream.ready.eq(cmd_fifo.w_rdy),
+            executor.cmd_stream.payload.eq(cmd_fifo.r_data),
+            executor.cmd_stream.valid.eq(cmd_fifo.r_rdy),
+            cmd_fifo.r_en.eq(executor.cmd_stream.ready),
+        ]
         wiring.connect(m, executor.img_stream, serializer.img_stream)
 
         # wiring.connect(m, self.i_stream, parser.usb_stream)
@@ -420,7 +818,9 @@ class OBIComponent(wiring.Component):
             self.o_stream.valid.eq(serializer.usb_stream.valid),
             self.o_stream.payload.eq(serializer.usb_stream.payload),
             serializer.usb_stream.ready.eq(self.o_stream.ready),
-            self.o_flush.eq(executor.flush),
+            flush_timer.data_sent.eq(self.o_stream.valid & self.o_stream.ready),
+            flush_timer.flushed.eq(executor.flush),
+            self.o_flush.eq(executor.flush | flush_timer.flush),
             serializer.output_mode.eq(executor.output_mode)
         ]
 
@@ -505,6 +905,18 @@ class OBIComponent(wiring.Component):
             # Do not blank if external control is not enabled
             connect_pins("electron_blank",0) #TODO: check diff pair behavior here
             connect_pins("ion_blank",0)
+
+        #### Line and frame trigger inputs
+        def connect_trigger(pin_name: str, signal):
+            if getattr(self.ports, pin_name, None) is not None:
+                m.submodules[f"{pin_name}_buffer"] = buffer = io.Buffer("i", self.ports[pin_name])
+                m.submodules[f"{pin_name}_sync"] = FFSynchronizer(buffer.i[0], signal)
+            else:
+                # without a trigger pin, the executor ignores the synchronization options
+                m.d.comb += signal.eq(0)
+
+        connect_trigger("line_clock", executor.line_trigger)
+        connect_trigger("frame_clock", executor.frame_trigger)
         
         #=================================================================== end resources
 
@@ -525,6 +937,65 @@ class OBIComponent(wiring.Component):
 
         return m
 
+class CompressingServerEndpoint(ServerEndpoint):
+    """
+    A :class:`ServerEndpoint` that offers compression to each client as soon as it connects,
+    by sending :data:`obi.transfer.compress.BANNER`. A client that starts with :data:`obi.transfer.compress.OPT_IN`
+    is served compressed: :meth:`recv` decodes its commands, and :meth:`send` encodes data for it.
+    Other clients are served uncompressed.
+    """
+    logger = logging.getLogger(__name__)
+
+    # Codecs of the connection being received from, once it has opted in or not
+    _negotiated = False
+    _encoder = None
+    _decoder = None
+    # Received bytes that have not been returned by `recv` yet
+    _pending = b""
+
+    def connection_made(self, transport):
+        ## imported here, as obi.transfer imports this module
+        from obi.transfer.compress import BANNER
+        super().connection_made(transport)
+        if not transport.is_closing():
+            transport.write(BANNER)
+
+    async def _negotiate(self) -> bytes:
+        from obi.transfer.compress import OPT_IN, WireEncoder, WireDecoder
+        ## the first bytes either opt in to compression, or are the first command
+        received = b""
+        while len(received) < len(OPT_IN) and OPT_IN.startswith(received):
+            received += bytes(await super().recv(1))
+        if received == OPT_IN:
+            self._encoder, self._decoder = WireEncoder(delta=True), WireDecoder()
+            received = b""
+        self._negotiated = True
+        self.logger.info(f"connect, compressed={self._decoder is not None}")
+        return received
+
+    async def recv(self, length=0):
+        try:
+            if not self._negotiated:
+                self._pending = await self._negotiate()
+            while len(self._pending) == 0 or len(self._pending) < length:
+                data = bytes(await super().recv())
+                self._pending += self._decoder.decode(data) if self._decoder is not None else data
+        except EOFError:
+            ## the next connection negotiates again
+            self._negotiated = False
+            self._encoder = self._decoder = None
+            self._pending = b""
+            raise
+        length = length or len(self._pending)
+        data, self._pending = self._pending[:length], self._pending[length:]
+        return data
+
+    async def send(self, data):
+        if self._encoder is not None:
+            data = self._encoder.encode(bytes(data))
+        return await super().send(data)
+
+
 class OBIInterface: #not Open Beam Interface interface.....
     def __init__(self, logger, assembly, applet_args):
         self._logger = logger
@@ -548,9 +1019,15 @@ class OBIInterface: #not Open Beam Interface interface.....
 
             get_beam_args("electron")
             get_beam_args("ion")
+            for pin_id in ("line_clock", "frame_clock"):
+                if getattr(applet_args, pin_id, None) is not None:
+                    port_args.update({pin_id: getattr(applet_args, pin_id)})
             return port_args, pull_args
         
         port_args, pull_args = get_args()
+        for pin_id, option in (("line_clock", "line_sync"), ("frame_clock", "frame_sync")):
+            if getattr(applet_args, pin_id, None) is None:
+                self._logger.info(f"no {pin_id} pin is assigned, so raster scans ignore {option}")
         ports = self.assembly.add_port_group(**port_args)
         self.assembly.use_pulls(pull_args)
 
@@ -628,12 +1105,13 @@ class OBIInterface: #not Open Beam Interface interface.....
         # forward all levels of logs from the socket
         sock_logger = self._logger.getChild("socket")
         sock_logger.setLevel(logging.TRACE)
-        endpoint = await ServerEndpoint("", sock_logger, self.args.endpoint)
+        if getattr(self.args, "compress", False):
+            endpoint = await CompressingServerEndpoint("", sock_logger, self.args.endpoint)
+        else:
+            endpoint = await ServerEndpoint("", sock_logger, self.args.endpoint)
         print("Started OBI server")
         await endpoint.attach_to_pipe(self.pipe)
 
-        
-    
     async def benchmark(self):
         import time
 
@@ -681,6 +1159,11 @@ class OBIApplet(GlasgowAppletV2):
         add_beam("electron")
         add_beam("ion")
 
+        access.add_pins_argument(parser, "line_clock", 1,
+            help="input that starts each line of a raster scan with `line_sync`, such as a mains-derived clock")
+        access.add_pins_argument(parser, "frame_clock", 1,
+            help="input that starts a raster scan with `frame_sync`")
+
         Transforms.add_transform_arguments(parser),
 
         parser.add_argument("--benchmark",
@@ -694,6 +1177,19 @@ class OBIApplet(GlasgowAppletV2):
             help = "use FastBusController instead of BusController; don't use ADC")
         parser.add_argument("--ext_switch_delay", type=int, default=0,
             help="time for external control switch to actuate, in ms")
+        parser.add_argument("--timestamp-interval", type=int, default=0,
+            dest = "timestamp_interval",
+            help="send a timestamp record every N pixels in 16-bit output mode, for latency measurement")
+        parser.add_argument("--adc-half-period", type=int, default=3,
+            dest = "adc_half_period",
+            help="half of the ADC and DAC clock period, in cycles of 20.83 ns; at least 3, or 2 with --skip-y-write. "
+                 "Dwell times are counted in ADC clock periods, which are 125 ns by default")
+        parser.add_argument("--skip-y-write",
+            dest = "skip_y_write", action = 'store_true',
+            help="only write the Y DAC when its code changes, for faster raster scans")
+        parser.add_argument("--flush-timeout", type=float, default=100,
+            dest = "flush_timeout_us",
+            help="send data to the host once no more has been produced for this long, in µs")
 
 
     def build(self, args):
@@ -704,6 +1200,9 @@ class OBIApplet(GlasgowAppletV2):
     @classmethod
     def add_run_arguments(cls, parser):
         ServerEndpoint.add_argument(parser, "endpoint")
+        parser.add_argument("--compress",
+            dest = "compress", action = 'store_true',
+            help = "offer compression to clients on other machines")
 
     async def run(self, args):
         if args.benchmark:
@@ -1,7 +1,7 @@
 __all__ = []
 
-from .structs import Transforms, BlankRequest, BusSignature, DwellTime, DACStream, SuperDACStream
-__all__ += ["Transforms", "BlankRequest", "BusSignature", "DwellTime", "DACStream", "SuperDACStream"]
+from .structs import Transforms, BlankRequest, BusSignature, DwellTime, DACStream, SuperDACStream, RasterRegion
+__all__ += ["Transforms", "BlankRequest", "BusSignature", "DwellTime", "DACStream", "SuperDACStream", "RasterRegion"]
 
 from .debug import PipelinedLoopbackAdapter
 __all__ += ["PipelinedLoopbackAdapter"]
@@ -17,3 +17,6 @@ __all__ += ["RasterScanner"]
 
 from .command_parser import CommandParser
 __all__ += ["CommandParser"]
+
+from .flush_timer import FlushTimer
+__all__ += ["FlushTimer"]
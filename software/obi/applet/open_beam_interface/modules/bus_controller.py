@@ -14,6 +14,10 @@ class SkidBuffer(wiring.Component):
             "o": Out(stream.Signature(data_layout)),
         })
 
+        # Most entries in the FIFO at once since `max_level_reset`
+        self.max_level = Signal(range(depth + 1))
+        self.max_level_reset = Signal()
+
     def elaborate(self, platform):
         m = Module()
 
@@ -28,6 +32,11 @@ class SkidBuffer(wiring.Component):
             fifo.r_en.eq(self.o.ready),
         ]
 
+        with m.If(self.max_level_reset):
+            m.d.sync += self.max_level.eq(fifo.level)
+        with m.Elif(fifo.level > self.max_level):
+            m.d.sync += self.max_level.eq(fifo.level)
+
         return m
 
 #=========================================================================
@@ -50,9 +59,20 @@ class BusController(wiring.Component):
     bus: Out(BusSignature)
     inline_blank: Out(BlankRequest)
 
-    def __init__(self, *, adc_half_period: int, adc_latency: int, transforms: Transforms = Transforms(False,False,False)):
-        assert (adc_half_period * 2) >= 6, "ADC period must be large enough for FSM latency"
+    #: Cycles for an ADC read followed by an X and a Y DAC write
+    FSM_LATENCY = 6
+    #: Cycles for an ADC read followed by an X DAC write only
+    FSM_LATENCY_SKIP_Y = 4
+
+    def __init__(self, *, adc_half_period: int, adc_latency: int, transforms: Transforms = Transforms(False,False,False),
+                skip_y_write: bool = False):
+        min_period = self.FSM_LATENCY_SKIP_Y if skip_y_write else self.FSM_LATENCY
+        assert (adc_half_period * 2) >= min_period, \
+            f"ADC period of {adc_half_period * 2} cycles must be large enough for FSM latency of {min_period} cycles"
         self.adc_half_period = adc_half_period
+        # Skip the Y DAC write when the Y code is unchanged, as for most pixels of a raster line.
+        # When the ADC period is too short for a Y DAC write, the low phase of the ADC clock is stretched instead.
+        self.skip_y_write = skip_y_write
         self.adc_latency     = adc_latency
         self.transforms = transforms
 
@@ -61,13 +81,20 @@ class BusController(wiring.Component):
         self.dac_x_code_transformed = Signal.like(self.dac_stream.payload.dac_x_code)
         self.dac_y_code_transformed = Signal.like(self.dac_stream.payload.dac_y_code)
 
+        # High-water mark of the ADC samples waiting in the skid buffer, see `SkidBuffer`
+        self.skid_max_level = Signal(16)
+        self.skid_max_level_reset = Signal()
+
     def elaborate(self, platform):
         m = Module()
 
         adc_cycles = Signal(range(self.adc_half_period))
+        # Hold the ADC clock low until the DAC writes are done. Never happens if the period fits a Y DAC write.
+        adc_hold = Signal()
         with m.If(adc_cycles == self.adc_half_period - 1):
-            m.d.sync += adc_cycles.eq(0)
-            m.d.sync += self.bus.adc_clk.eq(~self.bus.adc_clk)
+            with m.If(~adc_hold):
+                m.d.sync += adc_cycles.eq(0)
+                m.d.sync += self.bus.adc_clk.eq(~self.bus.adc_clk)
         with m.Else():
             m.d.sync += adc_cycles.eq(adc_cycles + 1)
         # ADC and DAC share the bus and have to work in tandem. The ADC conversion starts simultaneously
@@ -83,6 +110,10 @@ class BusController(wiring.Component):
         m.submodules.skid_buffer = skid_buffer = \
             SkidBuffer(self.adc_stream.payload.shape(), depth=self.adc_latency)
         wiring.connect(m, flipped(self.adc_stream), skid_buffer.o)
+        m.d.comb += [
+            self.skid_max_level.eq(skid_buffer.max_level),
+            skid_buffer.max_level_reset.eq(self.skid_max_level_reset),
+        ]
 
         adc_stream_data = Signal.like(self.adc_stream.payload) # FIXME: will not be needed after FIFOs have shapes
         m.d.comb += [
@@ -101,7 +132,20 @@ class BusController(wiring.Component):
 
         stalled = Signal()
 
-        with m.FSM():
+        # Y code currently in the DAC, if any
+        y_written = Signal.like(self.dac_y_code_transformed)
+        y_written_valid = Signal()
+        write_y = Signal()
+        if self.skip_y_write:
+            m.d.comb += write_y.eq(~y_written_valid | (y_written != self.dac_y_code_transformed))
+        else:
+            m.d.comb += write_y.eq(1)
+
+        with m.FSM() as fsm:
+            # the FSM returns to `ADC_Wait` on the next cycle
+            m.d.comb += adc_hold.eq(~self.bus.adc_clk & (adc_cycles == self.adc_half_period - 1) &
+                ~(fsm.ongoing("ADC_Wait") | fsm.ongoing("Y_DAC_Write_2") | (fsm.ongoing("X_DAC_Write_2") & ~write_y)))
+
             with m.State("ADC_Wait"):
                 with m.If(self.bus.adc_clk & (adc_cycles == 0)):
                     m.d.comb += self.bus.adc_le_clk.eq(1)
@@ -163,7 +207,10 @@ class BusController(wiring.Component):
                     self.bus.data_oe.eq(1),
                     self.bus.dac_x_le_clk.eq(1),
                 ]
-                m.next = "Y_DAC_Write"
+                with m.If(write_y):
+                    m.next = "Y_DAC_Write"
+                with m.Else():
+                    m.next = "ADC_Wait"
 
             with m.State("Y_DAC_Write"):
                 m.d.comb += [
@@ -178,6 +225,8 @@ class BusController(wiring.Component):
                     self.bus.data_oe.eq(1),
                     self.bus.dac_y_le_clk.eq(1),
                 ]
+                m.d.sync += y_written.eq(self.dac_y_code_transformed)
+                m.d.sync += y_written_valid.eq(1)
                 m.next = "ADC_Wait"
 
         return m
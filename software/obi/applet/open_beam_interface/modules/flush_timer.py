@@ -0,0 +1,50 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+
+
+class FlushTimer(wiring.Component):
+    """
+    Flushes the data sent to the host once no more has been sent for `timeout` cycles,
+    so that a partial USB packet does not wait in the FIFO for the rest of it.
+
+    Properties:
+        timeout: Number of cycles without data before flushing
+
+    In:
+        data_sent: A byte was written to the FIFO
+        flushed: The FIFO is being flushed otherwise, so there is no data left to flush
+    Out:
+        flush: Flush the FIFO
+    """
+    data_sent: In(1)
+    flushed: In(1)
+
+    flush: Out(1)
+
+    def __init__(self, timeout:int):
+        assert timeout >= 1
+        self.timeout = timeout
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        pending = Signal()
+        count = Signal(range(self.timeout))
+
+        with m.If(self.data_sent):
+            m.d.sync += [
+                pending.eq(1),
+                count.eq(0),
+            ]
+        with m.Elif(self.flushed):
+            m.d.sync += pending.eq(0)
+        with m.Elif(pending):
+            with m.If(count == self.timeout - 1):
+                m.d.sync += pending.eq(0)
+                m.d.comb += self.flush.eq(1)
+            with m.Else():
+                m.d.sync += count.eq(count + 1)
+
+        return m
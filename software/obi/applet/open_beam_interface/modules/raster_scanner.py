@@ -10,9 +10,12 @@ class RasterScanner(wiring.Component):
         FRAC_BITS: number of fixed fractional bits in accumulators
 
     In:
-        roi_stream: A RasterRegion provided by a RasterScanCommand
+        roi_stream: A RasterRegion provided by a RasterScanCommand. In a serpentine region,
+            every other line is scanned from right to left, so there is no flyback between lines.
         dwell_stream: A dwell time value provided by one of the RasterPixel commands
         abort: Interrupt the scan in progress and fetch the next ROI from `roi_stream`
+        line_trigger: In a `line_sync` region, every line starts on a rising edge of this input
+        frame_trigger: In a `frame_sync` region, the first line starts on a rising edge of this input
     Out:
         dac_stream: X and Y DAC codes and a dwell time
     """
@@ -28,6 +31,9 @@ class RasterScanner(wiring.Component):
     abort: In(1)
     #: Interrupt the scan in progress and fetch the next ROI from `roi_stream`.
 
+    line_trigger: In(1)
+    frame_trigger: In(1)
+
     dac_stream: Out(stream.Signature(DACStream))
 
     def elaborate(self, platform):
@@ -39,6 +45,19 @@ class RasterScanner(wiring.Component):
         x_count = Signal.like(region.x_count)
         y_accum = Signal(14 + self.FRAC_BITS)
         y_count = Signal.like(region.y_count)
+        x_reverse = Signal()
+
+        # Edges that arrive while a line is being scanned are ignored; the next line waits for a new one.
+        line_trigger_prev = Signal()
+        frame_trigger_prev = Signal()
+        m.d.sync += line_trigger_prev.eq(self.line_trigger)
+        m.d.sync += frame_trigger_prev.eq(self.frame_trigger)
+        line_wait = Signal()
+        frame_wait = Signal()
+        with m.If(self.line_trigger & ~line_trigger_prev):
+            m.d.sync += line_wait.eq(0)
+        with m.If(self.frame_trigger & ~frame_trigger_prev):
+            m.d.sync += frame_wait.eq(0)
         m.d.comb += [
             self.dac_stream.payload.dac_x_code.eq(x_accum >> self.FRAC_BITS),
             self.dac_stream.payload.dac_y_code.eq(y_accum >> self.FRAC_BITS),
@@ -56,32 +75,46 @@ class RasterScanner(wiring.Component):
                         x_count.eq(self.roi_stream.payload.x_count - 1),
                         y_accum.eq(self.roi_stream.payload.y_start << self.FRAC_BITS),
                         y_count.eq(self.roi_stream.payload.y_count - 1),
+                        x_reverse.eq(0),
+                        line_wait.eq(self.roi_stream.payload.line_sync),
+                        frame_wait.eq(self.roi_stream.payload.frame_sync),
                     ]
                     m.next = "Scan"
 
             with m.State("Scan"):
-                m.d.comb += self.dwell_stream.ready.eq(self.dac_stream.ready)
-                m.d.comb += self.dac_stream.valid.eq(self.dwell_stream.valid)
+                with m.If(line_wait | frame_wait):
+                    # hold the first pixel of the line until the trigger
+                    with m.If(self.abort):
+                        m.next = "Get-ROI"
+                with m.Else():
+                    m.d.comb += self.dwell_stream.ready.eq(self.dac_stream.ready)
+                    m.d.comb += self.dac_stream.valid.eq(self.dwell_stream.valid)
                 with m.If(self.dac_stream.ready):
                     with m.If(self.abort):
                         m.next = "Get-ROI"
-                with m.If(self.dwell_stream.valid & self.dac_stream.ready):
+                with m.If(self.dwell_stream.ready & self.dwell_stream.valid):
                     # AXI4-Stream §2.2.1
                     # > Once TVALID is asserted it must remain asserted until the handshake occurs.
 
-                    ## TODO: AC line sync 
-                    ## TODO: external trigger
                     ## TODO: be flyback aware, line and frame
 
                     with m.If(x_count == 0):
+                        m.d.sync += line_wait.eq(region.line_sync)
                         with m.If(y_count == 0):
                             m.next = "Get-ROI"
                         with m.Else():
                             m.d.sync += y_accum.eq(y_accum + region.y_step)
                             m.d.sync += y_count.eq(y_count - 1)
 
-                        m.d.sync += x_accum.eq(region.x_start << self.FRAC_BITS)
+                        with m.If(region.serpentine):
+                            # the next line starts where this one ended, stepping back over the same codes
+                            m.d.sync += x_reverse.eq(~x_reverse)
+                        with m.Else():
+                            m.d.sync += x_accum.eq(region.x_start << self.FRAC_BITS)
                         m.d.sync += x_count.eq(region.x_count - 1)
+                    with m.Elif(x_reverse):
+                        m.d.sync += x_accum.eq(x_accum - region.x_step)
+                        m.d.sync += x_count.eq(x_count - 1)
                     with m.Else():
                         m.d.sync += x_accum.eq(x_accum + region.x_step)
                         m.d.sync += x_count.eq(x_count - 1)
@@ -55,6 +55,9 @@ class RasterRegion(data.Struct):
     y_count: 14 # UQ(14,0)
     padding_y_count: 2
     y_step:  16 # UQ(8,8)
+    serpentine: 1
+    line_sync: 1
+    frame_sync: 1
 
 @dataclass
 class Transforms:
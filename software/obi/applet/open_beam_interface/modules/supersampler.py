@@ -55,6 +55,17 @@ class Supersampler(wiring.Component):
     Out:
         super_dac_stream: X and Y DAC codes and `last` signal
         adc_stream: Averaged ADC sample value
+
+    All samples of a pixel are averaged, rounding down. When the number of samples is a power of two,
+    the sum is shifted; otherwise it is divided two bits per cycle, while the samples of the next pixel
+    are accumulated. The sum itself is available in :attr:`adc_sum` while ``adc_stream`` is valid.
+
+    A division takes :attr:`DIVIDE_CYCLES` cycles from one pixel to the next, including the output handshake.
+    The ADC period has to be at least a third of that, so that the shortest pixel that is divided (3 samples)
+    never waits for the divider.
+
+    ``stall_cycles`` counts the cycles that ``dac_stream`` had no pixel while the bus was waiting for one,
+    wrapping around at 32 bits.
     """
     dac_stream: In(stream.Signature(DACStream))
 
@@ -71,21 +82,26 @@ class Supersampler(wiring.Component):
     })))
 
     ## debug info
-    stall_cycles: Out(16)
+    stall_cycles: Out(32)
     stall_count_reset: In(1)
 
+    #: Cycles between divisions: 7 steps of two quotient bits, and the output handshake
+    DIVIDE_CYCLES = 8
+
     def __init__(self):
         super().__init__()
 
         self.dac_stream_data = Signal.like(self.dac_stream.payload)
-        self.encoder = PowerOfTwoDetector(16)
+        # a dwell time of 65535 takes 65536 samples
+        self.encoder = PowerOfTwoDetector(17)
+        self.adc_sum = Signal(30)
 
     def elaborate(self, platform):
         m = Module()
         m.submodules["encoder"] = self.encoder
 
         dwell_counter = Signal.like(self.dac_stream_data.dwell_time)
-        sample_counter = Signal.like(self.dac_stream_data.dwell_time)
+        sample_counter = Signal(17)
         last = Signal()
         m.d.comb += [
             self.super_dac_stream.payload.dac_x_code.eq(self.dac_stream_data.dac_x_code),
@@ -95,13 +111,16 @@ class Supersampler(wiring.Component):
             last.eq(dwell_counter == self.dac_stream_data.dwell_time)
             #self.super_dac_stream.payload.last.eq(dwell_counter == self.dac_stream_data.dwell_time),
         ]
+        stalled = Signal()
         with m.If(self.stall_count_reset):
             m.d.sync += self.stall_cycles.eq(0)
+        with m.Elif(stalled):
+            m.d.sync += self.stall_cycles.eq(self.stall_cycles + 1)
 
-        stalled = Signal()
         with m.FSM():
             with m.State("Wait"):
                 m.d.comb += self.dac_stream.ready.eq(1)
+                m.d.comb += stalled.eq(~self.dac_stream.valid)
                 with m.If(self.dac_stream.valid):
                     m.d.sync += self.dac_stream_data.eq(self.dac_stream.payload)
                     m.d.sync += dwell_counter.eq(0)
@@ -118,17 +137,66 @@ class Supersampler(wiring.Component):
                     with m.Else():
                         m.d.sync += dwell_counter.eq(dwell_counter + 1)
 
-        m.d.comb += self.encoder.i.eq(sample_counter)
         running_sum = Signal(30)
-        last_p2_sum = Signal(30)
-        selected_sum = Signal(30)
-        shifted_sum = Signal(30)
-        with m.If(self.encoder.p): #if the current sample counter is a power of 2, use all samples
-            m.d.comb += selected_sum.eq(running_sum)
-            m.d.sync += last_p2_sum.eq(running_sum)
-        with m.Else(): # else, only average up to the last power of 2 samples
-            m.d.comb += selected_sum.eq(last_p2_sum)
-        m.d.comb += self.adc_stream.payload.adc_code.eq(selected_sum >> self.encoder.o)
+
+        # the sum of N samples is less than N << 14, so the quotient has 14 bits,
+        # and the remainder starts with the bits of the sum above them
+        divisor = Signal(17)
+        dividend = Signal(14)
+        remainder = Signal(17)
+        quotient = Signal(14)
+        div_step = Signal(range(7))
+        m.d.comb += self.encoder.i.eq(sample_counter)
+        m.d.comb += self.adc_stream.payload.adc_code.eq(quotient)
+
+        # two restoring division steps per cycle, for the two top bits of the dividend
+        quotient_bits = Signal(2)
+        partial = remainder
+        for bit in (1, 0):
+            trial = Signal(18, name=f"trial{bit}")
+            step_remainder = Signal(17, name=f"remainder{bit}")
+            m.d.comb += trial.eq(Cat(dividend[12 + bit], partial))
+            with m.If(trial >= divisor):
+                m.d.comb += step_remainder.eq(trial - divisor)
+                m.d.comb += quotient_bits[bit].eq(1)
+            with m.Else():
+                m.d.comb += step_remainder.eq(trial)
+            partial = step_remainder
+
+        div_idle = Signal()
+        div_load = Signal()
+        with m.FSM():
+            with m.State("Idle"):
+                m.d.comb += div_idle.eq(1)
+                with m.If(div_load):
+                    with m.If(self.encoder.p):
+                        m.next = "Output"
+                    with m.Else():
+                        m.next = "Divide"
+
+            with m.State("Divide"):
+                m.d.sync += [
+                    dividend.eq(dividend << 2),
+                    remainder.eq(partial),
+                    quotient.eq(Cat(quotient_bits, quotient)),
+                ]
+                with m.If(div_step == 6):
+                    m.next = "Output"
+                with m.Else():
+                    m.d.sync += div_step.eq(div_step + 1)
+
+            with m.State("Output"):
+                m.d.comb += self.adc_stream.valid.eq(1)
+                with m.If(self.adc_stream.ready):
+                    # the next sum can be loaded as this quotient is taken
+                    m.d.comb += div_idle.eq(1)
+                    with m.If(div_load):
+                        with m.If(self.encoder.p):
+                            m.next = "Output"
+                        with m.Else():
+                            m.next = "Divide"
+                    with m.Else():
+                        m.next = "Idle"
 
         with m.FSM():
             with m.State("Start"):
@@ -153,8 +221,19 @@ class Supersampler(wiring.Component):
 
 
             with m.State("Wait"):
-                m.d.comb += self.adc_stream.valid.eq(1)
-                with m.If(self.adc_stream.ready):
+                # hand the sum over to the divider once it is done with the previous pixel
+                with m.If(div_idle):
+                    m.d.comb += div_load.eq(1)
+                    m.d.sync += self.adc_sum.eq(running_sum)
+                    with m.If(self.encoder.p):
+                        m.d.sync += quotient.eq(running_sum >> self.encoder.o)
+                    with m.Else():
+                        m.d.sync += [
+                            divisor.eq(sample_counter),
+                            dividend.eq(running_sum[0:14]),
+                            remainder.eq(running_sum[14:30]),
+                            div_step.eq(0),
+                        ]
                     m.next = "Start"
 
-        return m
\ No newline at end of file
+        return m
@@ -1,5 +1,6 @@
 import inspect
 import array
+import time
 from abc import ABCMeta, abstractmethod
 import asyncio
 
@@ -10,8 +11,16 @@ import struct
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
 __all__ = []
-from .structs import CmdType, OutputMode, BeamType, u14, u16, fp8_8, DwellTime, DACCodeRange
-__all__ += ["CmdType", "OutputMode", "BeamType", "u14", "u16", "fp8_8", "DwellTime", "DACCodeRange"]
+from .structs import CmdType, ExtendedOp, OutputMode, BeamType, u14, u16, fp8_8, DwellTime, DACCodeRange
+__all__ += ["CmdType", "ExtendedOp", "OutputMode", "BeamType", "u14", "u16", "fp8_8", "DwellTime", "DACCodeRange"]
+from .packing import PACKED_OUTPUT_MODES, PixelUnpacker, DeltaDecoder
+__all__ += ["PACKED_OUTPUT_MODES", "PixelUnpacker", "DeltaDecoder"]
+from .timestamps import (FRAME_MARKER, TIMESTAMP_MARKER, TIMESTAMP_RECORD_WORDS, TIMESTAMP_CLOCK, TimestampRecord,
+                    count_timestamps, strip_timestamps)
+__all__ += ["FRAME_MARKER", "TIMESTAMP_MARKER", "TIMESTAMP_RECORD_WORDS", "TIMESTAMP_CLOCK", "TimestampRecord",
+            "count_timestamps", "strip_timestamps"]
+from .counters import COUNTER_WORDS, COUNTER_CLOCK, PerformanceCounters
+__all__ += ["COUNTER_WORDS", "COUNTER_CLOCK", "PerformanceCounters"]
 
 class BaseCommand(metaclass = ABCMeta):
     def __init_subclass__(cls):
@@ -51,7 +60,24 @@ class BaseCommand(metaclass = ABCMeta):
                 pass
         else:
             if output_mode == OutputMode.SixteenBit:
-                res = array.array('H', bytes(await stream.read(pixel_count * 2)))
+                data = bytes(await stream.read(pixel_count * 2))
+                if count_timestamps(data):
+                    ## read the rest of the records, and as many pixels as they displaced
+                    data = bytearray(data)
+                    while (missing := 2*(pixel_count + TIMESTAMP_RECORD_WORDS*count_timestamps(data)) - len(data)) > 0:
+                        data.extend(await stream.read(missing))
+                    pixels, records = strip_timestamps(data, time.perf_counter())
+                    if getattr(stream, "latency", None) is not None:
+                        stream.latency.add(records)
+                    await asyncio.sleep(0)
+                    return array.array('H', pixels.tobytes())
+                res = array.array('H', data)
+                if not BIG_ENDIAN:
+                    res.byteswap()
+                await asyncio.sleep(0)
+                return res
+            if output_mode == OutputMode.RawSum:
+                res = array.array('I', await stream.read(pixel_count * 4))
                 if not BIG_ENDIAN:
                     res.byteswap()
                 await asyncio.sleep(0)
@@ -60,14 +86,43 @@ class BaseCommand(metaclass = ABCMeta):
                 res = array.array('B', await stream.read(pixel_count))
                 await asyncio.sleep(0)
                 return res
+            if output_mode in PACKED_OUTPUT_MODES or output_mode == OutputMode.Compressed:
+                ## packed and compressed pixels depend on earlier chunks, so the unpacker is kept between calls
+                unpacker = getattr(self, "_unpacker", None)
+                if unpacker is None or unpacker.output_mode != output_mode:
+                    if output_mode == OutputMode.Compressed:
+                        unpacker = self._unpacker = DeltaDecoder()
+                    else:
+                        unpacker = self._unpacker = PixelUnpacker(output_mode)
+                res = await unpacker.read(stream, pixel_count)
+                await asyncio.sleep(0)
+                return res
+
+    async def recv_packed_end(self, stream, output_mode:OutputMode):
+        """
+        Receive the response to a :class:`SynchronizeCommand` sent after the last pixel of a packed output mode,
+        which makes the device pad and send the last partial byte.
+        """
+        if output_mode in PACKED_OUTPUT_MODES:
+            await stream.read(4) #FFFF + cookie
+            self._reset_unpacker()
+
+    def _reset_unpacker(self):
+        ## the device pads the last partial byte, and restarts compression, before every synchronization response
+        if getattr(self, "_unpacker", None) is not None:
+            self._unpacker.reset()
 __all__ += ["BaseCommand"]
 
 from .low_level_commands import (SynchronizeCommand, AbortCommand, FlushCommand, ExternalCtrlCommand,
                     BeamSelectCommand, BlankCommand, DelayCommand, RasterRegionCommand,
                     RasterPixelCommand, ArrayCommand, RasterPixelRunCommand, 
-                    RasterPixelFreeRunCommand, VectorPixelCommand, Command)
+                    RasterPixelFreeRunCommand, VectorPixelCommand, Command,
+                    ExtendedCommand, PatternLoadCommand, PatternReplayCommand, PATTERN_MEMORY_DEPTH,
+                    ReadCountersCommand)
 __all__ += ["SynchronizeCommand", "AbortCommand", "FlushCommand", "ExternalCtrlCommand",
             "BeamSelectCommand", "BlankCommand", "DelayCommand", "RasterRegionCommand",
             "RasterPixelCommand", "ArrayCommand", "RasterPixelRunCommand", 
-            "RasterPixelFreeRunCommand", "VectorPixelCommand", "Command"]
+            "RasterPixelFreeRunCommand", "VectorPixelCommand", "Command",
+            "ExtendedCommand", "PatternLoadCommand", "PatternReplayCommand", "PATTERN_MEMORY_DEPTH",
+            "ReadCountersCommand"]
     
\ No newline at end of file
@@ -0,0 +1,72 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .structs import CmdType
+
+__all__ = ["COUNTER_WORDS", "COUNTER_CLOCK", "PerformanceCounters"]
+
+#: Cycle counters, in the order they are sent by the device
+CYCLE_COUNTERS = ["fetch_idle_cycles", "dac_starved_cycles", "output_stalled_cycles"]
+#: Words sent in response to a :class:`ReadCountersCommand`: each counter as 2 words, most significant first,
+#: except the skid buffer high-water mark, which is a single word
+COUNTER_WORDS = 2*len(CYCLE_COUNTERS) + 1 + 2*len(CmdType)
+#: Frequency of the cycle counters
+COUNTER_CLOCK = 48e6
+
+
+@dataclass
+class PerformanceCounters:
+    """
+    Hardware counters of the device, read with :class:`ReadCountersCommand`.
+
+    Counters run freely from power-on and wrap around at 32 bits, about every 89 s for cycle counters.
+    Subtract an earlier reading to get the counts in between:
+
+    >>> before = await ReadCountersCommand().transfer(stream)
+    >>> ...
+    >>> print((await ReadCountersCommand().transfer(stream)) - before)
+
+    Args:
+        fetch_idle_cycles: Cycles the command executor waited for a command. High when the host, \
+            or USB OUT, is the limit.
+        dac_starved_cycles: Cycles the DAC stream waited for a pixel. High when commands are \
+            slower to execute than the pixels they produce.
+        output_stalled_cycles: Cycles a pixel waited to be sent. High when USB IN, or the host reading it, is the limit.
+        skid_buffer_max_level: Most ADC samples waiting in the bus controller at once since the last reading. \
+            Reaching the ADC latency means the bus was stopped for lack of space.
+        commands: Commands executed, by type. Commands in an :class:`ArrayCommand` count as their own type.
+    """
+    fetch_idle_cycles: int
+    dac_starved_cycles: int
+    output_stalled_cycles: int
+    skid_buffer_max_level: int
+    commands: dict[CmdType, int] = field(default_factory=dict)
+
+    @classmethod
+    def from_bytes(cls, data) -> "PerformanceCounters":
+        """
+        Args:
+            data: Big-endian 16-bit words, exactly :data:`COUNTER_WORDS` of them
+        """
+        words = np.frombuffer(data, dtype=">u2").astype(np.uint32)
+        if len(words) != COUNTER_WORDS:
+            raise ValueError(f"expected {COUNTER_WORDS} counter words, got {len(words)}")
+        cycles = (words[0:6:2] << 16) | words[1:6:2]
+        counts = (words[7::2] << 16) | words[8::2]
+        return cls(*(int(value) for value in cycles), skid_buffer_max_level=int(words[6]),
+                   commands={cmdtype: int(counts[cmdtype]) for cmdtype in CmdType})
+
+    def __sub__(self, other:"PerformanceCounters") -> "PerformanceCounters":
+        return PerformanceCounters(
+            *((getattr(self, name) - getattr(other, name)) % (1 << 32) for name in CYCLE_COUNTERS),
+            skid_buffer_max_level=self.skid_buffer_max_level,
+            commands={cmdtype: (count - other.commands.get(cmdtype, 0)) % (1 << 32)
+                      for cmdtype, count in self.commands.items()})
+
+    def __str__(self):
+        lines = [f"{name}: {getattr(self, name)} ({getattr(self, name)/COUNTER_CLOCK*1e3:.2f} ms)"
+                 for name in CYCLE_COUNTERS]
+        lines.append(f"skid_buffer_max_level: {self.skid_buffer_max_level}")
+        lines.extend(f"{cmdtype.name}: {count}" for cmdtype, count in self.commands.items() if count)
+        return "\n".join(lines)
@@ -1,5 +1,6 @@
-from .structs import BitLayout, ByteLayout, CmdType, OutputMode, BeamType, u14, u16, DwellTime, DACCodeRange
+from .structs import BitLayout, ByteLayout, CmdType, ExtendedOp, OutputMode, BeamType, u14, u16, fp8_8, DwellTime, DACCodeRange
 from . import BaseCommand
+from .counters import COUNTER_WORDS, PerformanceCounters
 
 from amaranth import *
 from amaranth.lib import enum, data, wiring
@@ -91,6 +92,9 @@ class FlushCommand(LowLevelCommand):
     '''
     Submits the data in the FPGA FIFO over USB,
     regardless of whether the FIFO is full.
+
+    The device also does this by itself once no more data has followed
+    for the time set with `--flush-timeout` when the applet is built.
     '''
     def __init__(self):
         super().__init__()
@@ -143,7 +147,18 @@ class RasterRegionCommand(LowLevelCommand):
     '''
     Sets the region of the internal raster scanner module.
     Takes :class:`DACCodeRange` as input.
+
+    Args:
+        x_range
+        y_range
+        serpentine: Scan every other line from right to left, instead of flying back \
+            to the start of the line. Defaults to False.
+        line_sync: Start every line on a rising edge of the line trigger input of the instrument, \
+            such as a signal derived from the mains. Ignored if no line trigger pin is assigned. Defaults to False.
+        frame_sync: Start the first line on a rising edge of the frame trigger input of the instrument. \
+            Ignored if no frame trigger pin is assigned. Defaults to False.
     '''
+    bitlayout = BitLayout({"serpentine": 1, "line_sync": 1, "frame_sync": 1})
     bytelayout = ByteLayout({"roi": {
         "x_start": 2,
         "x_count": 2,
@@ -153,9 +168,11 @@ class RasterRegionCommand(LowLevelCommand):
         "y_step": 2,
         
     }})
-    def __init__(self, x_range: DACCodeRange, y_range:DACCodeRange):
+    def __init__(self, x_range: DACCodeRange, y_range:DACCodeRange, serpentine:bool=False,
+                 line_sync:bool=False, frame_sync:bool=False):
         return super().__init__(x_start = x_range.start, x_count = x_range.count, x_step = x_range.step,
-                            y_start = y_range.start, y_count = y_range.count, y_step = y_range.step)
+                            y_start = y_range.start, y_count = y_range.count, y_step = y_range.step,
+                            serpentine = serpentine, line_sync = line_sync, frame_sync = frame_sync)
 
 class RasterPixelCommand(LowLevelCommand):
     '''
@@ -215,13 +232,73 @@ class VectorPixelCommand(LowLevelCommand):
         else:
             return super().as_dict()
     async def transfer(self, stream, output_mode=OutputMode.SixteenBit):
+        ## the device sends the pixel once no more follow
         await stream.write(bytes(self))
-        await stream.write(bytes(FlushCommand()))
+        await stream.flush()
         return await self.recv_res(1, stream, output_mode)
         
 class VectorPixelMinDwellCommand(LowLevelCommand):
     bytelayout = ByteLayout({"dac_stream": {"x_coord": 2, "y_coord": 2}})
 
+#: Number of points that the pattern memory of the instrument holds
+PATTERN_MEMORY_DEPTH = 1024
+
+class ExtendedCommand(LowLevelCommand):
+    '''
+    Commands that share the :attr:`CmdType.Extended` command type, told apart by an :class:`ExtendedOp`.
+    Each operation uses the fields it needs, and leaves the others at 0.
+    '''
+    bitlayout = BitLayout({"op": ExtendedOp})
+    bytelayout = ByteLayout({"address": 2, "length": 2, "repeat": 2, "scale": 2})
+    def __init_subclass__(cls):
+        # operations share the command type and layout of this class
+        pass
+    def __init__(self, *, op:ExtendedOp, address:u16=0, length:u16=0, repeat:u16=0, scale:u16=0):
+        super().__init__(op=op, address=address, length=length, repeat=repeat, scale=scale)
+
+class PatternLoadCommand(ExtendedCommand):
+    '''
+    Store the next :class:`VectorPixelCommand` commands in the pattern memory of the instrument,
+    instead of executing them. They are executed later by :class:`PatternReplayCommand`.
+    Points past the end of the memory are discarded.
+
+    Args:
+        address: First point of the pattern memory to store to
+        length: Number of points to store, minus one
+    '''
+    def __init__(self, *, address:u16, length:u16):
+        super().__init__(op=ExtendedOp.PatternLoad, address=address, length=length)
+
+class PatternReplayCommand(ExtendedCommand):
+    '''
+    Execute points from the pattern memory of the instrument, as if they were sent as :class:`VectorPixelCommand`.
+    Nothing is executed if the points reach past the end of the memory.
+
+    Args:
+        address: First point of the pattern memory to execute
+        length: Number of points to execute, minus one
+        repeat: Number of passes over the points, minus one
+        scale: Factor that the dwell time of every point is multiplied by, saturating at 65535. Defaults to 1.
+    '''
+    def __init__(self, *, address:u16, length:u16, repeat:u16=0, scale:fp8_8=fp8_8(1)):
+        super().__init__(op=ExtendedOp.PatternReplay, address=address, length=length, repeat=repeat, scale=scale)
+
+class ReadCountersCommand(ExtendedCommand):
+    '''
+    Read the performance counters of the instrument. They are sent as :data:`COUNTER_WORDS` 16-bit words,
+    after all pixels of earlier commands, regardless of the output mode.
+    Send it when no pixels are outstanding, such as after the response to a :class:`SynchronizeCommand`.
+
+    Returns:
+        PerformanceCounters: from :meth:`transfer`
+    '''
+    def __init__(self):
+        super().__init__(op=ExtendedOp.ReadCounters)
+    async def transfer(self, stream) -> PerformanceCounters:
+        await stream.write(bytes(self))
+        await stream.flush()
+        return PerformanceCounters.from_bytes(bytes(await stream.read(COUNTER_WORDS*2)))
+
 all_commands = [SynchronizeCommand, 
                 AbortCommand, 
                 FlushCommand,
@@ -236,7 +313,8 @@ all_commands = [SynchronizeCommand,
                 RasterPixelFillCommand,
                 RasterPixelFreeRunCommand,
                 VectorPixelCommand,
-                VectorPixelMinDwellCommand]
+                VectorPixelMinDwellCommand,
+                ExtendedCommand]
 
 
 
@@ -0,0 +1,168 @@
+import array
+
+import numpy as np
+
+from .structs import OutputMode
+
+__all__ = ["PACKED_OUTPUT_MODES", "PixelUnpacker", "DeltaDecoder"]
+
+#: Output modes that pack pixels into a bitstream, with the number of bits of each pixel
+PACKED_OUTPUT_MODES = {
+    OutputMode.FourteenBitPacked: 14,
+    OutputMode.FourBit: 4,
+    OutputMode.OneBit: 1,
+}
+
+
+class PixelUnpacker:
+    """
+    Unpacks the bitstream of a packed output mode, in chunks of any number of pixels.
+
+    Pixels are returned in the same units as the unpacked output modes, so they can be used in their place:
+    :attr:`OutputMode.FourteenBitPacked` pixels are 16-bit values, as with :attr:`OutputMode.SixteenBit`,
+    and :attr:`OutputMode.FourBit` and :attr:`OutputMode.OneBit` pixels are 8-bit values
+    with the lowest bits cleared, as with :attr:`OutputMode.EightBit`.
+
+    A chunk that ends in the middle of a byte needs the whole byte, which the device only sends
+    once it has the next pixel, or once it pads the byte before responding to a :class:`SynchronizeCommand`.
+    After such a synchronization, call :meth:`reset`.
+
+    Args:
+        output_mode: A packed output mode, from :data:`PACKED_OUTPUT_MODES`
+    """
+    def __init__(self, output_mode:OutputMode):
+        self.output_mode = output_mode
+        self.width = PACKED_OUTPUT_MODES[output_mode]
+        ## pixels are unpacked in groups that start and end on a byte boundary
+        self._group_pixels = {14: 4, 4: 2, 1: 8}[self.width]
+        self._group_bytes = self._group_pixels * self.width // 8
+        self.reset()
+
+    def reset(self):
+        """
+        Discard the partially received byte, after the device has padded it.
+        """
+        self._partial = b""
+        self._skip = 0
+
+    async def read(self, stream, pixel_count:int) -> array.array:
+        """
+        Read and unpack the next ``pixel_count`` pixels from ``stream``.
+        """
+        return self.unpack(await stream.read(self.bytes_needed(pixel_count)), pixel_count)
+
+    def bytes_needed(self, pixel_count:int) -> int:
+        """
+        Returns:
+            int: Number of bytes to read to unpack the next ``pixel_count`` pixels
+        """
+        return -(-(self._skip + pixel_count) * self.width // 8) - len(self._partial)
+
+    def unpack(self, data, pixel_count:int) -> array.array:
+        """
+        Args:
+            data: Exactly :meth:`bytes_needed` bytes
+            pixel_count: Number of pixels to unpack
+
+        Returns:
+            :class:`array.array`: ``'H'`` for :attr:`OutputMode.FourteenBitPacked`, otherwise ``'B'``
+        """
+        buffer = self._partial + bytes(data)
+        total = self._skip + pixel_count
+        groups = -(-total // self._group_pixels)
+        padded = np.zeros(groups * self._group_bytes, dtype=np.uint8)
+        padded[:len(buffer)] = np.frombuffer(buffer, dtype=np.uint8)
+        pixels = self._unpack_groups(padded)[self._skip:total]
+
+        complete = total // self._group_pixels
+        self._partial = buffer[complete * self._group_bytes:]
+        self._skip = total % self._group_pixels
+        return array.array('H' if self.width == 14 else 'B', pixels.tobytes())
+
+    def _unpack_groups(self, data:np.ndarray) -> np.ndarray:
+        match self.width:
+            case 14:
+                ## 7 bytes hold 4 pixels; widen each group to a big-endian 64-bit word
+                words = np.zeros((len(data) // 7, 8), dtype=np.uint8)
+                words[:, 1:] = data.reshape(-1, 7)
+                words = words.view(">u8").ravel()
+                shifts = np.array([42, 28, 14, 0], dtype=np.uint64)
+                codes = (words[:, None] >> shifts) & 0x3fff
+                return (codes.ravel() << 2).astype(np.uint16)
+            case 4:
+                return np.stack([data & 0xf0, (data & 0x0f) << 4], axis=1).ravel()
+            case 1:
+                return np.unpackbits(data) << 7
+
+
+class DeltaDecoder:
+    """
+    Decodes the stream of :attr:`OutputMode.Compressed` back into exact 16-bit pixels.
+    See :class:`ImageSerializer` for the encoding.
+
+    Every code starts with a byte that is not of the form ``10xxxxxx``, so codes are found
+    and decoded for a whole chunk at once. Since the length of a chunk in bytes is not known in advance,
+    it is read in a few steps, each reading at least one byte for each pixel that has not been started.
+    """
+    output_mode = OutputMode.Compressed
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Restart from a previous pixel of 0, after a synchronization.
+        """
+        self._prev = 0
+
+    async def read(self, stream, pixel_count:int) -> array.array:
+        """
+        Read and decode the next ``pixel_count`` pixels from ``stream``.
+        """
+        data = bytearray()
+        needed = pixel_count
+        while needed > 0:
+            data.extend(await stream.read(needed))
+            codes, end = self._find_codes(data)
+            ## at least one byte is left for each pixel not started, plus the rest of the last code
+            needed = (pixel_count - len(codes)) + (end - len(data))
+        return self.decode(data, pixel_count)
+
+    @staticmethod
+    def _find_codes(data) -> tuple[np.ndarray, int]:
+        values = np.frombuffer(data, dtype=np.uint8)
+        starts = np.flatnonzero((values & 0xc0) != 0x80)
+        if len(starts) == 0:
+            return starts, 0
+        first = int(values[starts[-1]])
+        length = 1 if first < 0x80 else 2 if first < 0xe0 else 3
+        return starts, int(starts[-1]) + length
+
+    def decode(self, data, pixel_count:int) -> array.array:
+        """
+        Args:
+            data: Exactly the codes of ``pixel_count`` pixels
+
+        Returns:
+            :class:`array.array`: ``'H'``
+        """
+        values = np.frombuffer(bytes(data) + b"\0\0", dtype=np.uint8).astype(np.int64)
+        starts = np.flatnonzero((values[:-2] & 0xc0) != 0x80)
+        if len(starts) != pixel_count:
+            raise ValueError(f"expected {pixel_count} pixels, got {len(starts)}")
+        first, second, third = values[starts], values[starts + 1] & 0x3f, values[starts + 2] & 0x3f
+        if np.any(first >= 0xf0):
+            raise ValueError("invalid code in compressed pixel stream")
+        ## sign-extend the 7-bit and 11-bit differences; 16-bit differences wrap around anyway
+        short = first - ((first & 0x40) << 1)
+        medium = (((first & 0x1f) << 6) | second)
+        medium -= (medium & 0x400) << 1
+        long = ((first & 0x0f) << 12) | (second << 6) | third
+        deltas = np.where(first < 0x80, short, np.where(first < 0xe0, medium, long))
+
+        rotated = (self._prev + np.cumsum(deltas)) & 0xffff
+        if len(rotated):
+            self._prev = int(rotated[-1])
+        ## undo the rotation that moved the ADC code into the low bits
+        pixels = ((rotated << 2) | (rotated >> 14)) & 0xffff
+        return array.array('H', pixels.astype(np.uint16).tobytes())
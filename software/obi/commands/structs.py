@@ -24,6 +24,7 @@ class CmdType(enum.IntEnum, shape=CMD_SHAPE):
     BeamSelect          = 0x4
     Blank               = 0x5
     Delay               = 0x6
+    Extended            = 0x7
 
     Array = 0x8
 
@@ -128,10 +129,23 @@ class ByteLayout(PayloadLayout):
 
 ##### start commands
 
-class OutputMode(enum.IntEnum, shape = 2):
+class OutputMode(enum.IntEnum, shape = 3):
     SixteenBit          = 0
     EightBit            = 1
     NoOutput            = 2
+    FourteenBitPacked   = 3
+    FourBit             = 4
+    OneBit              = 5
+    Compressed          = 6
+    RawSum              = 7
+
+class ExtendedOp(enum.IntEnum, shape = CMD_SHAPE):
+    """
+    Operation of a command of type :attr:`CmdType.Extended`, which share a single command type
+    """
+    PatternLoad         = 0x0
+    PatternReplay       = 0x1
+    ReadCounters        = 0x2
 
 class BeamType(enum.IntEnum, shape = 2):
     NoBeam              = 0
@@ -163,10 +177,10 @@ class u16(int):
         if val < 0:
             raise ValueError(f"{val} < 0. Only positive integers are valid")
         if val > 65535:
-            raise ValueError(f"{val} > 16383. Value overflows 14 bits")
+            raise ValueError(f"{val} > 65535. Value overflows 16 bits")
     def __new__(self, val:int):
         self.__init__(self, val)
-        return val & 0b11111111111111
+        return val & 0xffff
 
 class fp8_8(int):
     """
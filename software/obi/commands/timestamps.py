@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+__all__ = ["FRAME_MARKER", "TIMESTAMP_MARKER", "TIMESTAMP_RECORD_WORDS", "TIMESTAMP_CLOCK", "TimestampRecord", "count_timestamps", "strip_timestamps"]
+
+#: First word of a timestamp record. Pixels always have the low 2 bits clear, so it is never a pixel.
+TIMESTAMP_MARKER = 0xfffd
+#: Sent before the first pixel of every frame of a :class:`RasterPixelFreeRunCommand`, in 16-bit output mode
+FRAME_MARKER = 0xfffe
+#: Words in a timestamp record: the marker, then the timestamp and the sequence number,
+#: each as 3 words of 14 bits, most significant first, shifted left by 2 like pixels
+TIMESTAMP_RECORD_WORDS = 7
+#: Frequency of the timestamp counter
+TIMESTAMP_CLOCK = 48e6
+
+
+@dataclass
+class TimestampRecord:
+    """
+    A timestamp record, sent by the device before a pixel when built with ``--timestamp-interval``.
+
+    Args:
+        sequence: Number of pixels sent since the last synchronization, before this record
+        device_cycles: Free-running counter of the device clock, when the record was sent
+        host_time: :func:`time.perf_counter` when the record was received
+    """
+    sequence: int
+    device_cycles: int
+    host_time: float
+
+    @property
+    def device_time(self) -> float:
+        """
+        :attr:`device_cycles` in seconds
+        """
+        return self.device_cycles / TIMESTAMP_CLOCK
+
+
+def _words(data) -> np.ndarray:
+    return np.frombuffer(data, dtype=">u2")
+
+
+def count_timestamps(data) -> int:
+    """
+    Args:
+        data: Big-endian 16-bit words, which may end in the middle of a record
+
+    Returns:
+        int: Number of timestamp records that start in ``data``
+    """
+    return int(np.count_nonzero(_words(data) == TIMESTAMP_MARKER))
+
+
+def strip_timestamps(data, host_time:float) -> tuple[np.ndarray, list[TimestampRecord]]:
+    """
+    Separate pixels from timestamp records.
+
+    Args:
+        data: Big-endian 16-bit words, holding only complete records
+        host_time: Time at which ``data`` was received
+
+    Returns:
+        tuple[np.ndarray, list[TimestampRecord]]: Pixels, as :class:`np.uint16`, and the records between them
+    """
+    words = _words(data)
+    starts = np.flatnonzero(words == TIMESTAMP_MARKER)
+    if len(starts) == 0:
+        return words.astype(np.uint16), []
+    record_mask = np.zeros(len(words), dtype=bool)
+    records = []
+    for start in starts:
+        fields = words[start + 1:start + TIMESTAMP_RECORD_WORDS].astype(np.int64) >> 2
+        device_cycles = int((fields[0] << 28) | (fields[1] << 14) | fields[2])
+        sequence = int((fields[3] << 28) | (fields[4] << 14) | fields[5])
+        records.append(TimestampRecord(sequence=sequence, device_cycles=device_cycles, host_time=host_time))
+        record_mask[start:start + TIMESTAMP_RECORD_WORDS] = True
+    return words[~record_mask].astype(np.uint16), records
@@ -16,8 +16,9 @@ def get_applet_args(path="microscope.toml"):
             electron_blank_enable=None, ion_blank_enable=None,
             electron_blank=None, ion_blank=None,
             xflip=None, yflip=None, rotate90=None, line_clock=None, frame_clock=None,
-            loopback=None, out_only=None, benchmark=None, ext_switch_delay=None,
-            endpoint=('tcp', 'localhost', 2224))
+            loopback=None, out_only=None, benchmark=None, ext_switch_delay=None, timestamp_interval=None,
+            adc_half_period=None, skip_y_write=None, flush_timeout_us=None,
+            endpoint=('tcp', 'localhost', 2224), compress=False)
 
     scope = ScopeSettings.from_toml_file(path)
     for beam_id, beam_settings in scope.beam_settings.items():
@@ -57,8 +58,12 @@ Here's a quick guide on how to convert to the new format:
 
     if scope.endpoint is not None:
         setattr(args, "endpoint", ('tcp', scope.endpoint.host, scope.endpoint.port))
+        setattr(args, "compress", scope.endpoint.compress)
     
     if scope.ext_switch_delay is not None:
         setattr(args, "ext_switch_delay_ms", scope.ext_switch_delay)
 
+    if scope.flush_timeout is not None:
+        setattr(args, "flush_timeout_us", scope.flush_timeout)
+
     return args
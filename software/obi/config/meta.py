@@ -2,8 +2,11 @@ from obi.commands import BeamType
 
 from dataclasses import dataclass
 from typing import Union
+import math
 import os
 
+import numpy as np
+
 @dataclass
 class MagCal:
     """
@@ -46,6 +49,41 @@ class MagCal:
             m_per_fov = mag_cal_dict
         )
     
+    def fov_at(self, magnification:float) -> float | None:
+        """
+        Field of view at a magnification, interpolated between calibration points on a log-log scale.
+        Outside the calibrated range, the field of view is taken to be inversely proportional to magnification.
+
+        Args:
+            magnification
+
+        Returns:
+            float | None: Field of view, in m, or None if there are no calibration points
+        """
+        if len(self.m_per_fov) == 0:
+            return None
+        mags = sorted(self.m_per_fov)
+        if magnification <= mags[0]:
+            return self.m_per_fov[mags[0]]*mags[0]/magnification
+        if magnification >= mags[-1]:
+            return self.m_per_fov[mags[-1]]*mags[-1]/magnification
+        log_fovs = [math.log(self.m_per_fov[mag]) for mag in mags]
+        return math.exp(np.interp(math.log(magnification), [math.log(mag) for mag in mags], log_fovs))
+
+    def pixel_size(self, magnification:float, resolution:int) -> float | None:
+        """
+        Args:
+            magnification
+            resolution: Number of pixels across the full field of view
+
+        Returns:
+            float | None: Width of one pixel, in m, or None if there are no calibration points
+        """
+        fov = self.fov_at(magnification)
+        if fov is None:
+            return None
+        return fov/resolution
+
     def to_csv(self):
         """
         Format data suitably for saving for a csv file.
@@ -173,18 +211,23 @@ class BeamSettings:
 class Endpoint:
     host: str
     port: int
+    compress: bool = False
 
     @classmethod
     def from_dict(cls, d: dict):
         host = "localhost"
         port = None
+        compress = False
         if "host" in d:
             host = str(d["host"])
         if "port" in d:
             port = int(d["port"])
+        if "compress" in d:
+            compress = bool(d["compress"])
         return cls(
             host=host,
             port=port,
+            compress=compress,
         )
 
     def to_dict(self):
@@ -193,6 +236,8 @@ class Endpoint:
             d.update({"host":self.host})
         if self.port is not None:
             d.update({"port":self.port})
+        if self.compress:
+            d.update({"compress":self.compress})
         return d
 
 
@@ -202,6 +247,7 @@ class ScopeSettings:
     beam_settings: dict({str: BeamSettings})
     transforms: Union[Transforms, None]
     ext_switch_delay: Union[float, None]
+    flush_timeout: Union[float, None] = None
 
     @classmethod
     def from_dict(cls, d:dict):
@@ -209,6 +255,7 @@ class ScopeSettings:
         endpoint = None
         transforms = None
         ext_switch_delay = None
+        flush_timeout = None
         if "beam" in d:
             for beam_name, beam_dict in d["beam"].items():
                 beams.update({beam_name: BeamSettings.from_dict(beam_dict)})
@@ -219,11 +266,14 @@ class ScopeSettings:
         if "timings" in d:
             if "ext_switch_delay_ms" in d["timings"]:
                 ext_switch_delay = d["timings"]["ext_switch_delay_ms"]
+            if "flush_timeout_us" in d["timings"]:
+                flush_timeout = d["timings"]["flush_timeout_us"]
         return cls(
             endpoint = endpoint,
             beam_settings = beams,
             transforms = transforms,
-            ext_switch_delay = ext_switch_delay
+            ext_switch_delay = ext_switch_delay,
+            flush_timeout = flush_timeout
         )
     
     @classmethod
@@ -275,8 +325,13 @@ class ScopeSettings:
             d.update({"server":self.endpoint.to_dict()})
         if self.transforms is not None:
             d.update({"transforms":self.transforms.to_dict()})
+        timings = {}
         if self.ext_switch_delay is not None:
-            d.update({"timings":{"ext_switch_delay_ms":self.ext_switch_delay}})
+            timings.update({"ext_switch_delay_ms":self.ext_switch_delay})
+        if self.flush_timeout is not None:
+            timings.update({"flush_timeout_us":self.flush_timeout})
+        if not timings == {}:
+            d.update({"timings":timings})
         b = {}
         for beam_name, beam_settings in self.beam_settings.items():
             b_s = beam_settings.to_dict()
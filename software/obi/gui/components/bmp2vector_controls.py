@@ -6,7 +6,7 @@ from qasync import asyncSlot, QApplication, QEventLoop
 
 import os
 
-from obi.macros import BitmapVectorPattern
+from obi.macros import BitmapVectorPattern, PatternFile, PatternCache, PatternWriteCommand, PathOrder
 from .scan_parameters import SettingBoxWithDefaults, QHLine
 from .dose_calc import DoseCalcWidget
 
@@ -16,18 +16,36 @@ class PatternWorker(QObject):
     process_requested = pyqtSignal(dict)
     process_completed = pyqtSignal(int)
 
+    def __init__(self):
+        super().__init__()
+        self.cache = PatternCache()
+        self.pattern = None
+
     @Slot(dict)
     def process(self, kwargs):
         path = kwargs["path"]
         resolution = kwargs["resolution"]
         max_dwell = kwargs["dwell_time"]
         invert = kwargs["invert"]
-
-        bmp2vector = BitmapVectorPattern(path)
-        progress_fn=lambda p:self.progress.emit(p)
-        bmp2vector.rescale(resolution, max_dwell, invert)
-        bmp2vector.vector_convert(progress_fn)
-        self.pattern_seq = bmp2vector.pattern_seq
+        order = PathOrder(kwargs.get("order", PathOrder.Raster))
+
+        if self.pattern is not None:
+            self.pattern.close()
+
+        content_hash = PatternFile.hash_source(path, resolution=resolution, max_dwell=max_dwell, invert=invert,
+                                              order=order.name)
+        pattern = self.cache.get(content_hash)
+        if pattern is None:
+            bmp2vector = BitmapVectorPattern(path)
+            progress_fn=lambda p:self.progress.emit(p)
+            bmp2vector.rescale(resolution, max_dwell, invert)
+            bmp2vector.vector_convert(progress_fn, order)
+            pattern = bmp2vector.to_pattern_file()
+            self.cache.put(pattern)
+        else:
+            print(f"using cached pattern: {pattern!r}")
+            self.progress.emit(100)
+        self.pattern = pattern
 
         self.process_completed.emit(1)
 
@@ -120,6 +138,7 @@ class CombinedPatternControls(QWidget):
         layout.addLayout(self.controls)
         self.setLayout(layout)
 
+        self.write_cmd = None
         self.worker = PatternWorker()
         self.process_requested.connect(self.worker.process)
         self.worker.progress.connect(self.update_progress)
@@ -153,12 +172,23 @@ class CombinedPatternControls(QWidget):
 
     @asyncSlot()
     async def write_pattern(self):
-        self.controls.write_btn.setText("Writing pattern...")
-        self.controls.write_btn.setEnabled(False)
-        await self.conn.transfer_bytes(self.worker.pattern_seq)
-        self.conn._synchronized = False
-        self.controls.write_btn.setText("Write Pattern")
-        self.controls.write_btn.setEnabled(True)
+        if self.write_cmd is not None:
+            self.write_cmd.abort.set()
+            self.controls.write_btn.setText("Aborting...")
+            self.controls.write_btn.setEnabled(False)
+            return
+        self.write_cmd = PatternWriteCommand(self.worker.pattern, cookie=self.conn.get_cookie())
+        self.controls.write_btn.setText("Abort Pattern")
+        self.controls.convert_btn.setEnabled(False)
+        try:
+            async for _ in self.conn.transfer_multiple(self.write_cmd):
+                self.update_progress(int(100*self.write_cmd.progress))
+        finally:
+            self.write_cmd = None
+            self.controls.progress_bar.setValue(0)
+            self.controls.write_btn.setText("Write Pattern")
+            self.controls.write_btn.setEnabled(True)
+            self.controls.convert_btn.setEnabled(True)
     
 
 if __name__ == "__main__":
@@ -225,6 +225,10 @@ class ImageDisplay(pg.GraphicsLayoutWidget):
         self.setRange(y_height, x_width)
         self.data = image
         
+    def setLevels(self, black:int, white:int):
+        ## levels are 16-bit pixel values, the displayed image is 8-bit
+        self.hist.setLevels(min=black/256, max=white/256)
+
     def setRange(self, y_height, x_width):
         if (x_width != self.x_width) | (y_height != self.y_height):
             if not self.roi == None:
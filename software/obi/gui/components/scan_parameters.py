@@ -94,6 +94,14 @@ class LiveScanControls(ScanParameters):
         self.roi_btn = QPushButton("ROI Scan")
         self.roi_btn.setCheckable(True)
         self.addWidget(self.roi_btn)
+
+        self.auto_contrast_btn = QPushButton("Auto Contrast")
+        self.auto_contrast_btn.setCheckable(True)
+        self.addWidget(self.auto_contrast_btn)
+
+        self.record_btn = QPushButton("Record Live Scan")
+        self.record_btn.setCheckable(True)
+        self.addWidget(self.record_btn)
     def setEnabled(self, enabled=True):
         self.start_btn.setEnabled(enabled)
         self.roi_btn.setEnabled(enabled)
@@ -112,7 +120,16 @@ class PhotoScanControls(ScanParameters):
         self.acq_btn = ToggleButton("Acquire Photo", "Abort Photo Scan")
         self.file = BrowseDirectory()
 
+        ## magnification set on the microscope, to find the pixel size from the calibration
+        self.magnification = QSpinBox()
+        self.magnification.setRange(0, 10000000)
+        self.magnification.setSpecialValueText("Unknown")
+        magnification = QHBoxLayout()
+        magnification.addWidget(QLabel("Magnification"))
+        magnification.addWidget(self.magnification)
+
         self.addWidget(self.acq_btn)
+        self.addLayout(magnification)
         self.addLayout(self.file)
     def setEnabled(self, enabled=True):
         self.acq_btn.setEnabled(enabled)
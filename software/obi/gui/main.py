@@ -1,5 +1,6 @@
 import sys
 import asyncio
+import datetime
 import logging
 logger = logging.getLogger()
 
@@ -20,7 +21,7 @@ from qasync import asyncSlot, asyncClose, QApplication, QEventLoop
 from obi.gui.components import ImageDisplay, CombinedScanControls, CombinedPatternControls, BeamControl, MagCalWidget
 
 from obi.transfer import TCPConnection, setup_logging, TransferError
-from obi.macros import FrameBuffer, BitmapVectorPattern
+from obi.macros import FrameBuffer, BitmapVectorPattern, FrameRecorder, ImageWriter, ImageMetadata
 from obi.config.meta import ScopeSettings
 
 from obi.commands import *
@@ -82,9 +83,10 @@ class Window(QMainWindow):
             if host == None:
                 host = "localhost"
             port = ep.port
-            self.conn = TCPConnection(host, port)
+            self.conn = TCPConnection(host, port, compression=ep.compress)
 
         self.fb = FrameBuffer(self.conn)
+        self.image_writer = ImageWriter()
 
         self.image_display = ImageDisplay(511, 511)
         self.setCentralWidget(self.image_display)
@@ -105,6 +107,7 @@ class Window(QMainWindow):
 
         self.scan_control.inner.live.start_btn.clicked.connect(self.toggle_live_scan)
         self.scan_control.inner.live.roi_btn.clicked.connect(self.toggle_roi_scan)
+        self.scan_control.inner.live.record_btn.clicked.connect(self.toggle_recording)
         self.scan_control.inner.photo.acq_btn.clicked.connect(self.acquire_photo)
         self.unique_controllers = [self.scan_control.inner.live, self.scan_control.inner.photo, self.pattern_control, self.beam_control]
 
@@ -160,30 +163,37 @@ class Window(QMainWindow):
         for item in self.unique_controllers:
             item.setEnabled(True)
 
-    async def capture_ROI(self, resolution, dwell_time):
+    def update_levels(self):
+        if self.scan_control.inner.live.auto_contrast_btn.isChecked() and self.fb.stats.count > 0:
+            self.image_display.setLevels(*self.fb.stats.auto_levels())
+
+    async def capture_ROI(self, resolution, dwell_time, output_mode=OutputMode.EightBit):
         x_start, x_count, y_start, y_count = self.image_display.get_ROI()
         print(f"{resolution=}, {x_start=}, {x_count=}, {y_start=}, {y_count=}")
         async for frame in self.fb.capture_frame_roi(
             x_res=resolution, y_res=resolution,
             x_start = x_start, x_count = x_count, y_start = y_start, y_count = y_count,
-            dwell_time=dwell_time, latency=65536
+            dwell_time=dwell_time, output_mode=output_mode, latency=65536
         ):
             self.image_display.setImage(frame.as_uint8())
+            self.update_levels()
             self._logger.debug("set image ROI")
 
 
-    async def capture_frame(self, resolution, dwell_time):
+    async def capture_frame(self, resolution, dwell_time, output_mode=OutputMode.EightBit):
+        ## live view is only displayed at 8 bits per pixel, so it is scanned at 8 bits to halve the data transferred
         if self.image_display.roi is not None:
             if (self.fb.current_frame is not None) & (resolution != max(self.fb.current_frame._x_count, self.fb.current_frame._y_count)):
                 self.image_display.remove_ROI()
                 self.scan_control.inner.live.roi_btn.setChecked(False)
             else:
-                await self.capture_ROI(resolution, dwell_time)
+                await self.capture_ROI(resolution, dwell_time, output_mode)
         else:
             async for frame in self.fb.capture_full_frame(
-                x_res=resolution, y_res=resolution, dwell_time=dwell_time, latency=65536
+                x_res=resolution, y_res=resolution, dwell_time=dwell_time, output_mode=output_mode, latency=65536
                 ):
                 self.image_display.setImage(frame.as_uint8())
+                self.update_levels()
                 self._logger.debug("set image")
     
     @asyncSlot()
@@ -194,7 +204,7 @@ class Window(QMainWindow):
         await self.conn.transfer(ExternalCtrlCommand(enable=True))
 
         try:  
-            await self.capture_frame(resolution, dwell_time)
+            await self.capture_frame(resolution, dwell_time, OutputMode.SixteenBit)
         except TransferError:
             self.init_ui()
             return
@@ -207,9 +217,22 @@ class Window(QMainWindow):
 
         # if not self.fb.is_aborted:
         print("time to save the image!")
-        path = self.scan_control.inner.photo.file.path()
-        self.fb.current_frame.saveImage_tifffile(path)
+        path = self.scan_control.inner.photo.file.path() + " saved " + datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        metadata = self.photo_metadata(resolution, dwell_time)
+        ## the frame is copied before saving starts, so other scans can run while it is written
+        save = self.image_writer.save(self.fb.current_frame, path, metadata, bit_depth_8=True)
         self.enable_all_controls()
+        print(f"saved: {await save}")
+
+    def photo_metadata(self, resolution, dwell_time) -> ImageMetadata:
+        beam = self.beam_control.inner.get_current_beam()
+        magnification = self.scan_control.inner.photo.magnification.value() or None
+        pixel_size = None
+        if beam is not None and magnification is not None:
+            mag_cal = self.scope_settings.beam_settings[beam].mag_cal
+            if mag_cal is not None:
+                pixel_size = mag_cal.pixel_size(magnification, resolution)
+        return ImageMetadata(dwell_time=dwell_time, beam=beam, magnification=magnification, pixel_size=pixel_size)
 
 
 
@@ -236,6 +259,27 @@ class Window(QMainWindow):
         self.enable_all_controls()
         print("done")
 
+    @asyncSlot()
+    async def toggle_recording(self):
+        if self.scan_control.inner.live.record_btn.isChecked():
+            path = self.scan_control.inner.photo.file.path() + " live " + datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S') + ".tif"
+            self.fb.recorder = FrameRecorder(path)
+            print(f"recording to: {path}")
+        elif self.fb.recorder is not None:
+            recorder, self.fb.recorder = self.fb.recorder, None
+            ## wait for queued frames to be written without blocking the event loop
+            await asyncio.get_running_loop().run_in_executor(None, recorder.close)
+            print(f"recorded: {recorder}")
+
+    def shutdown(self):
+        """
+        Finish writing the frames being recorded and the photos being saved, before exiting.
+        """
+        if getattr(self, "fb", None) is not None and self.fb.recorder is not None:
+            self.fb.recorder.close()
+        if getattr(self, "image_writer", None) is not None:
+            self.image_writer.close()
+
     def toggle_roi_scan(self):
         if self.scan_control.inner.live.roi_btn.isChecked():
             self.image_display.add_ROI()
@@ -259,6 +303,7 @@ def run_gui():
 
     with event_loop:
         event_loop.run_until_complete(app_close_event.wait())
+    window.shutdown()
 
 
 if __name__ == "__main__":
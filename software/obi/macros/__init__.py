@@ -1,10 +1,40 @@
 __all__ = []
 
-from .raster import RasterScanCommand
-__all__ += ["RasterScanCommand"]
+from .raster import RasterScanCommand, MultiRegionScanCommand, ScanRegion, FreeRunScanCommand
+__all__ += ["RasterScanCommand", "MultiRegionScanCommand", "ScanRegion", "FreeRunScanCommand"]
 
-from .frame_buffer import Frame, FrameBuffer
-__all__ += ["Frame", "FrameBuffer"]
+from .frame_buffer import Frame, FrameBuffer, pixel_types
+__all__ += ["Frame", "FrameBuffer", "pixel_types"]
+
+from .stats import FrameStatistics
+__all__ += ["FrameStatistics"]
+
+from .recorder import FrameRecorder
+__all__ += ["FrameRecorder"]
+
+from .image_writer import ImageWriter, ImageMetadata
+__all__ += ["ImageWriter", "ImageMetadata"]
 
 from .bmp2vector import BitmapVectorPattern
-__all__ += ["BitmapVectorPattern"]
\ No newline at end of file
+__all__ += ["BitmapVectorPattern"]
+
+from .pattern_file import PatternFile, PatternCache
+__all__ += ["PatternFile", "PatternCache"]
+
+from .path_order import PathOrder, PathReport, order_points, path_stats
+__all__ += ["PathOrder", "PathReport", "order_points", "path_stats"]
+
+from .pattern import PatternWriteCommand
+__all__ += ["PatternWriteCommand"]
+
+from .dose import DosePattern, compile_dose_map
+__all__ += ["DosePattern", "compile_dose_map"]
+
+from .drift import DriftTracker, measure_shift
+__all__ += ["DriftTracker", "measure_shift"]
+
+from .scheduler import AcquisitionScheduler, ScanJob, PatternJob, JobState
+__all__ += ["AcquisitionScheduler", "ScanJob", "PatternJob", "JobState"]
+
+from .pattern_memory import PatternReplayMacro
+__all__ += ["PatternReplayMacro"]
@@ -1,41 +1,45 @@
-from multiprocessing import Pool, Value
 import numpy as np
 from PIL import Image
 
 from obi.commands import *
-
-
-def pool_initializer(S):
-    global scale_factor
-    scale_factor = S
-
-def line(xarray):
-    if xarray:
-        y, xarray = xarray
-        c = bytearray()
-        for x in np.nonzero(xarray)[0]:
-            c.extend(bytes(VectorPixelCommand(x_coord=int(x*scale_factor), y_coord = int(y*scale_factor), dwell_time=xarray[x])))
-        return c
+from .pattern_file import PatternFile
+from .vector import encode_vector_pixels
+from .path_order import PathOrder, PathReport, order_points, path_stats
 
 
 class BitmapVectorPattern:
     """
     Converts an image to an array of vector points (as :class:`VectorPixelCommand`).\
-    For high resolution images, this process can be quite resource intensive.\
-    This class uses :py:mod:`multiprocessing.Pool` to speed up conversion by executing multiple threads.
+    8-bit and 16-bit grayscale images are supported. Level scaling, resampling and encoding
+    are done on whole blocks of lines at once with NumPy, so even 16k patterns convert in seconds.
     
     Attributes:
         im (PIL.Image): See https://pillow.readthedocs.io/en/stable/reference/Image.html
-        processed_im (PIL.Image | None): Populated by :func:`rescale`
+        pattern_array (np.ndarray | None): Dwell time of each pixel (uint16), populated by :func:`rescale`
+        processed_im (PIL.Image | None): pattern_array as an image, populated by :func:`rescale`
         pattern_seq (bytearray | None): Populated by :func:`vector_convert`
+        chunk_offsets (list[int] | None): Offset into pattern_seq of the start of each chunk, populated by :func:`vector_convert`. \
+            The first chunk contains the setup commands, followed by one chunk for each line of the pattern, \
+            and a final chunk that blanks the beam.
+        chunk_dwells (list[int] | None): Total dwell time of each chunk, populated by :func:`vector_convert`
+        chunk_pixels (list[int] | None): Number of pixels in each chunk, populated by :func:`vector_convert`
+        path_report (:class:`PathReport` | None): Travel and settle time of the chosen point order, \
+            compared to raster order, populated by :func:`vector_convert`
     
     Args:
         path: Path to a PIL-compatible image file
     """
     def __init__(self, path):
+        self.path = path
         self.im = Image.open(path)
+        self.pattern_array = None
         self.processed_im = None
+        self.params = None
         self.pattern_seq = None
+        self.chunk_offsets = None
+        self.chunk_dwells = None
+        self.chunk_pixels = None
+        self.path_report = None
     
     def rescale(self, resolution:u16, max_dwell:DwellTime, invert:bool):
         """
@@ -43,7 +47,7 @@ class BitmapVectorPattern:
         Rescale dwell times such that the brightest pixel has dwell time max_dwell.
 
         Important:
-            By default, white pixels (brightness 255) correspond to the maximum dwell time,\
+            By default, white pixels (brightness 255, or 65535 for 16-bit images) correspond to the maximum dwell time,\
             and black pixels (brightness 0) correspond to no dwell time and will be skipped.
 
         Args:
@@ -51,57 +55,188 @@ class BitmapVectorPattern:
             max_dwell: Maximum dwell value
             invert: Invert grayscale levels
         """
-        im = self.im
-        im = im.convert("L") #TODO: handle 16 bit grayscale
-        ## scale dwell times 
-        def level_adjust(pixel_value):
-            return int((pixel_value/255)*max_dwell)
-        pixel_range = im.getextrema()
-        im = im.point(lambda p: level_adjust(p))
-        print(f"{pixel_range=} -> scaled_pixel_range= (0,{max_dwell})")
+        pixels, full_scale = self._grayscale(self.im)
         
         ## scale to resolution
-        x_pixels, y_pixels = im._size
+        y_pixels, x_pixels = pixels.shape
         scale_factor = resolution/max(x_pixels, y_pixels)
         scaled_y_pixels = int(y_pixels*scale_factor)
         scaled_x_pixels = int(x_pixels*scale_factor)
-
-        # https://pillow.readthedocs.io/en/stable/_modules/PIL/Image.html#Image.resize
-        im = im.resize((scaled_x_pixels, scaled_y_pixels), resample = Image.Resampling.NEAREST)
+        # nearest neighbour, sampling at the center of each output pixel like Image.Resampling.NEAREST
+        rows = ((np.arange(scaled_y_pixels) + 0.5)*(y_pixels/scaled_y_pixels)).astype(np.intp)
+        cols = ((np.arange(scaled_x_pixels) + 0.5)*(x_pixels/scaled_x_pixels)).astype(np.intp)
+        pixels = pixels[rows[:, None], cols]
         print(f"input image: {x_pixels=}, {y_pixels=} -> {scaled_x_pixels=}, {scaled_y_pixels=}")
 
-        self.processed_im = im
+        ## scale dwell times 
+        pixel_range = (int(pixels.min()), int(pixels.max())) if pixels.size else (0, 0)
+        if invert:
+            pixels = full_scale - pixels
+        pattern_array = np.floor((pixels/full_scale)*max_dwell).astype(np.uint16)
+        print(f"{pixel_range=} -> scaled_pixel_range= (0,{max_dwell})")
+
+        self.pattern_array = pattern_array
+        self.processed_im = Image.fromarray(pattern_array)
+        self.params = {"resolution": resolution, "max_dwell": max_dwell, "invert": invert}
 
-    def vector_convert(self, progress_fn=lambda p: print(p)): #progress fn input: int from 0 to 100
+    @staticmethod
+    def _grayscale(im):
         """
+        Returns:
+            tuple[np.ndarray, int]: Grayscale pixel values, and the value corresponding to white
+        """
+        if im.mode in ("I;16", "I;16L", "I;16B", "I;16N"):
+            return np.asarray(im).astype(np.uint16), 0xffff
+        if im.mode == "I":
+            return np.clip(np.asarray(im), 0, 0xffff).astype(np.uint16), 0xffff
+        return np.asarray(im.convert("L")), 0xff
+
+    @property
+    def content_hash(self) -> bytes:
+        """
+        Hash of the source image and the parameters passed to :func:`rescale` and :func:`vector_convert`,
+        used to look up previously converted patterns in a :class:`PatternCache`.
+        """
+        return PatternFile.hash_source(self.path, **self.params)
+
+    @property
+    def _pattern_scale_factor(self):
+        y_pixels, x_pixels = self.pattern_array.shape
+        return 16384/max(x_pixels,y_pixels)
+
+    def _points(self, rows, cols):
+        x_coords = (cols*self._pattern_scale_factor).astype(np.uint16)
+        y_coords = (rows*self._pattern_scale_factor).astype(np.uint16)
+        return x_coords, y_coords
+
+    def iter_chunks(self, order:PathOrder=PathOrder.Raster, *, lines_per_block:int=256, points_per_chunk:int=16384):
+        """
+        Encode the pattern.
+
+        With :attr:`PathOrder.Raster` and :attr:`PathOrder.Serpentine` order, the pattern is encoded
+        a block of lines at a time, with one chunk for each line. Other orders visit points
+        across the whole pattern, which is encoded at once and split into chunks of a fixed number of points.
+
         Args:
-            progress_fn (function, optional): Function that accepts a value from 0 to 100 \
-                and emits a progress indicator. Defaults to :code:`lambda p:print(p)`.
+            order: Order in which to visit the points of the pattern
+            lines_per_block: Number of lines to encode in each NumPy operation
+            points_per_chunk: Number of points in each chunk, if the pattern is not encoded line by line
+
+        Yields:
+            tuple[bytes, int, int, float]: The commands for one chunk, the total dwell time of the chunk, \
+                the number of pixels in the chunk, and the fraction of the pattern encoded so far. \
+                The first chunk contains the setup commands, followed by the chunks of the pattern, \
+                and a final chunk that blanks the beam.
         """
-        pattern_array = np.asarray(self.processed_im)
-        seq = bytearray()
+        pattern_array = self.pattern_array
+        order = PathOrder(order)
 
         ## Prepare to unblank with beam at the first vector pixel
-        seq.extend(bytes(SynchronizeCommand(raster=False, output=OutputMode.NoOutput, cookie=123)))
-        seq.extend(bytes(FlushCommand()))
-        seq.extend(bytes(BeamSelectCommand(beam_type = BeamType.Ion)))
-        seq.extend(bytes(BlankCommand(enable=False, inline=True)))
+        ## synchronization is done by PatternWriteCommand when the pattern is sent
+        setup = bytearray()
+        setup.extend(bytes(BeamSelectCommand(beam_type = BeamType.Ion)))
+        setup.extend(bytes(BlankCommand(enable=False, inline=True)))
+        yield bytes(setup), 0, 0, 0.
 
         y_pixels, x_pixels = pattern_array.shape
-        pattern_scale_factor = 16384/max(x_pixels,y_pixels)
-        pool = Pool(initializer=pool_initializer, initargs=[pattern_scale_factor])
-        n = 0
-        for i in pool.imap(line, enumerate(pattern_array)):
-            seq.extend(i)
-            n += 1
-            progress = int(100*n/y_pixels)
-            progress_fn(progress)
-        pool.close()
-
-        seq.extend(bytes(BlankCommand(enable=True)))
+        if order in (PathOrder.Raster, PathOrder.Serpentine):
+            ## alternate direction on each line that has any points
+            line_parity = np.cumsum(pattern_array.any(axis=1)) % 2 == 0
+            for block_start in range(0, y_pixels, lines_per_block):
+                block = pattern_array[block_start:block_start+lines_per_block]
+                rows, cols = np.nonzero(block)
+                if order == PathOrder.Serpentine:
+                    reverse = line_parity[rows + block_start]
+                    indices = np.lexsort((np.where(reverse, -cols, cols), rows))
+                    rows, cols = rows[indices], cols[indices]
+                dwells = block[rows, cols]
+                x_coords, y_coords = self._points(rows + block_start, cols)
+                encoded = encode_vector_pixels(x_coords, y_coords, dwells).tobytes()
+                ## split the block into lines
+                line_lengths = np.bincount(rows, weights=np.where(dwells <= 1, 5, 7), minlength=len(block))
+                line_ends = np.cumsum(line_lengths).astype(np.intp)
+                line_dwells = block.sum(axis=1, dtype=np.uint64)
+                line_pixels = np.count_nonzero(block, axis=1)
+                line_start = 0
+                for n, line_end in enumerate(line_ends):
+                    yield (encoded[line_start:line_end], int(line_dwells[n]), int(line_pixels[n]),
+                        (block_start + n + 1)/y_pixels)
+                    line_start = line_end
+        else:
+            rows, cols = np.nonzero(pattern_array)
+            ## order in pixel coordinates, where neighboring pixels are on a regular grid
+            indices = order_points(cols, rows, order)
+            rows, cols = rows[indices], cols[indices]
+            dwells = pattern_array[rows, cols]
+            x_coords, y_coords = self._points(rows, cols)
+            for chunk_start in range(0, len(dwells), points_per_chunk):
+                chunk = slice(chunk_start, chunk_start + points_per_chunk)
+                encoded = encode_vector_pixels(x_coords[chunk], y_coords[chunk], dwells[chunk]).tobytes()
+                chunk_end = min(chunk_start + points_per_chunk, len(dwells))
+                yield (encoded, int(dwells[chunk].sum(dtype=np.uint64)), chunk_end - chunk_start,
+                    chunk_end/len(dwells))
+
+        yield bytes(BlankCommand(enable=True)), 0, 0, 1.
+
+    def compare_order(self, order:PathOrder, **kwargs) -> PathReport:
+        """
+        Estimate the travel and settle time of visiting the points of the pattern in a given order,
+        compared to raster order.
+
+        Args:
+            order: Order in which to visit the points of the pattern
+            kwargs: Passed to :func:`path_stats`
+
+        Returns:
+            :class:`PathReport`
+        """
+        rows, cols = np.nonzero(self.pattern_array)
+        x_coords, y_coords = self._points(rows, cols)
+        before = path_stats(x_coords, y_coords, **kwargs)
+        indices = order_points(cols, rows, order)
+        after = path_stats(x_coords[indices], y_coords[indices], **kwargs)
+        return PathReport(PathOrder(order), before, after)
+
+    def vector_convert(self, progress_fn=lambda p: print(p), order:PathOrder=PathOrder.Raster): #progress fn input: int from 0 to 100
+        """
+        Args:
+            progress_fn (function, optional): Function that accepts a value from 0 to 100 \
+                and emits a progress indicator. Defaults to :code:`lambda p:print(p)`.
+            order (:class:`PathOrder`, optional): Order in which to visit the points of the pattern. \
+                Defaults to :attr:`PathOrder.Raster`.
+        """
+        seq = bytearray()
+        chunk_offsets = []
+        chunk_dwells = []
+        chunk_pixels = []
+        progress = 0
+        for chunk, dwell, pixels, done in self.iter_chunks(order):
+            chunk_offsets.append(len(seq))
+            chunk_dwells.append(dwell)
+            chunk_pixels.append(pixels)
+            seq.extend(chunk)
+            if int(100*done) > progress:
+                progress = int(100*done)
+                progress_fn(progress)
         self.pattern_seq = seq
+        ## the same points in another order are another pattern
+        self.params["order"] = PathOrder(order).name
+        self.chunk_offsets = chunk_offsets
+        self.chunk_dwells = chunk_dwells
+        self.chunk_pixels = chunk_pixels
+        if PathOrder(order) != PathOrder.Raster:
+            self.path_report = self.compare_order(order)
+            print(self.path_report)
         print("done~")
 
+    def to_pattern_file(self) -> PatternFile:
+        """
+        Returns:
+            :class:`PatternFile`: The converted pattern, which can be saved and replayed without conversion.
+        """
+        return PatternFile(self.pattern_seq, self.chunk_offsets, self.chunk_dwells, self.chunk_pixels,
+            content_hash=self.content_hash)
+
 
 if __name__ == "__main__":
     bmp = BitmapVectorPattern("/Users/isabelburgos/Open-Beam-Interface/software/nanographs_logo.bmp")
@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from .vector import VECTOR_POINT, encode_vector_pixels
+
+__all__ = ["DosePattern", "compile_dose_map", "dwell_for_dose", "dose_for_dwell"]
+
+#: Duration of one :class:`DwellTime` cycle, in seconds
+CYCLE_TIME = 125e-9
+#: Number of cycles of the longest dwell time that can be encoded in one :class:`VectorPixelCommand`
+MAX_CYCLES = 65536
+
+def dwell_for_dose(dose, beam_current:float, pixel_size:float):
+    """
+    Dwell time needed to deliver a dose, using the same relation as the dose calculator in the GUI:
+    exposure = beam current x dwell time / pixel area.
+
+    Args:
+        dose: Dose, in C/cm²
+        beam_current: Beam current, in A
+        pixel_size: Width of one pixel, in m
+
+    Returns:
+        Dwell time, in (fractional) cycles of 125 ns
+    """
+    dose_per_m2 = np.asarray(dose, dtype=np.float64)*1e4 # 1 C/cm² = 10⁴ C/m²
+    return dose_per_m2*pixel_size*pixel_size/beam_current/CYCLE_TIME
+
+def dose_for_dwell(cycles, beam_current:float, pixel_size:float):
+    """
+    Inverse of :func:`dwell_for_dose`.
+
+    Args:
+        cycles: Dwell time, in cycles of 125 ns
+        beam_current: Beam current, in A
+        pixel_size: Width of one pixel, in m
+
+    Returns:
+        Dose, in C/cm²
+    """
+    exposure = beam_current*np.asarray(cycles, dtype=np.float64)*CYCLE_TIME/(pixel_size*pixel_size)
+    return exposure/1e4
+
+
+@dataclass
+class DosePattern:
+    """
+    Vector points that deliver a dose map, in one or more passes.
+
+    Args:
+        points: Array of :data:`VECTOR_POINT`, the points of every pass in the order they are visited. \
+            ``dwell_time`` is the value sent in :class:`VectorPixelCommand`, one less than the number of cycles.
+        pass_offsets: Index into points of the first point of each pass
+        cycles: Number of cycles delivered to each pixel of the dose map
+        target_cycles: Fractional number of cycles needed for each pixel to receive the exact target dose
+    """
+    points: np.ndarray
+    pass_offsets: np.ndarray
+    cycles: np.ndarray
+    target_cycles: np.ndarray
+
+    def __repr__(self):
+        return (f"DosePattern: {len(self.points)} points in {self.passes} passes, "
+                f"beam time={self.beam_time:.3f} s, max dose error={self.max_dose_error:.2%}")
+
+    @property
+    def passes(self) -> int:
+        return len(self.pass_offsets)
+
+    @property
+    def beam_time(self) -> float:
+        """
+        Total dwell time of all points, in seconds
+        """
+        return int(self.cycles.sum())*CYCLE_TIME
+
+    @property
+    def max_dose_error(self) -> float:
+        """
+        Largest relative difference between the delivered dose and the target dose,
+        among the pixels that receive any dose
+        """
+        exposed = self.cycles > 0
+        if not exposed.any():
+            return 0.
+        target = self.target_cycles[exposed]
+        return float(np.max(np.abs(self.cycles[exposed] - target)/target))
+
+    def iter_passes(self):
+        """
+        Yields:
+            np.ndarray: Array of :data:`VECTOR_POINT` for each pass
+        """
+        ends = [*self.pass_offsets[1:], len(self.points)]
+        for start, end in zip(self.pass_offsets, ends):
+            yield self.points[start:end]
+
+    def encode(self) -> bytes:
+        """
+        Returns:
+            bytes: The points of every pass, encoded as :class:`VectorPixelCommand`
+        """
+        return encode_vector_pixels(self.points["x_coord"], self.points["y_coord"], self.points["dwell_time"]).tobytes()
+
+
+def compile_dose_map(dose_map, beam_current:float, pixel_size:float, *, min_dwell:int=1) -> DosePattern:
+    """
+    Compile a dose map into vector points.
+
+    The dose of each pixel is converted to a whole number of cycles. Doses needing fewer than
+    ``min_dwell`` cycles are rounded either to ``min_dwell`` cycles or to no exposure, whichever is closer.
+    Pixels needing more than 65536 cycles are split across as many passes as needed,
+    with their dose divided evenly between passes; every other pixel is only visited in the first pass.
+    Pixels are visited in raster order in each pass, and the dose map is scaled to the full DAC range
+    in the same way as :class:`BitmapVectorPattern`.
+
+    Args:
+        dose_map: 2D array of doses, in C/cm²
+        beam_current: Beam current, in A
+        pixel_size: Width of one pixel of the dose map, in m
+        min_dwell: Shortest dwell time to expose a pixel for, in cycles of 125 ns
+
+    Returns:
+        :class:`DosePattern`
+
+    Example:
+        >>> pattern = compile_dose_map(dose_map, beam_current=1e-9, pixel_size=10e-9)
+        >>> points = pattern.points
+    """
+    dose_map = np.asarray(dose_map, dtype=np.float64)
+    if dose_map.ndim != 2:
+        raise ValueError(f"dose map must be 2D, not {dose_map.ndim}D")
+    if (dose_map < 0).any():
+        raise ValueError("dose map contains negative doses")
+    if min_dwell < 1:
+        raise ValueError(f"{min_dwell=} < 1")
+
+    target_cycles = dwell_for_dose(dose_map, beam_current, pixel_size)
+    cycles = np.rint(target_cycles).astype(np.int64)
+    short = cycles < min_dwell
+    cycles[short] = np.where(target_cycles[short] >= min_dwell/2, min_dwell, 0)
+
+    rows, cols = np.nonzero(cycles)
+    point_cycles = cycles[rows, cols]
+    point_passes = -(-point_cycles//MAX_CYCLES)
+    y_pixels, x_pixels = dose_map.shape
+    scale_factor = 16384/max(x_pixels, y_pixels)
+    x_coords = (cols*scale_factor).astype(np.uint16)
+    y_coords = (rows*scale_factor).astype(np.uint16)
+
+    passes = []
+    passes_total = int(point_passes.max()) if len(point_passes) else 1
+    for n in range(passes_total):
+        in_pass = point_passes > n
+        base, remainder = np.divmod(point_cycles[in_pass], point_passes[in_pass])
+        pass_cycles = base + (n < remainder)
+        ## a dwell time of 1 is encoded as a minimum dwell, so deliver 2 cycles as two 1-cycle points instead
+        repeat = np.where(pass_cycles == 2, 2, 1)
+        points = np.empty(int(repeat.sum()), dtype=VECTOR_POINT)
+        points["x_coord"] = np.repeat(x_coords[in_pass], repeat)
+        points["y_coord"] = np.repeat(y_coords[in_pass], repeat)
+        points["dwell_time"] = np.repeat(np.where(repeat == 2, 1, pass_cycles) - 1, repeat)
+        passes.append(points)
+
+    pass_offsets = np.cumsum([0] + [len(points) for points in passes[:-1]])
+    return DosePattern(
+        points = np.concatenate(passes),
+        pass_offsets = pass_offsets,
+        cycles = cycles,
+        target_cycles = target_cycles
+    )
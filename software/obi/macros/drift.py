@@ -0,0 +1,174 @@
+import asyncio
+
+import numpy as np
+
+from obi.commands import *
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["measure_shift", "DriftTracker"]
+
+def _gaussian_peak(below, peak, above):
+    # vertex of the parabola through the logarithm of three equally spaced points, relative to the middle point
+    below, peak, above = np.log(np.maximum([below, peak, above], np.finfo(np.float32).tiny))
+    denominator = below - 2*peak + above
+    if denominator >= 0:
+        return 0.
+    return 0.5*(below - above)/denominator
+
+def measure_shift(reference:np.ndarray, image:np.ndarray) -> tuple[float, float]:
+    """
+    Measure the translation between two images by phase correlation, with subpixel precision.
+
+    Args:
+        reference: 2D array
+        image: 2D array of the same shape as reference
+
+    Returns:
+        tuple[float, float]: Shift (y, x) in pixels, such that the content of reference appears \
+            at this offset in image
+    """
+    if reference.shape != image.shape:
+        raise ValueError(f"reference shape {reference.shape} != image shape {image.shape}")
+    window = np.outer(np.hanning(reference.shape[0]), np.hanning(reference.shape[1]))
+    def spectrum(a):
+        a = np.asarray(a, dtype=np.float32)
+        return np.fft.rfft2((a - a.mean())*window)
+    cross_power = spectrum(image)*np.conj(spectrum(reference))
+    cross_power /= np.abs(cross_power) + np.finfo(np.float32).eps
+    ## a low-pass filter makes the correlation peak gaussian, so its center can be found from three points
+    fy = np.fft.fftfreq(reference.shape[0])[:, None]
+    fx = np.fft.rfftfreq(reference.shape[1])[None, :]
+    cross_power *= np.exp(-(fy*fy + fx*fx)/(2*0.15*0.15))
+    correlation = np.fft.irfft2(cross_power, s=reference.shape)
+
+    peak = np.unravel_index(np.argmax(correlation), correlation.shape)
+    shift = []
+    for axis, (index, size) in enumerate(zip(peak, correlation.shape)):
+        before = list(peak)
+        after = list(peak)
+        before[axis] = (index - 1) % size
+        after[axis] = (index + 1) % size
+        subpixel = _gaussian_peak(correlation[tuple(before)], correlation[peak], correlation[tuple(after)])
+        ## shifts of more than half the image wrap around to negative shifts
+        if index > size//2:
+            index -= size
+        shift.append(index + subpixel)
+    return tuple(shift)
+
+
+class DriftTracker:
+    """
+    Measure the drift of each new frame against a reference frame, and correct the
+    :class:`DACCodeRange` of subsequent scans to cancel it.
+
+    Correlation runs in an executor, so that submitting a frame never waits for the measurement.
+    Corrections are based on the most recent completed measurement; if a frame is submitted
+    while a measurement is still running, it is skipped.
+
+    Args:
+        band: Range of rows ``(start, count)`` to correlate, instead of the whole frame
+        downsample: Average blocks of this many pixels in X and Y before correlating
+        executor: :class:`concurrent.futures.Executor` to run correlation in. \
+            Defaults to the default executor of the event loop.
+
+    Attributes:
+        offset (tuple[float, float]): Current drift correction (y, x), in pixels
+
+    Example:
+        >>> tracker = DriftTracker(downsample=2)
+        >>> while True:
+        >>>     x, y = tracker.correct(x_range, y_range)
+        >>>     frame = await fb.capture_frame(x_range=x, y_range=y, dwell_time=dwell)
+        >>>     tracker.submit(frame.canvas)
+    """
+    _logger = logger.getChild("DriftTracker")
+
+    def __init__(self, *, band:tuple[int, int]|None=None, downsample:int=1, executor=None):
+        self.band = band
+        self.downsample = downsample
+        self.executor = executor
+        self.reference = None
+        self.offset = (0., 0.)
+        self._applied = (0., 0.)
+        self._pending = None
+
+    def _prepare(self, image) -> np.ndarray:
+        image = np.asarray(image)
+        if self.band is not None:
+            start, count = self.band
+            image = image[start:start + count]
+        n = self.downsample
+        if n > 1:
+            y_count, x_count = image.shape[0]//n*n, image.shape[1]//n*n
+            image = image[:y_count, :x_count].reshape(y_count//n, n, x_count//n, n).mean(axis=(1, 3))
+        return np.array(image, dtype=np.float32)
+
+    def set_reference(self, image):
+        """
+        Args:
+            image: 2D array, such as :attr:`Frame.canvas`, acquired with no drift correction
+        """
+        self.reference = self._prepare(image)
+        self.offset = (0., 0.)
+        self._applied = (0., 0.)
+
+    @property
+    def busy(self) -> bool:
+        """
+        True if a measurement is in progress
+        """
+        return self._pending is not None and not self._pending.done()
+
+    def submit(self, image):
+        """
+        Submit a frame that was acquired with the correction most recently returned by :meth:`correct`.
+        The first frame submitted becomes the reference.
+
+        Args:
+            image: 2D array, such as :attr:`Frame.canvas`. It is copied, and can be overwritten immediately.
+
+        Returns:
+            :class:`asyncio.Future` | None: Resolves to the shift (y, x) measured in this frame, \
+                in downsampled pixels, or None if no measurement was started
+        """
+        if self.reference is None:
+            self.set_reference(image)
+            return None
+        if self.busy:
+            self._logger.debug("measurement in progress, skipping frame")
+            return None
+        applied = self._applied
+        prepared = self._prepare(image)
+        loop = asyncio.get_running_loop()
+        self._pending = loop.run_in_executor(self.executor, measure_shift, self.reference, prepared)
+
+        def done(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            shift_y, shift_x = future.result()
+            ## the frame was acquired with `applied` correction, so the residual shift adds to it
+            self.offset = (applied[0] + shift_y*self.downsample, applied[1] + shift_x*self.downsample)
+            self._logger.debug(f"measured shift ({shift_y:.2f}, {shift_x:.2f}) -> offset {self.offset}")
+        self._pending.add_done_callback(done)
+        return self._pending
+
+    def correct(self, x_range:DACCodeRange, y_range:DACCodeRange) -> tuple[DACCodeRange, DACCodeRange]:
+        """
+        Shift the start of a scan to cancel the measured drift.
+
+        Args:
+            x_range: X range of the scan without drift correction
+            y_range: Y range of the scan without drift correction
+
+        Returns:
+            tuple[DACCodeRange, DACCodeRange]: Corrected X and Y ranges
+        """
+        self._applied = self.offset
+        def shift(dac_range:DACCodeRange, pixels:float):
+            step = dac_range.step/256
+            max_start = max(0, int(16383 - (dac_range.count - 1)*step))
+            start = int(round(dac_range.start + pixels*step))
+            return DACCodeRange(start=min(max(start, 0), max_start), count=dac_range.count, step=dac_range.step)
+        return shift(x_range, self.offset[1]), shift(y_range, self.offset[0])
@@ -10,46 +10,87 @@ import tifffile
 
 from obi.commands import *
 from obi.transfer import Connection
-from .raster import RasterScanCommand
+from .raster import RasterScanCommand, MultiRegionScanCommand, ScanRegion, FreeRunScanCommand
 from .vector import VectorScanCommand, default_iter
+from .stats import FrameStatistics
+from .recorder import FrameRecorder
 logger = logging.getLogger()
 
-__all__ = ["Frame", "FrameBuffer"]
+__all__ = ["Frame", "FrameBuffer", "pixel_types"]
+
+def pixel_types(output_mode:OutputMode) -> tuple[str, type]:
+    """
+    Types of the pixels returned in an output mode.
+
+    Pixels of :attr:`OutputMode.FourteenBitPacked` and :attr:`OutputMode.Compressed` are unpacked into 16-bit values,
+    and pixels of :attr:`OutputMode.FourBit` and :attr:`OutputMode.OneBit` into 8-bit values.
+    Pixels of :attr:`OutputMode.RawSum` are sums of a varying number of samples rather than image values,
+    so frames cannot be scanned in that mode. Read them with :class:`RasterScanCommand` directly.
+
+    Args:
+        output_mode: Any output mode except :attr:`OutputMode.NoOutput` and :attr:`OutputMode.RawSum`
+
+    Returns:
+        tuple[str, type]: :class:`array.array` typecode and :mod:`numpy` dtype
+    """
+    match output_mode:
+        case OutputMode.SixteenBit | OutputMode.FourteenBitPacked | OutputMode.Compressed:
+            return 'H', np.uint16
+        case OutputMode.EightBit | OutputMode.FourBit | OutputMode.OneBit:
+            return 'B', np.uint8
+        case OutputMode.RawSum:
+            raise ValueError(f"{output_mode} returns sums of samples, not image pixels")
+    raise ValueError(f"{output_mode} does not return pixels")
+
 
 class Frame:
     """
     A Frame represents a 2D array of pixels.
 
     Properties:
-        canvas: 2D :class:`numpy.ndarray` of :class:`np.uint16` representing an image
+        canvas: 2D :class:`numpy.ndarray` of :class:`np.uint16` representing an image, \
+            or of :class:`np.uint8` for a frame scanned with 8 bits or fewer per pixel
 
     Args:
         x_res: Number of pixels in X
         y_res: Number of pixels in Y
+        output_mode: Output mode the frame is scanned with. Defaults to OutputMode.SixteenBit.
+        serpentine: The frame is scanned with every other line from right to left, \
+            and those lines are reversed as they are filled in. Defaults to False.
     """
     _logger = logger.getChild("Frame")
-    def __init__(self, x_res:int, y_res:int):
+    def __init__(self, x_res:int, y_res:int, output_mode:OutputMode=OutputMode.SixteenBit, serpentine:bool=False):
 
         self._x_count = x_res
         self._y_count = y_res
-        self.canvas = np.zeros(shape = self.np_shape, dtype = np.uint16)
+        self.output_mode = output_mode
+        self.serpentine = serpentine
+        self.canvas = np.zeros(shape = self.np_shape, dtype = self.dtype)
         self.y_ptr = 0
     
     def __repr__(self):
-        return f"Frame: {self._x_count} x, {self._y_count} y"
+        return f"Frame: {self._x_count} x, {self._y_count} y, {self.output_mode}"
 
     @classmethod
-    def from_DAC_ranges(cls, x_range:DACCodeRange, y_range:DACCodeRange):
+    def from_DAC_ranges(cls, x_range:DACCodeRange, y_range:DACCodeRange, output_mode:OutputMode=OutputMode.SixteenBit):
         '''
         Generate a frame from two instances of :class:DACCodeRange
 
         Args:
             x_range
             y_range
+            output_mode
         Returns:
             :class:`Frame`
         '''
-        return cls(x_range.count, y_range.count)
+        return cls(x_range.count, y_range.count, output_mode)
+
+    @property
+    def dtype(self):
+        """
+        :mod:`numpy` dtype of the pixels
+        """
+        return pixel_types(self.output_mode)[1]
 
     @property
     def pixels(self) -> int:
@@ -78,23 +119,38 @@ class Frame:
         """
         if len(pixels) != self.pixels:
             raise ValueError(f"expected {self._x_count} x {self._y_count} = {self.pixels} pixels, got {len(pixels)} pixels")
-        self.canvas = np.array(pixels, dtype = np.uint16).reshape(self.np_shape)
+        self.canvas = self._lines(pixels, 0)
+
+    def _lines(self, pixels: array.array, y_start:int) -> np.ndarray:
+        """
+        Reshape pixels into lines, starting at line ``y_start`` and wrapping around to the top of the frame.
+        In a serpentine frame, the odd lines are reversed back into left to right order.
+        """
+        lines = np.array(pixels, dtype = self.dtype).reshape(-1, self._x_count)
+        if self.serpentine:
+            reversed_lines = (y_start + np.arange(len(lines))) % self._y_count % 2 == 1
+            lines[reversed_lines] = lines[reversed_lines, ::-1]
+        return lines
     
-    def fill_lines(self, pixels: array.array):
+    def fill_lines(self, pixels: array.array) -> np.ndarray:
         """
         Fill a partial section of the frame with data.
         Only whole lines will be accepted.
 
         Args:
             pixels: 1D array of pixel data
+
+        Returns:
+            :class:`np.ndarray`: The lines that were filled, in the order they were received
         """
         assert len(pixels)%self._x_count == 0, f"invalid shape: {len(pixels)} is not a multiple of {self._x_count}"
         fill_y_count = int(len(pixels)/self._x_count)
         self._logger.debug(f"fill_lines: fill {len(pixels)} pixels ({fill_y_count} lines), from y ={self.y_ptr}")
+        lines = self._lines(pixels, self.y_ptr)
         if (fill_y_count == self._y_count) & (self.y_ptr == 0):
-            self.fill(pixels)
+            self.canvas[:] = lines
         elif self.y_ptr + fill_y_count <= self._y_count:
-            self.canvas[self.y_ptr:self.y_ptr + fill_y_count] = np.array(pixels, dtype = np.uint16).reshape(fill_y_count, self._x_count)
+            self.canvas[self.y_ptr:self.y_ptr + fill_y_count] = lines
             self.y_ptr += fill_y_count
             if self.y_ptr == self._y_count:
                 self._logger.debug("fill_lines: roll over to top of frame")
@@ -102,15 +158,13 @@ class Frame:
         elif self.y_ptr + fill_y_count > self._y_count:
             self._logger.debug(f"fill_lines: {self.y_ptr} + {fill_y_count} > {self._y_count}")
             remaining_lines = self._y_count - self.y_ptr
-            remaining_pixel_count = remaining_lines*self._x_count
-            remaining_pixels = pixels[:remaining_pixel_count]
-            self.canvas[self.y_ptr:self._y_count] = np.array(remaining_pixels, dtype = np.uint16).reshape(remaining_lines, self._x_count)
+            self.canvas[self.y_ptr:self._y_count] = lines[:remaining_lines]
             rewrite_lines = fill_y_count - remaining_lines
-            rewrite_pixels = pixels[remaining_pixel_count:]
             self._logger.debug(f"fill_lines: {remaining_lines=}, {rewrite_lines=}")
-            self.canvas[:rewrite_lines] = np.array(rewrite_pixels, dtype = np.uint16).reshape(rewrite_lines, self._x_count)
+            self.canvas[:rewrite_lines] = lines[remaining_lines:]
             self.y_ptr = rewrite_lines
         self._logger.debug(f"fill_lines: end at y = {self.y_ptr}")
+        return lines
     
     @staticmethod
     def fill_vector(pixels: array.array, iterpoints, x_res:int=2048, y_res:int=2048):
@@ -121,14 +175,19 @@ class Frame:
 
     def as_uint16(self) -> np.ndarray:
         """
-        Get underlying frame data as an array of type :class:`np.uint16`
+        Get underlying frame data as an array of type :class:`np.uint16`.
+        Pixels of an 8-bit frame are the high byte of the 16-bit pixel.
         """
+        if self.canvas.dtype == np.uint8:
+            return np.left_shift(self.canvas.astype(np.uint16), 8)
         return self.canvas
 
     def as_uint8(self) -> np.ndarray:
         """
         Get underlying frame data as an array of type :class:`np.uint8`
         """
+        if self.canvas.dtype == np.uint8:
+            return self.canvas
         return np.right_shift(self.canvas, 8).astype(np.uint8)
 
     def saveImage_tifffile(self, save_path, bit_depth_8=True, bit_depth_16=False,
@@ -151,14 +210,30 @@ class FrameBuffer:
     The Frame Buffer executes raster scan commands and stores the results in a :class:Frame.
     It is suitable for a live graphical display, or for headless scripted capture.
 
+    Statistics of the frame being captured are updated as each band of lines is received.
+
     Args:
         conn (:class:`Connection`): A connection to an OBI device, via a Glasgow device
+
+    Attributes:
+        stats (:class:`FrameStatistics`): Statistics of the lines received since the start of the current frame
+        last_stats (:class:`FrameStatistics` | None): Statistics of the previous frame, \
+            once a scan has rolled over to the top of a new frame
+        recorder (:class:`FrameRecorder` | None): If set, every frame completed by \
+            :meth:`capture_full_frame`, :meth:`capture_live`, :meth:`capture_regions` \
+            and :meth:`capture_frame_rois` is recorded
     '''
     _logger = logger.getChild("FrameBuffer")
     def __init__(self, conn: Connection):
         self.conn = conn
         self.current_frame = None
         self.abort = None
+        self.stats = FrameStatistics()
+        self.last_stats = None
+        self.recorder = None
+        # Scan parameters of the frames being recorded, and the bands of lines of the current frame
+        self._record_parameters = None
+        self._record_bands = []
 
     def _opt_chunk_size(self, frame: Frame):
         """
@@ -181,27 +256,70 @@ class FrameBuffer:
             lines_per_chunk = dwells_per_frame//frame._x_count
             return int(frame._x_count*lines_per_chunk)
     
-    def _set_current_frame(self, x_res:int, y_res:int):
+    def _set_current_frame(self, x_res:int, y_res:int, output_mode:OutputMode=OutputMode.SixteenBit):
         """
         Called when scan settings have been changed. 
         If the buffer contains an existing Frame as current_frame, and that 
-        frame has the same resolution as x_res and y_res, then keep the current frame 
+        frame has the same resolution as x_res and y_res and the same output mode, then keep the current frame 
         but reset the Y pointer to the top of the frame.
         Otherwise, generate a new frame and assign to current_frame.
 
         Args:
             x_res: Number of pixels in X
             y_res: Number of pixels in Y
+            output_mode
         """
         # if resolution is exactly the same
         if (self.current_frame is not None):
-            if (x_res == self.current_frame._x_count) & (y_res == self.current_frame._y_count):
+            if (x_res == self.current_frame._x_count) & (y_res == self.current_frame._y_count) \
+                    & (output_mode == self.current_frame.output_mode):
                 self.current_frame.y_ptr = 0 #reset to top
             else:
-                self.current_frame = Frame(x_res, y_res) #Create new empty frame
+                self.current_frame = Frame(x_res, y_res, output_mode) #Create new empty frame
         else:
-            self.current_frame = Frame(x_res, y_res) #Create new empty frame
+            self.current_frame = Frame(x_res, y_res, output_mode) #Create new empty frame
     
+    def _fill_lines(self, frame: Frame, pixels: array.array):
+        """
+        Fill lines of a frame, and add them to :attr:`stats`.
+        When the lines start at the top of the frame, the statistics so far become :attr:`last_stats`.
+        """
+        def next_frame():
+            self._logger.debug(f"next frame, {self.stats}")
+            if self.stats.count > 0:
+                self.last_stats = self.stats
+            self.stats = FrameStatistics()
+            ## lines of an incomplete frame are not recorded
+            self._record_bands = []
+
+        def add_lines(lines):
+            if self.recorder is not None and self._record_parameters is not None:
+                self._record_bands.append(lines)
+            if frame.dtype == np.uint8:
+                ## statistics are always of 16-bit pixel values
+                lines = np.left_shift(lines.astype(np.uint16), 8)
+            self.stats.update(lines)
+
+        y_start = frame.y_ptr
+        lines = frame.fill_lines(pixels)
+        if y_start == 0:
+            next_frame()
+        remaining_lines = max(frame._y_count - y_start, 0)
+        add_lines(lines[:remaining_lines])
+        if 0 < remaining_lines <= len(lines):
+            self._record_frame()
+        if len(lines) > remaining_lines:
+            next_frame()
+            add_lines(lines[remaining_lines:])
+
+    def _record_frame(self):
+        """
+        Hand the lines of a completed frame to :attr:`recorder`, which copies them in its own thread.
+        """
+        bands, self._record_bands = self._record_bands, []
+        if self.recorder is not None and self._record_parameters is not None and bands:
+            self.recorder.record(bands, **self._record_parameters)
+
     def abort_scan(self):
         """Stop the scan without completing a frame
         """
@@ -228,7 +346,8 @@ class FrameBuffer:
         else:
             return False
 
-    async def _capture_frame_iter_fill(self, *, frame: Frame, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time: int, latency:int=65536):
+    async def _capture_frame_iter_fill(self, *, frame: Frame, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time: int, latency:int=65536,
+                                       serpentine:bool=False):
         """
         Core function for capturing image data produced by a raster scan into a 2D array.
 
@@ -239,16 +358,19 @@ class FrameBuffer:
             dwell_time
             latency (optional): Send chunks of pixels that will take no longer \
                                     than this many dwell times to execute. Defaults to 65536.
+            serpentine (optional): Scan every other line from right to left, without flyback. Defaults to False.
         Yields:
             :class:`Frame`: A :class:`Frame` object is yielded each time new pixels are added
         """
-        res = array.array('H')
+        frame.serpentine = serpentine
+        res = array.array(pixel_types(frame.output_mode)[0])
         pixels_per_chunk = self._opt_chunk_size(frame)
         self._logger.debug(f"{pixels_per_chunk=}")
 
         await self.conn.transfer(BlankCommand(enable=False, inline=True))
 
-        cmd = RasterScanCommand(cookie=123,x_range=x_range, y_range=y_range, dwell_time=dwell_time)
+        cmd = RasterScanCommand(cookie=123,x_range=x_range, y_range=y_range, dwell_time=dwell_time, output_mode=frame.output_mode,
+                                serpentine=serpentine)
         self.abort = cmd.abort
         #self.conn._synchronized = False
         async for chunk in self.conn.transfer_multiple(cmd, latency=latency):
@@ -261,7 +383,7 @@ class FrameBuffer:
                     to_frame = res[:pixels_per_chunk]
                     res = res[pixels_per_chunk:]
                     self._logger.debug(f"slice to display: {pixels_per_chunk}, {len(res)} pixels left in buffer")
-                    frame.fill_lines(to_frame)
+                    self._fill_lines(frame, to_frame)
                     yield frame
 
                     if len(res) > pixels_per_chunk:
@@ -277,10 +399,11 @@ class FrameBuffer:
         self._logger.debug(f"end of scan: {len(res)} pixels in buffer")
         last_lines = len(res)//frame._x_count
         if last_lines > 0:
-            frame.fill_lines(res[:frame._x_count*last_lines])
+            self._fill_lines(frame, res[:frame._x_count*last_lines])
         yield frame
 
-    async def capture_frame(self, *, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time:int, **kwargs):
+    async def capture_frame(self, *, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time:int,
+                            output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
         """
         Simplest method to capture a single frame. 
         Unlike frame capture methods that are used with the GUI, no partially filled frames are returned.
@@ -289,17 +412,21 @@ class FrameBuffer:
             x_range (DACCodeRange): X range for raster scan
             y_range (DACCodeRange): Y range for raster scan
             dwell_time (int): Pixel dwell time
+            output_mode (OutputMode): :attr:`OutputMode.EightBit` transfers half as much data. \
+                Defaults to OutputMode.SixteenBit.
+            serpentine (bool): Scan every other line from right to left, without flyback. Defaults to False.
 
         Returns:
             :class:`Frame`
         """
-        self.current_frame=Frame.from_DAC_ranges(x_range, y_range)
+        self.current_frame=Frame.from_DAC_ranges(x_range, y_range, output_mode)
         async for frame in self._capture_frame_iter_fill(frame=self.current_frame,
         x_range=x_range, y_range=y_range, dwell_time=dwell_time, latency=x_range.count*y_range.count*dwell_time, **kwargs):
             pass
         return self.current_frame
 
-    async def capture_frame_roi(self, *, x_res:int, y_res:int, x_start:int, x_count:int, y_start:int, y_count:int, **kwargs):
+    async def capture_frame_roi(self, *, x_res:int, y_res:int, x_start:int, x_count:int, y_start:int, y_count:int,
+                                output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
         """Scan and capture data into a selected region of a frame
 
         Args:
@@ -309,15 +436,16 @@ class FrameBuffer:
             x_count: Number of steps in X in ROI
             y_start: Y coordinate of top left corner of ROI
             y_count: Number of steps in Y in ROI
+            output_mode: If this differs from the output mode of the full frame, a new full frame is started
 
         Yields:
             :class:`Frame`: Full frame with new data filled into region of interest. \
                 A :class:`Frame` object is yielded each time new pixels are added.
         """
-        self._set_current_frame(x_res, y_res)
+        self._set_current_frame(x_res, y_res, output_mode)
         x_range = DACCodeRange.from_roi(x_res, x_start, x_count)
         y_range = DACCodeRange.from_roi(y_res, y_start, y_count)
-        roi_frame = Frame.from_DAC_ranges(x_range, y_range)
+        roi_frame = Frame.from_DAC_ranges(x_range, y_range, output_mode)
         roi_frame.canvas = self.current_frame.canvas[y_start:(y_start+y_count),x_start:(x_start+x_count)] #copy frame underneath
         print(f"{y_start}:{y_start+y_count}, {x_start}:{x_start+x_count}")
         async for roi_frame in self._capture_frame_iter_fill(frame=roi_frame, x_range=x_range, y_range=y_range,**kwargs):
@@ -325,23 +453,155 @@ class FrameBuffer:
             self.current_frame.canvas[y_start:(y_start+y_count),x_start:(x_start+x_count)] = roi_frame.canvas
             yield self.current_frame
 
-    async def capture_full_frame(self, *, x_res: int, y_res: int, **kwargs):
+    async def _capture_regions_iter_fill(self, *, frames:list[Frame], regions:list[ScanRegion], latency:int=65536,
+                                         output_mode:OutputMode=OutputMode.SixteenBit):
+        """
+        Core function for capturing image data produced by a multi-region raster scan into one frame per region.
+
+        Args:
+            frames: Frames to capture into, one for each region
+            regions
+            latency (optional): Send chunks of pixels that will take no longer \
+                                    than this many dwell times to execute. Defaults to 65536.
+        Yields:
+            tuple[int, :class:`Frame`]: Index of a region and its frame, each time new pixels are added
+        """
+        filled = [0]*len(regions)
+
+        await self.conn.transfer(BlankCommand(enable=False, inline=True))
+
+        cmd = MultiRegionScanCommand(cookie=123, regions=regions, output_mode=output_mode)
+        self.abort = cmd.abort
+        async for index, chunk in self.conn.transfer_multiple(cmd, latency=latency):
+            frame = frames[index]
+            start = filled[index]
+            frame.canvas.reshape(-1)[start:start + len(chunk)] = chunk
+            filled[index] += len(chunk)
+            self._logger.debug(f"region {index}: {filled[index]}/{frame.pixels} pixels")
+            if self.recorder is not None and filled[index] == frame.pixels:
+                region = regions[index]
+                self.recorder.record(frame.canvas, x_range=region.x_range, y_range=region.y_range,
+                                     dwell_time=region.dwell_time)
+            yield index, frame
+
+    async def capture_regions(self, *, regions:list[ScanRegion], output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
+        """
+        Capture several regions, each into its own frame, in a single synchronized scan.
+        No partially filled frames are returned.
+
+        Args:
+            regions: Regions to scan, each with its own dwell time
+            output_mode: Defaults to OutputMode.SixteenBit
+
+        Returns:
+            list[:class:`Frame`]: One frame for each region
+        """
+        frames = [Frame.from_DAC_ranges(region.x_range, region.y_range, output_mode) for region in regions]
+        async for _ in self._capture_regions_iter_fill(frames=frames, regions=regions, output_mode=output_mode, **kwargs):
+            pass
+        return frames
+
+    async def capture_frame_rois(self, *, x_res:int, y_res:int, rois:list[dict],
+                                 output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
+        """Scan and capture data into several selected regions of a frame, in a single synchronized scan
+
+        Args:
+            x_res: X resolution of full frame
+            y_res: Y resolution of full frame
+            rois: Regions of interest, each a dict with the keys \
+                ``x_start``, ``x_count``, ``y_start``, ``y_count`` and ``dwell_time``, \
+                as in :meth:`capture_frame_roi`
+            output_mode: As in :meth:`capture_frame_roi`
+
+        Yields:
+            :class:`Frame`: Full frame with new data filled into the regions of interest. \
+                A :class:`Frame` object is yielded each time new pixels are added.
+        """
+        self._set_current_frame(x_res, y_res, output_mode)
+        regions = []
+        roi_frames = []
+        for roi in rois:
+            x_range = DACCodeRange.from_roi(x_res, roi["x_start"], roi["x_count"])
+            y_range = DACCodeRange.from_roi(y_res, roi["y_start"], roi["y_count"])
+            regions.append(ScanRegion(x_range=x_range, y_range=y_range, dwell_time=roi["dwell_time"]))
+            roi_frame = Frame.from_DAC_ranges(x_range, y_range, output_mode)
+            roi_frame.canvas[:] = self.current_frame.canvas[roi["y_start"]:(roi["y_start"]+roi["y_count"]),
+                                                            roi["x_start"]:(roi["x_start"]+roi["x_count"])] #copy frame underneath
+            roi_frames.append(roi_frame)
+        async for index, roi_frame in self._capture_regions_iter_fill(frames=roi_frames, regions=regions,
+                                                                     output_mode=output_mode, **kwargs):
+            roi = rois[index]
+            self.current_frame.canvas[roi["y_start"]:(roi["y_start"]+roi["y_count"]),
+                                      roi["x_start"]:(roi["x_start"]+roi["x_count"])] = roi_frame.canvas
+            yield self.current_frame
+
+    async def capture_full_frame(self, *, x_res: int, y_res: int, output_mode:OutputMode=OutputMode.SixteenBit, **kwargs):
         """Scan and capture data into a frame that spans the entire DAC range.
 
         Args:
             x_res: Number of pixels in X
             y_res: Number of pixels in Y
+            output_mode: :attr:`OutputMode.EightBit` transfers half as much data, for live view. \
+                Defaults to OutputMode.SixteenBit.
 
         Yields:
             :class:`Frame`: A :class:`Frame` object is yielded each time new pixels are added
         """
         x_range = DACCodeRange.from_resolution(x_res)
         y_range = DACCodeRange.from_resolution(y_res)
-        self._set_current_frame(x_res, y_res)
-        async for frame in self._capture_frame_iter_fill(frame=self.current_frame, x_range=x_range, y_range=y_range, **kwargs):
-            self.current_frame = frame
-            yield frame
+        self._set_current_frame(x_res, y_res, output_mode)
+        self._record_parameters = dict(x_range=x_range, y_range=y_range, dwell_time=kwargs.get("dwell_time"))
+        try:
+            async for frame in self._capture_frame_iter_fill(frame=self.current_frame, x_range=x_range, y_range=y_range, **kwargs):
+                self.current_frame = frame
+                yield frame
+        finally:
+            self._record_parameters = None
     
+    async def capture_live(self, *, x_res:int, y_res:int, dwell_time:int, serpentine:bool=False):
+        """Scan frames that span the entire DAC range continuously, with :class:`FreeRunScanCommand`,
+        until :meth:`abort_scan` is called.
+
+        Every frame starts at the top of :attr:`current_frame` when its frame marker arrives,
+        so the image stays in place even if pixels are lost. Pixels are always 16-bit.
+
+        Args:
+            x_res: Number of pixels in X
+            y_res: Number of pixels in Y
+            dwell_time: Pixel dwell time
+            serpentine: Scan every other line from right to left, without flyback. Defaults to False.
+
+        Yields:
+            :class:`Frame`: A :class:`Frame` object is yielded each time new pixels are added
+        """
+        x_range = DACCodeRange.from_resolution(x_res)
+        y_range = DACCodeRange.from_resolution(y_res)
+        self._set_current_frame(x_res, y_res, OutputMode.SixteenBit)
+        frame = self.current_frame
+        frame.serpentine = serpentine
+        res = array.array('H')
+
+        await self.conn.transfer(BlankCommand(enable=False, inline=True))
+
+        cmd = FreeRunScanCommand(cookie=123, x_range=x_range, y_range=y_range, dwell_time=dwell_time,
+                                 serpentine=serpentine)
+        self.abort = cmd.abort
+        self._record_parameters = dict(x_range=x_range, y_range=y_range, dwell_time=dwell_time)
+        try:
+            async for frame_start, pixels in self.conn.transfer_multiple(cmd, chunk_size=self._opt_chunk_size(frame)):
+                if frame_start:
+                    ## lines of the previous frame that were not completed are dropped
+                    res = array.array('H')
+                    frame.y_ptr = 0
+                res.extend(pixels)
+                lines = min(len(res)//frame._x_count, frame._y_count - frame.y_ptr)
+                if lines > 0:
+                    self._fill_lines(frame, res[:frame._x_count*lines])
+                    res = res[frame._x_count*lines:]
+                    yield frame
+        finally:
+            self._record_parameters = None
+
     async def capture_vector_frame(self, *, iter_points=default_iter()):
         send_iter, recv_iter = itertools.tee(iter_points)
         import time
@@ -0,0 +1,136 @@
+import asyncio
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import tifffile
+
+from obi.commands import *
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["ImageMetadata", "ImageWriter"]
+
+@dataclass
+class ImageMetadata:
+    """
+    Conditions an image was acquired in, saved with it by :class:`ImageWriter`.
+
+    Args:
+        dwell_time: Pixel dwell time, as sent in :class:`RasterPixelRunCommand`
+        beam: Name of the beam, such as ``"electron"``
+        magnification: Magnification set on the microscope
+        pixel_size: Width of one pixel, in m. See :meth:`MagCal.pixel_size`.
+        timestamp: Time the image was acquired
+    """
+    dwell_time: DwellTime | None = None
+    beam: str | None = None
+    magnification: float | None = None
+    pixel_size: float | None = None
+    timestamp: datetime.datetime = field(default_factory=datetime.datetime.now)
+
+    def to_ome(self, name:str) -> dict:
+        """
+        Returns:
+            dict: Metadata for :func:`tifffile.imwrite` with ``ome=True``
+        """
+        metadata = {
+            "axes": "YX",
+            "Name": name,
+            "AcquisitionDate": self.timestamp.isoformat(timespec="seconds"),
+        }
+        if self.pixel_size is not None:
+            ## OME physical sizes are in µm
+            metadata.update({
+                "PhysicalSizeX": self.pixel_size*1e6, "PhysicalSizeXUnit": "µm",
+                "PhysicalSizeY": self.pixel_size*1e6, "PhysicalSizeYUnit": "µm",
+            })
+        annotations = {}
+        if self.dwell_time is not None:
+            annotations["DwellTime"] = str(self.dwell_time)
+            ## the dwell time field counts from 0, in cycles of 125 ns
+            annotations["DwellTimeSeconds"] = str((self.dwell_time + 1)*125e-9)
+        if self.beam is not None:
+            annotations["Beam"] = self.beam
+        if self.magnification is not None:
+            annotations["Magnification"] = str(self.magnification)
+        if annotations:
+            metadata["MapAnnotation"] = annotations
+        return metadata
+
+
+class ImageWriter:
+    """
+    Save frames as OME-TIFF files in a thread pool, so that writing a large frame never blocks the event loop.
+
+    Frames are saved with 16 bits per pixel. Pixel size, dwell time, resolution, beam and timestamp
+    are stored in the OME metadata, and the pixel size is also stored in the TIFF resolution tags.
+
+    Args:
+        max_workers: Number of files that can be written at once
+        compression: Compression, as in :func:`tifffile.imwrite`, such as ``"zlib"``, or None
+
+    Call :meth:`close`, or use the writer as a context manager, so that pending files are written before exiting.
+
+    Example:
+        >>> with ImageWriter() as writer:
+        >>>     frame = await fb.capture_frame(x_range=r, y_range=r, dwell_time=dwell)
+        >>>     writer.save(frame, "photo", ImageMetadata(dwell_time=dwell, pixel_size=2e-9))
+    """
+    _logger = logger.getChild("ImageWriter")
+
+    def __init__(self, *, max_workers:int=2, compression:str|None="zlib"):
+        self.compression = compression
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ImageWriter")
+
+    def _write(self, canvas:np.ndarray, path:str, metadata:ImageMetadata, bit_depth_8:bool) -> str:
+        name = os.path.basename(path)
+        ome_path = f"{path}.ome.tif"
+        resolution = None
+        if metadata.pixel_size is not None:
+            pixels_per_cm = 1e-2/metadata.pixel_size
+            resolution = (pixels_per_cm, pixels_per_cm)
+        tifffile.imwrite(ome_path, canvas, ome=True, photometric="minisblack",
+                         compression=self.compression, resolution=resolution,
+                         resolutionunit="CENTIMETER" if resolution is not None else None,
+                         metadata=metadata.to_ome(name))
+        if bit_depth_8:
+            tifffile.imwrite(f"{path}_8bit.tif", np.right_shift(canvas, 8).astype(np.uint8),
+                             compression=self.compression)
+        self._logger.debug(f"saved {ome_path}")
+        return ome_path
+
+    def save(self, frame, path:str, metadata:ImageMetadata|None=None, *, bit_depth_8:bool=False) -> asyncio.Future:
+        """
+        Start saving a frame. The frame is copied before this returns,
+        so it can be overwritten while the file is being written.
+
+        Args:
+            frame: :class:`Frame` to save
+            path: Path to save to, without extension
+            metadata: Acquisition conditions of the frame
+            bit_depth_8: Also save an 8-bit TIFF file, for viewers that do not support 16-bit images
+
+        Returns:
+            :class:`asyncio.Future`: Resolves to the path of the OME-TIFF file once it is written
+        """
+        canvas = np.array(frame.as_uint16())
+        if metadata is None:
+            metadata = ImageMetadata()
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, self._write, canvas, path, metadata, bit_depth_8)
+
+    def close(self):
+        """
+        Wait for all files to be written, and stop the threads. No more frames can be saved afterwards.
+        """
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,267 @@
+import enum
+from dataclasses import dataclass
+
+import numpy as np
+
+__all__ = ["PathOrder", "PathStats", "PathReport", "path_stats", "order_points"]
+
+class PathOrder(enum.Enum):
+    """
+    Order in which the beam visits a set of vector points.
+
+    Members:
+        Raster: Row by row, each row from left to right
+        Serpentine: Row by row, alternating direction on each row (boustrophedon)
+        Hilbert: Along a Hilbert space-filling curve over the full DAC range
+        NearestNeighbor: Greedy tour, always moving to the closest unvisited point. Best suited for sparse point sets.
+        Contour: Follow chains of adjacent points on a regular grid, such as the outlines of a shape, \
+            jumping to the closest unvisited point when a chain ends.
+    """
+    Raster = "raster"
+    Serpentine = "serpentine"
+    Hilbert = "hilbert"
+    NearestNeighbor = "nearest"
+    Contour = "contour"
+
+
+@dataclass
+class PathStats:
+    """
+    Cost of moving the beam along a path.
+
+    The X and Y DACs move simultaneously, so each move costs the larger of its X and Y steps.
+    Settle time is modeled as proportional to the length of each move.
+
+    Args:
+        travel: Total DAC travel, in DAC codes
+        jumps: Number of moves longer than the jump threshold
+        blank_toggles: Number of blanking transitions needed to blank the beam during each jump
+        settle_time: Estimated total settle time, in units of :class:`DwellTime`
+    """
+    travel: int
+    jumps: int
+    blank_toggles: int
+    settle_time: int
+
+
+@dataclass
+class PathReport:
+    """
+    Comparison of a path before and after ordering.
+
+    Args:
+        order: Ordering that was applied
+        before: Cost of the path in its original order
+        after: Cost of the path in its new order
+    """
+    order: PathOrder
+    before: PathStats
+    after: PathStats
+
+    @property
+    def travel_saved(self) -> int:
+        return self.before.travel - self.after.travel
+
+    @property
+    def settle_time_saved(self) -> int:
+        """
+        Estimated reduction in settle time, in units of :class:`DwellTime`
+        """
+        return self.before.settle_time - self.after.settle_time
+
+    def __repr__(self):
+        return (f"PathReport({self.order.value}: travel {self.before.travel} -> {self.after.travel}, "
+                f"jumps {self.before.jumps} -> {self.after.jumps}, "
+                f"settle time {self.before.settle_time} -> {self.after.settle_time} "
+                f"({self.settle_time_saved*125e-9:.3f} s saved))")
+
+
+def path_stats(x_coords, y_coords, *, jump_threshold:int=256, settle_per_code:float=1/64) -> PathStats:
+    """
+    Args:
+        x_coords: X coordinates of the points, in the order they are visited
+        y_coords: Y coordinates of the points, in the order they are visited
+        jump_threshold: Moves longer than this many DAC codes are counted as jumps
+        settle_per_code: Settle time needed per DAC code moved, in units of :class:`DwellTime`
+
+    Returns:
+        :class:`PathStats`
+    """
+    x_coords = np.asarray(x_coords, dtype=np.int64)
+    y_coords = np.asarray(y_coords, dtype=np.int64)
+    steps = np.maximum(np.abs(np.diff(x_coords)), np.abs(np.diff(y_coords)))
+    jumps = int(np.count_nonzero(steps > jump_threshold))
+    return PathStats(
+        travel = int(steps.sum()),
+        jumps = jumps,
+        blank_toggles = 2*jumps,
+        settle_time = int(np.ceil(steps*settle_per_code).sum())
+    )
+
+
+def _serpentine(x_coords, y_coords):
+    rows = np.unique(y_coords, return_inverse=True)[1]
+    x_key = np.where(rows % 2 == 1, -x_coords, x_coords)
+    return np.lexsort((x_key, y_coords))
+
+
+def _hilbert_index(x_coords, y_coords, order:int=14):
+    # vectorized xy2d, see https://en.wikipedia.org/wiki/Hilbert_curve
+    n = 1 << order
+    x = x_coords.copy()
+    y = y_coords.copy()
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        flip = rx & ~ry
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+
+class _NeighborSearch:
+    """
+    Finds the closest unvisited point using a uniform grid of cells.
+    """
+    def __init__(self, x_coords, y_coords, visited):
+        self.x = x_coords
+        self.y = y_coords
+        self.visited = visited
+        n = len(x_coords)
+        extent = max(int(x_coords.max() - x_coords.min()), int(y_coords.max() - y_coords.min()), 1)
+        ## about four points per cell for uniformly spread points
+        self.cell = max(1, int(extent*2/np.sqrt(n)))
+        self.x0 = int(x_coords.min())
+        self.y0 = int(y_coords.min())
+        cx = (x_coords - self.x0)//self.cell
+        cy = (y_coords - self.y0)//self.cell
+        self.ny = int(cy.max()) + 1
+        self.nx = int(cx.max()) + 1
+        cell_ids = cx*self.ny + cy
+        self.by_cell = np.argsort(cell_ids, kind="stable")
+        sorted_ids = cell_ids[self.by_cell]
+        self.cell_start = np.searchsorted(sorted_ids, np.arange(self.nx*self.ny))
+        self.cell_end = np.searchsorted(sorted_ids, np.arange(self.nx*self.ny), side="right")
+
+    def _ring(self, cx, cy, r):
+        indices = []
+        for ix in range(max(cx - r, 0), min(cx + r, self.nx - 1) + 1):
+            for iy in range(max(cy - r, 0), min(cy + r, self.ny - 1) + 1):
+                if max(abs(ix - cx), abs(iy - cy)) != r:
+                    continue
+                cell = ix*self.ny + iy
+                indices.append(self.by_cell[self.cell_start[cell]:self.cell_end[cell]])
+        if indices:
+            return np.concatenate(indices)
+        return np.empty(0, dtype=np.intp)
+
+    def _closest(self, candidates, x, y):
+        candidates = candidates[~self.visited[candidates]]
+        if len(candidates) == 0:
+            return None
+        dist = np.maximum(np.abs(self.x[candidates] - x), np.abs(self.y[candidates] - y))
+        return int(candidates[np.argmin(dist)])
+
+    def closest(self, x, y, max_rings:int=3):
+        cx = min(max((x - self.x0)//self.cell, 0), self.nx - 1)
+        cy = min(max((y - self.y0)//self.cell, 0), self.ny - 1)
+        for r in range(max_rings):
+            candidates = self._ring(cx, cy, r)
+            if len(candidates) and not self.visited[candidates].all():
+                ## a closer point may lie just across the edge of this ring
+                candidates = np.concatenate([candidates, self._ring(cx, cy, r + 1)])
+                return self._closest(candidates, x, y)
+        return self._closest(np.flatnonzero(~self.visited), x, y)
+
+
+def _nearest_neighbor(x_coords, y_coords):
+    n = len(x_coords)
+    visited = np.zeros(n, dtype=bool)
+    search = _NeighborSearch(x_coords, y_coords, visited)
+    order = np.empty(n, dtype=np.intp)
+    current = int(np.lexsort((x_coords, y_coords))[0])
+    for i in range(n):
+        order[i] = current
+        visited[current] = True
+        if i < n - 1:
+            current = search.closest(int(x_coords[current]), int(y_coords[current]))
+    return order
+
+
+def _contour(x_coords, y_coords):
+    n = len(x_coords)
+    ## points are adjacent if they are neighbors on the grid of the pattern
+    steps = np.concatenate([np.diff(np.unique(x_coords)), np.diff(np.unique(y_coords))])
+    pitch = int(steps.min()) if len(steps) else 1
+    gx = np.rint((x_coords - x_coords.min())/pitch).astype(np.int64).tolist()
+    gy = np.rint((y_coords - y_coords.min())/pitch).astype(np.int64).tolist()
+    grid = {(px, py): i for i, (px, py) in enumerate(zip(gx, gy))}
+    offsets = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+
+    visited = np.zeros(n, dtype=bool)
+    search = _NeighborSearch(x_coords, y_coords, visited)
+    order = np.empty(n, dtype=np.intp)
+    current = int(np.lexsort((x_coords, y_coords))[0])
+    direction = (1, 0)
+    for i in range(n):
+        order[i] = current
+        visited[current] = True
+        if i == n - 1:
+            break
+        px, py = gx[current], gy[current]
+        ## continue along the chain, turning as little as possible
+        following = None
+        best_turn = None
+        for dx, dy in offsets:
+            neighbor = grid.get((px + dx, py + dy))
+            if neighbor is None or visited[neighbor]:
+                continue
+            turn = -(dx*direction[0] + dy*direction[1])/np.hypot(dx, dy)
+            if best_turn is None or turn < best_turn:
+                following, best_turn = neighbor, turn
+                next_direction = (dx, dy)
+        if following is None:
+            current = search.closest(int(x_coords[current]), int(y_coords[current]))
+        else:
+            current = following
+            direction = next_direction
+    return order
+
+
+def order_points(x_coords, y_coords, order:PathOrder=PathOrder.Serpentine):
+    """
+    Find the order in which to visit a set of vector points.
+
+    Args:
+        x_coords: X coordinates of the points
+        y_coords: Y coordinates of the points
+        order: Ordering to apply
+
+    Returns:
+        np.ndarray: Indices that sort the points into the new order
+
+    Example:
+        >>> indices = order_points(x, y, PathOrder.Hilbert)
+        >>> x, y, dwell = x[indices], y[indices], dwell[indices]
+    """
+    x_coords = np.asarray(x_coords, dtype=np.int64)
+    y_coords = np.asarray(y_coords, dtype=np.int64)
+    if len(x_coords) == 0:
+        return np.empty(0, dtype=np.intp)
+    match PathOrder(order):
+        case PathOrder.Raster:
+            return np.lexsort((x_coords, y_coords))
+        case PathOrder.Serpentine:
+            return _serpentine(x_coords, y_coords)
+        case PathOrder.Hilbert:
+            return np.argsort(_hilbert_index(x_coords, y_coords), kind="stable")
+        case PathOrder.NearestNeighbor:
+            return _nearest_neighbor(x_coords, y_coords)
+        case PathOrder.Contour:
+            return _contour(x_coords, y_coords)
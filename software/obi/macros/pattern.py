@@ -0,0 +1,120 @@
+import asyncio
+
+from obi.commands import *
+from .pattern_file import PatternFile
+from .synchronize import SynchronizeMixin
+
+class PatternWriteCommand(SynchronizeMixin, BaseCommand):
+    def __init__(self, pattern:PatternFile, cookie:u16, output_mode:OutputMode=OutputMode.NoOutput, max_pipeline:int=8):
+        """
+        Write a compiled pattern in chunks, and wait for the instrument to acknowledge each chunk.
+
+        Each chunk is followed by a :class:`SynchronizeCommand`, which the instrument answers
+        once every pixel of the chunk has been executed. At most ``max_pipeline`` chunks
+        are in flight without having been acknowledged, which bounds both the amount of data
+        buffered between the host and the instrument and the time it takes for an abort to take effect.
+
+        When :attr:`abort` is set, no further chunks are sent, the beam is blanked,
+        and all outstanding acknowledgements are read, leaving the instrument synchronized.
+
+        Args:
+            pattern (PatternFile):
+            cookie (u16):
+            output_mode (OutputMode, optional): Set to :attr:`OutputMode.SixteenBit` or :attr:`OutputMode.EightBit` \
+                to read back the value of each pixel of the pattern. Defaults to OutputMode.NoOutput.
+            max_pipeline (int, optional): Number of chunks that may be in flight at once. Defaults to 8.
+
+        Attributes:
+            elapsed_dwell (int): Total dwell time of the chunks the instrument has finished executing
+            abort (asyncio.Event): Set to stop writing the pattern
+        """
+        self._pattern = pattern
+        self._cookie = cookie
+        self._output_mode = output_mode
+        self._max_pipeline = max_pipeline
+        self.elapsed_dwell = 0
+        self.abort = asyncio.Event()
+
+    def __repr__(self):
+        return f"PatternWriteCommand: pattern={self._pattern!r}, cookie={self._cookie}, output_mode={self._output_mode}"
+
+    @property
+    def total_dwell(self) -> int:
+        return self._pattern.total_dwell
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the total dwell time of the pattern that has been executed, from 0 to 1
+        """
+        if self.total_dwell == 0:
+            return 1.
+        return self.elapsed_dwell/self.total_dwell
+
+    def _iter_chunks(self, latency):
+        commands = bytearray()
+        total_dwell = 0
+        pixel_count = 0
+        for chunk, dwell, pixels in self._pattern.iter_chunks():
+            commands.extend(chunk)
+            total_dwell += dwell
+            pixel_count += pixels
+            if total_dwell >= latency:
+                yield commands, total_dwell, pixel_count
+                commands = bytearray()
+                total_dwell = 0
+                pixel_count = 0
+        if len(commands) > 0:
+            yield commands, total_dwell, pixel_count
+
+    @BaseCommand.log_transfer
+    async def transfer(self, stream, *, latency:int=1<<20):
+        """
+        Args:
+            latency: Minimum total dwell time of each chunk
+
+        Yields:
+            tuple[int, array.array | None]: :attr:`elapsed_dwell`, and the pixel values of the chunk \
+                that was just completed if output is enabled
+        """
+        self._logger.debug(f"transfer - {latency=}")
+        in_flight = asyncio.Queue()
+        ## a slot is taken before a chunk is written, and given back once it has been acknowledged
+        slots = asyncio.Semaphore(self._max_pipeline)
+
+        async def sender():
+            for commands, total_dwell, pixel_count in self._iter_chunks(latency):
+                await slots.acquire()
+                if self.abort.is_set():
+                    slots.release()
+                    break
+                in_flight.put_nowait((total_dwell, pixel_count))
+                commands.extend(self._synchronize(self._output_mode))
+                await stream.write(commands)
+                await stream.flush()
+                await asyncio.sleep(0)
+            if self.abort.is_set():
+                ## go to a blanked state after an aborted pattern
+                await slots.acquire()
+                in_flight.put_nowait((0, 0))
+                await stream.write(bytes(BlankCommand(enable=True, inline=False)) + self._synchronize(self._output_mode))
+                await stream.flush()
+            in_flight.put_nowait(None)
+
+        await stream.write(self._synchronize(self._output_mode))
+        await stream.flush()
+        await self._recv_sync(stream)
+        sender_task = asyncio.create_task(sender())
+        try:
+            while (chunk := await in_flight.get()) is not None:
+                total_dwell, pixel_count = chunk
+                res = await self.recv_res(pixel_count, stream, self._output_mode)
+                await self._recv_sync(stream)
+                slots.release()
+                self.elapsed_dwell += total_dwell
+                self._logger.debug(f"recver: {self.elapsed_dwell}/{self.total_dwell}")
+                yield self.elapsed_dwell, res
+            await sender_task
+        finally:
+            if not sender_task.done():
+                sender_task.cancel()
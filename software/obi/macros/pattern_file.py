@@ -0,0 +1,238 @@
+import hashlib
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["PatternFile", "PatternCache"]
+
+class PatternFile:
+    """
+    A compiled vector pattern, ready to be sent to the instrument without any further conversion.
+
+    A pattern file (``.obip``) contains a little-endian header, a chunk index, and the packed command stream::
+
+        magic (4 bytes: b"OBIP"), version (u16), reserved (u16)
+        content hash (32 bytes)
+        total dwell (u64), total pixels (u64), chunk count (u64), stream length (u64)
+        chunk offsets (chunk count x u64)
+        chunk dwells (chunk count x u64)
+        chunk pixels (chunk count x u64)
+        command stream (stream length bytes)
+
+    Chunk ``n`` spans ``stream[offsets[n]:offsets[n+1]]``; the last chunk ends at the end of the stream.
+
+    Args:
+        stream: Packed command stream
+        chunk_offsets: Byte offset of the start of each chunk within the stream
+        chunk_dwells: Total dwell time of the pixels in each chunk
+        chunk_pixels: Number of pixels in each chunk
+        content_hash: Hash of the source of the pattern and the parameters it was compiled with
+
+    Attributes:
+        stream (bytes | memoryview): The packed command stream. \
+            When loaded with :meth:`load`, this is a view into a memory-mapped file.
+    """
+    _logger = logger.getChild("PatternFile")
+
+    MAGIC = b"OBIP"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHH32sQQQQ")
+
+    def __init__(self, stream, chunk_offsets, chunk_dwells, chunk_pixels, *, content_hash:bytes=bytes(32)):
+        self.stream = stream
+        self.chunk_offsets = np.asarray(chunk_offsets, dtype=np.uint64)
+        self.chunk_dwells = np.asarray(chunk_dwells, dtype=np.uint64)
+        self.chunk_pixels = np.asarray(chunk_pixels, dtype=np.uint64)
+        if not len(self.chunk_offsets) == len(self.chunk_dwells) == len(self.chunk_pixels):
+            raise ValueError(f"{len(self.chunk_offsets)} chunk offsets, {len(self.chunk_dwells)} chunk dwells "
+                             f"and {len(self.chunk_pixels)} chunk pixels must have the same length")
+        self.content_hash = content_hash
+        self._mmap = None
+
+    def __repr__(self):
+        return f"PatternFile: {len(self)} chunks, {len(self.stream)} bytes, total_dwell={self.total_dwell}, total_pixels={self.total_pixels}"
+
+    def __len__(self):
+        return len(self.chunk_offsets)
+
+    @property
+    def total_dwell(self) -> int:
+        """
+        Sum of the dwell times of all chunks in the pattern
+        """
+        return int(self.chunk_dwells.sum())
+
+    @property
+    def total_pixels(self) -> int:
+        """
+        Number of pixels in the pattern, and so the number of values returned
+        by the instrument if the pattern is executed with output enabled
+        """
+        return int(self.chunk_pixels.sum())
+
+    def iter_chunks(self):
+        """
+        Yields:
+            tuple[memoryview, int, int]: The commands in each chunk, the total dwell time of that chunk, \
+                and the number of pixels in that chunk
+        """
+        stream = memoryview(self.stream)
+        ends = [*self.chunk_offsets[1:], len(stream)]
+        for start, end, dwell, pixels in zip(self.chunk_offsets, ends, self.chunk_dwells, self.chunk_pixels):
+            yield stream[int(start):int(end)], int(dwell), int(pixels)
+
+    def save(self, path):
+        """
+        Write the pattern to a file.
+
+        Args:
+            path: Path to the ``.obip`` file to create
+        """
+        with open(path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, self.content_hash,
+                self.total_dwell, self.total_pixels, len(self), len(self.stream)))
+            f.write(self.chunk_offsets.astype("<u8").tobytes())
+            f.write(self.chunk_dwells.astype("<u8").tobytes())
+            f.write(self.chunk_pixels.astype("<u8").tobytes())
+            f.write(self.stream)
+        self._logger.debug(f"saved {self!r} to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a pattern file. The command stream is not copied into memory,
+        and is paged in from the file as it is sent.
+
+        Args:
+            path: Path to an ``.obip`` file
+
+        Returns:
+            :class:`PatternFile`
+
+        Raises:
+            ValueError: If the file is not a pattern file, or was written by an incompatible version
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < cls.HEADER.size:
+            mm.close()
+            raise ValueError(f"{path} is too short to be a pattern file")
+        magic, version, _, content_hash, total_dwell, total_pixels, chunk_count, stream_length = \
+            cls.HEADER.unpack_from(mm)
+        if magic != cls.MAGIC:
+            mm.close()
+            raise ValueError(f"{path} is not a pattern file")
+        if version != cls.VERSION:
+            mm.close()
+            raise ValueError(f"{path} has pattern file version {version}, expected {cls.VERSION}")
+        offset = cls.HEADER.size
+        # the index is small; copy it so that only the stream holds a reference to the mapping
+        chunk_offsets = np.frombuffer(mm, dtype="<u8", count=chunk_count, offset=offset).copy()
+        offset += chunk_count*8
+        chunk_dwells = np.frombuffer(mm, dtype="<u8", count=chunk_count, offset=offset).copy()
+        offset += chunk_count*8
+        chunk_pixels = np.frombuffer(mm, dtype="<u8", count=chunk_count, offset=offset).copy()
+        offset += chunk_count*8
+        if offset + stream_length != len(mm):
+            mm.close()
+            raise ValueError(f"{path} is truncated: expected {offset + stream_length} bytes, got {len(mm)} bytes")
+        pattern = cls(memoryview(mm)[offset:], chunk_offsets, chunk_dwells, chunk_pixels,
+            content_hash=content_hash)
+        pattern._mmap = mm
+        cls._logger.debug(f"loaded {pattern!r} from {path}")
+        return pattern
+
+    def close(self):
+        """
+        Release the memory map backing a pattern opened with :meth:`load`.
+        """
+        if self._mmap is not None:
+            self.stream.release()
+            self.stream = None
+            self._mmap.close()
+            self._mmap = None
+
+    @staticmethod
+    def hash_source(path, **params) -> bytes:
+        """
+        Hash an image file together with the parameters used to convert it.
+
+        Args:
+            path: Path to the source file
+            params: Conversion parameters, e.g. ``resolution=4096, max_dwell=8, invert=False``
+
+        Returns:
+            bytes: SHA-256 digest
+        """
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        h.update(repr(sorted(params.items())).encode())
+        return h.digest()
+
+
+class PatternCache:
+    """
+    A directory of compiled patterns, indexed by their content hash.
+
+    Args:
+        directory: Directory to store ``.obip`` files in. Created if it does not exist. \
+            Defaults to :meth:`default_directory`, so that every program run by the same user shares the cache.
+    """
+    _logger = logger.getChild("PatternCache")
+
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else self.default_directory()
+
+    @staticmethod
+    def default_directory() -> str:
+        """
+        Returns:
+            str: ``obi/patterns`` in the per-user cache directory: ``%LOCALAPPDATA%`` on Windows, \
+                and ``$XDG_CACHE_HOME`` (``~/.cache`` if unset) elsewhere
+        """
+        if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+            base = os.environ["LOCALAPPDATA"]
+        else:
+            base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, "obi", "patterns")
+
+    def path_for(self, content_hash:bytes) -> str:
+        return os.path.join(self.directory, f"{content_hash.hex()}.obip")
+
+    def get(self, content_hash:bytes) -> PatternFile | None:
+        """
+        Returns:
+            :class:`PatternFile` | None: The cached pattern, or None if there is no valid pattern for this hash
+        """
+        path = self.path_for(content_hash)
+        if not os.path.isfile(path):
+            return None
+        try:
+            pattern = PatternFile.load(path)
+        except ValueError as e:
+            self._logger.warning(f"ignoring cached pattern: {e}")
+            return None
+        if pattern.content_hash != content_hash:
+            self._logger.warning(f"ignoring cached pattern {path}: content hash does not match")
+            pattern.close()
+            return None
+        return pattern
+
+    def put(self, pattern:PatternFile):
+        """
+        Save a pattern into the cache.
+
+        Returns:
+            str: Path of the saved file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(pattern.content_hash)
+        pattern.save(path)
+        return path
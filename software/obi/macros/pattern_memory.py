@@ -0,0 +1,113 @@
+import asyncio
+
+import numpy as np
+
+from obi.commands import *
+from .synchronize import SynchronizeMixin
+
+class PatternReplayMacro(SynchronizeMixin, BaseCommand):
+    def __init__(self, x_coords, y_coords, dwells, *, passes:int, cookie:u16, dwell_scales=None,
+                 address:int=0, output_mode:OutputMode=OutputMode.NoOutput, passes_per_chunk:int=16):
+        """
+        Load a list of vector points into the pattern memory of the instrument once,
+        and replay it for a number of passes, instead of sending every point for every pass.
+
+        Passes are replayed in chunks of at most ``passes_per_chunk``, each followed by
+        a :class:`SynchronizeCommand` that the instrument answers once the chunk has been executed.
+        When :attr:`abort` is set, no further chunks are sent and the beam is blanked.
+
+        Args:
+            x_coords: Array of X coordinates (u14)
+            y_coords: Array of Y coordinates (u14)
+            dwells: Array of dwell times (u16)
+            passes: Number of passes over the points
+            cookie (u16):
+            dwell_scales (list[float], optional): Factor that the dwell times are multiplied by in each pass. \
+                Each pass is then replayed as a separate chunk. Defaults to 1 for every pass.
+            address (int, optional): First point of the pattern memory to use. Defaults to 0.
+            output_mode (OutputMode, optional): Defaults to OutputMode.NoOutput.
+            passes_per_chunk (int, optional): Number of passes to replay between acknowledgements. Defaults to 16.
+
+        Raises:
+            ValueError: If the points do not fit in the pattern memory
+
+        Attributes:
+            completed_passes (int): Number of passes the instrument has finished executing
+            abort (asyncio.Event): Set to stop replaying the pattern
+        """
+        self._x_coords = np.asarray(x_coords, dtype=np.uint16)
+        self._y_coords = np.asarray(y_coords, dtype=np.uint16)
+        self._dwells = np.asarray(dwells, dtype=np.uint16)
+        if not (len(self._x_coords) == len(self._y_coords) == len(self._dwells)):
+            raise ValueError("coordinates and dwell times must have the same length")
+        if len(self._dwells) == 0 or address + len(self._dwells) > PATTERN_MEMORY_DEPTH:
+            raise ValueError(f"pattern of {len(self._dwells)} points at address {address} "
+                             f"does not fit in pattern memory of {PATTERN_MEMORY_DEPTH} points")
+        if dwell_scales is not None and len(dwell_scales) != passes:
+            raise ValueError(f"expected {passes} dwell scales, got {len(dwell_scales)}")
+        self._passes = passes
+        self._cookie = cookie
+        self._dwell_scales = dwell_scales
+        self._address = address
+        self._output_mode = output_mode
+        self._passes_per_chunk = passes_per_chunk
+        self.completed_passes = 0
+        self.abort = asyncio.Event()
+
+    def __repr__(self):
+        return f"PatternReplayMacro: points={len(self._dwells)}, passes={self._passes}, cookie={self._cookie}"
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the passes that have been executed, from 0 to 1
+        """
+        if self._passes == 0:
+            return 1.
+        return self.completed_passes/self._passes
+
+    def _load(self) -> bytes:
+        points = np.empty(len(self._dwells), dtype=">u2, >u2, >u2")
+        points["f0"], points["f1"], points["f2"] = self._x_coords, self._y_coords, self._dwells
+        return bytes(PatternLoadCommand(address=self._address, length=len(self._dwells) - 1)) + \
+            bytes(ArrayCommand(cmdtype=CmdType.VectorPixel, array_length=len(self._dwells) - 1)) + \
+            points.tobytes()
+
+    def _iter_chunks(self):
+        length = len(self._dwells) - 1
+        if self._dwell_scales is not None:
+            for scale in self._dwell_scales:
+                yield bytes(PatternReplayCommand(address=self._address, length=length, scale=fp8_8(scale))), 1
+        else:
+            for start in range(0, self._passes, self._passes_per_chunk):
+                passes = min(self._passes_per_chunk, self._passes - start)
+                yield bytes(PatternReplayCommand(address=self._address, length=length, repeat=passes - 1)), passes
+
+    @BaseCommand.log_transfer
+    async def transfer(self, stream):
+        """
+        Yields:
+            tuple[int, array.array | None]: :attr:`completed_passes`, and the pixel values of the passes \
+                that were just completed if output is enabled
+        """
+        await stream.write(self._synchronize(self._output_mode))
+        await stream.flush()
+        await self._recv_sync(stream)
+        ## loading does not execute the points, so it produces no pixels
+        await stream.write(self._load() + self._synchronize(self._output_mode))
+        await stream.flush()
+        await self._recv_sync(stream)
+        for commands, passes in self._iter_chunks():
+            if self.abort.is_set():
+                ## go to a blanked state after an aborted pattern
+                await stream.write(bytes(BlankCommand(enable=True, inline=False)) + self._synchronize(self._output_mode))
+                await stream.flush()
+                await self._recv_sync(stream)
+                break
+            await stream.write(commands + self._synchronize(self._output_mode))
+            await stream.flush()
+            res = await self.recv_res(passes*len(self._dwells), stream, self._output_mode)
+            await self._recv_sync(stream)
+            self.completed_passes += passes
+            self._logger.debug(f"completed {self.completed_passes}/{self._passes} passes")
+            yield self.completed_passes, res
@@ -1,13 +1,19 @@
 import asyncio
+import array
 import struct
+from dataclasses import dataclass
+
+import numpy as np
 
 from obi.commands import *
+from .synchronize import SynchronizeMixin
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
 class RasterScanCommand(BaseCommand):
     def __init__(self, x_range: DACCodeRange, y_range: DACCodeRange, dwell_time:DwellTime, cookie: u16,
-        output_mode:OutputMode=OutputMode.SixteenBit, frame_blank=True):
+        output_mode:OutputMode=OutputMode.SixteenBit, frame_blank=True, serpentine=False,
+        line_sync=False, frame_sync=False):
         """
         Scan a frame and return data using a combination of :class:`RasterRegionCommand` and :class:`RasterPixelRunCommand`.
 
@@ -18,6 +24,11 @@ class RasterScanCommand(BaseCommand):
             cookie (u16):
             output_mode (OutputMode, optional): Defaults to OutputMode.SixteenBit.
             frame_blank (bool, optional): Start frame from a blanked state and return to a blanked state. Defaults to True.
+            serpentine (bool, optional): Scan every other line from right to left, without flyback. \
+                Pixels of those lines are returned in scan order. Defaults to False.
+            line_sync (bool, optional): Start every line on the line trigger of the instrument, \
+                to lock the scan to mains interference. Defaults to False.
+            frame_sync (bool, optional): Start the frame on the frame trigger of the instrument. Defaults to False.
         """
         self._x_range = x_range
         self._y_range = y_range
@@ -25,11 +36,15 @@ class RasterScanCommand(BaseCommand):
         self._cookie = cookie
         self._output_mode = output_mode
         self.frame_blank = frame_blank
+        self.serpentine = serpentine
+        self.line_sync = line_sync
+        self.frame_sync = frame_sync
         self.abort = asyncio.Event()
     
     def __repr__(self):
         return f"RasterScanCommand: x_range={self._x_range}, y_range={self._y_range}, \
-                dwell={self._dwell}, cookie={self._cookie}, output_mode={self._output_mode}"
+                dwell={self._dwell}, cookie={self._cookie}, output_mode={self._output_mode}, serpentine={self.serpentine}, \
+                line_sync={self.line_sync}, frame_sync={self.frame_sync}"
     def _iter_chunks(self, latency):
         commands = bytearray()
 
@@ -73,7 +88,7 @@ class RasterScanCommand(BaseCommand):
             for commands, pixel_count in self._iter_chunks(latency):
                 self._logger.debug(f"sender: tokens={tokens}")
                 if tokens == 0:
-                    await FlushCommand().transfer(stream)
+                    await stream.flush()
                     await token_fut
                 if self.frame_blank and self.abort.is_set():
                     ## go to a blanked state after an aborted frame
@@ -83,13 +98,18 @@ class RasterScanCommand(BaseCommand):
                 if self.abort.is_set():
                     break
                 await asyncio.sleep(0)
-            await FlushCommand().transfer(stream)
+            if self._output_mode in PACKED_OUTPUT_MODES:
+                ## makes the device send the last partial byte
+                await stream.write(bytes(SynchronizeCommand(cookie=self._cookie, raster=True, output=self._output_mode)))
+            await stream.flush()
 
         await SynchronizeCommand(cookie=self._cookie, raster=True, output = self._output_mode).transfer(stream)
-        await RasterRegionCommand(x_range=self._x_range, y_range=self._y_range).transfer(stream)
+        await RasterRegionCommand(x_range=self._x_range, y_range=self._y_range, serpentine=self.serpentine,
+                                  line_sync=self.line_sync, frame_sync=self.frame_sync).transfer(stream)
         asyncio.create_task(sender())
 
         cookie = await stream.read(4) #just assume these are exactly FFFF + cookie, and discard them
+        self._reset_unpacker()
         ## TODO: assert against synchronization result
         for commands, pixel_count in self._iter_chunks(latency):
             tokens += 1
@@ -101,8 +121,212 @@ class RasterScanCommand(BaseCommand):
                     break
             self._logger.debug(f"recver: tokens={tokens}")
             yield await self.recv_res(pixel_count, stream, self._output_mode)
+        else:
+            await self.recv_packed_end(stream, self._output_mode)
         ## fly back
         # await VectorPixelCommand(x_coord=self._x_range.start, y_coord=self._y_range.start, dwell_time=1).transfer(stream)
 
 
+@dataclass
+class ScanRegion:
+    """
+    A region to be scanned by :class:`MultiRegionScanCommand`.
+
+    Args:
+        x_range: X range of the region
+        y_range: Y range of the region
+        dwell_time: Pixel dwell time within the region
+    """
+    x_range: DACCodeRange
+    y_range: DACCodeRange
+    dwell_time: DwellTime
+
+    @property
+    def pixels(self) -> int:
+        return self.x_range.count * self.y_range.count
+
+
+class MultiRegionScanCommand(BaseCommand):
+    def __init__(self, regions:list[ScanRegion], cookie: u16,
+        output_mode:OutputMode=OutputMode.SixteenBit, frame_blank=True):
+        """
+        Scan several regions back to back, each with its own dwell time, after a single :class:`SynchronizeCommand`.
+
+        Each region is scanned with a :class:`RasterRegionCommand` followed by :class:`RasterPixelRunCommand`,
+        as in :class:`RasterScanCommand`. Chunks of pixels never span more than one region,
+        so each chunk returned can be attributed to the region it was scanned in.
+
+        Args:
+            regions (list[ScanRegion]): Regions to scan, in order
+            cookie (u16):
+            output_mode (OutputMode, optional): Defaults to OutputMode.SixteenBit.
+            frame_blank (bool, optional): Return to a blanked state after the last region. Defaults to True.
+        """
+        self._regions = regions
+        self._cookie = cookie
+        self._output_mode = output_mode
+        self.frame_blank = frame_blank
+        self.abort = asyncio.Event()
+        self._prepared = None
+
+    def __repr__(self):
+        return f"MultiRegionScanCommand: regions={self._regions}, cookie={self._cookie}, output_mode={self._output_mode}"
+
+    def prepare(self, latency:int=65536*65536):
+        """
+        Encode every chunk of the scan ahead of time, so that a :meth:`transfer` with the same ``latency``
+        can start sending immediately. May be called from a thread other than the one running the event loop.
+        """
+        self._prepared = latency, list(self._encode_chunks(latency))
+
+    def _iter_chunks(self, latency):
+        if self._prepared is not None and self._prepared[0] == latency:
+            return iter(self._prepared[1])
+        return self._encode_chunks(latency)
+
+    def _encode_chunks(self, latency):
+        for index, region in enumerate(self._regions):
+            commands = bytearray(bytes(RasterRegionCommand(x_range=region.x_range, y_range=region.y_range)))
+
+            def append_command(pixel_count):
+                while pixel_count > 65536:
+                    cmd = RasterPixelRunCommand(dwell_time = region.dwell_time, length=65535)
+                    commands.extend(bytes(cmd))
+                    pixel_count -= 65536
+                cmd = RasterPixelRunCommand(dwell_time = region.dwell_time, length=pixel_count-1)
+                commands.extend(bytes(cmd))
+
+            pixel_count = 0
+            total_dwell = 0
+            for n in range(region.pixels):
+                pixel_count += 1
+                total_dwell += region.dwell_time
+                if total_dwell >= latency or n + 1 == region.pixels:
+                    append_command(pixel_count)
+                    ## blank at the end of the last pixel of the last region
+                    if self.frame_blank and n + 1 == region.pixels and index + 1 == len(self._regions):
+                        commands.extend(bytes(BlankCommand(enable=True, inline=False)))
+                    yield commands, index, pixel_count
+                    commands = bytearray()
+                    pixel_count = 0
+                    total_dwell = 0
+
+    @BaseCommand.log_transfer
+    async def transfer(self, stream, *, latency:int=65536*65536):
+        """
+        Yields:
+            tuple[int, array.array]: Index of a region, and a chunk of pixels scanned in that region
+        """
+        self._logger.debug(f"transfer - {latency=}")
+        MAX_PIPELINE = 32
+
+        tokens = MAX_PIPELINE
+        token_fut = asyncio.Future()
+
+        async def sender():
+            nonlocal tokens
+            for commands, index, pixel_count in self._iter_chunks(latency):
+                self._logger.debug(f"sender: tokens={tokens}")
+                if tokens == 0:
+                    await stream.flush()
+                    await token_fut
+                if self.frame_blank and self.abort.is_set():
+                    ## go to a blanked state after an aborted scan
+                    commands.extend(bytes(BlankCommand(enable=True, inline=False)))
+                await stream.write(commands)
+                tokens -= 1
+                if self.abort.is_set():
+                    break
+                await asyncio.sleep(0)
+            if self._output_mode in PACKED_OUTPUT_MODES:
+                ## makes the device send the last partial byte
+                await stream.write(bytes(SynchronizeCommand(cookie=self._cookie, raster=True, output=self._output_mode)))
+            await stream.flush()
+
+        await SynchronizeCommand(cookie=self._cookie, raster=True, output = self._output_mode).transfer(stream)
+        asyncio.create_task(sender())
+
+        cookie = await stream.read(4) #just assume these are exactly FFFF + cookie, and discard them
+        self._reset_unpacker()
+        for commands, index, pixel_count in self._iter_chunks(latency):
+            tokens += 1
+            if tokens == 1:
+                token_fut.set_result(None)
+                token_fut = asyncio.Future()
+            if tokens == MAX_PIPELINE + 1:
+                if self.abort.is_set():
+                    break
+            self._logger.debug(f"recver: tokens={tokens}")
+            yield index, await self.recv_res(pixel_count, stream, self._output_mode)
+        else:
+            await self.recv_packed_end(stream, self._output_mode)
+
+
+class FreeRunScanCommand(SynchronizeMixin, BaseCommand):
+    def __init__(self, x_range: DACCodeRange, y_range: DACCodeRange, dwell_time:DwellTime, cookie: u16,
+        serpentine=False):
+        """
+        Scan frames continuously with a single :class:`RasterPixelFreeRunCommand`, for live view.
+
+        Once the scan has started, no commands are sent until :attr:`abort` is set, and there is no gap between frames.
+        The device sends a :data:`FRAME_MARKER` before the first pixel of every frame,
+        which is used to tell where each frame starts. Pixels are always 16-bit.
+
+        When :attr:`abort` is set, the scan stops at the next chunk, the beam is blanked,
+        and the remaining pixels are discarded up to the synchronization response.
+
+        Args:
+            x_range (DACCodeRange):
+            y_range (DACCodeRange):
+            dwell_time (DwellTime):
+            cookie (u16):
+            serpentine (bool, optional): Scan every other line from right to left, without flyback. Defaults to False.
+
+        Attributes:
+            abort (asyncio.Event): Set to stop scanning
+        """
+        self._x_range = x_range
+        self._y_range = y_range
+        self._dwell = dwell_time
+        self._cookie = cookie
+        self.serpentine = serpentine
+        self.abort = asyncio.Event()
+
+    def __repr__(self):
+        return f"FreeRunScanCommand: x_range={self._x_range}, y_range={self._y_range}, \
+                dwell={self._dwell}, cookie={self._cookie}, serpentine={self.serpentine}"
+
+    @BaseCommand.log_transfer
+    async def transfer(self, stream, *, chunk_size:int=16384):
+        """
+        Args:
+            chunk_size: Number of words to read at once
+
+        Yields:
+            tuple[bool, array.array]: Pixels, and whether they start at the top of a new frame. \
+                Pixels received before the first frame marker are dropped.
+        """
+        await stream.write(self._synchronize(OutputMode.SixteenBit, raster=True))
+        await stream.flush()
+        await self._recv_sync(stream)
+        ## any command after this one would end the scan, so pixels are sent by the flush timer instead
+        await stream.write(
+            bytes(RasterRegionCommand(x_range=self._x_range, y_range=self._y_range, serpentine=self.serpentine)) +
+            bytes(RasterPixelFreeRunCommand(dwell_time=self._dwell)))
+        await stream.flush()
+
+        locked = False
+        while not self.abort.is_set():
+            words = await self.recv_res(chunk_size, stream, OutputMode.SixteenBit)
+            segments = np.split(np.asarray(words), np.flatnonzero(np.asarray(words) == FRAME_MARKER))
+            for index, segment in enumerate(segments):
+                frame_start = index > 0
+                pixels = segment[1:] if frame_start else segment
+                locked = locked or frame_start
+                if locked:
+                    yield frame_start, array.array('H', pixels.astype(np.uint16).tobytes())
 
+        ## the next command ends the free-running scan
+        await stream.write(bytes(BlankCommand(enable=True, inline=False)) + self._synchronize(OutputMode.SixteenBit, raster=True))
+        await stream.flush()
+        await stream.readuntil(struct.pack(">HH", 0xffff, self._cookie))
@@ -0,0 +1,125 @@
+import datetime
+import enum
+import json
+import queue
+import threading
+
+import numpy as np
+import tifffile
+
+from obi.commands import *
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["FrameRecorder"]
+
+def _to_json(value):
+    if isinstance(value, DACCodeRange):
+        return {"start": value.start, "count": value.count, "step": value.step}
+    if isinstance(value, enum.Enum):
+        return value.name
+    raise TypeError(f"{value!r} is not JSON serializable")
+
+
+class FrameRecorder:
+    """
+    Append frames to a multi-page TIFF file from a background thread.
+
+    Each frame is queued in a bounded queue, and copied into one page by the writer thread, whose description holds
+    the timestamp and scan parameters of the frame as JSON. Recording never waits for the disk:
+    if the queue is full, the frame is dropped and counted in :attr:`dropped`.
+
+    Args:
+        path: Path of the TIFF file to create
+        max_queue: Number of frames that can wait to be written
+        compression: Compression of each page, as in :meth:`tifffile.TiffWriter.write`, such as ``"zlib"``
+
+    Attributes:
+        recorded (int): Number of frames written
+        dropped (int): Number of frames dropped because the queue was full
+        error (Exception | None): Error that stopped the writer thread
+
+    Example:
+        >>> fb.recorder = FrameRecorder("live.tif")
+        >>> async for frame in fb.capture_live(x_res=512, y_res=512, dwell_time=1):
+        >>>     ...
+        >>> fb.recorder.close()
+    """
+    _logger = logger.getChild("FrameRecorder")
+
+    def __init__(self, path:str, *, max_queue:int=16, compression:str|None=None):
+        self.path = path
+        self.compression = compression
+        self.recorded = 0
+        self.dropped = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._index = 0
+        self._thread = threading.Thread(target=self._run, name="FrameRecorder", daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return f"FrameRecorder: {self.path}, {self.recorded} recorded, {self.dropped} dropped"
+
+    def record(self, lines, **scan_parameters) -> bool:
+        """
+        Queue a completed frame to be written. Never blocks.
+
+        Args:
+            lines: 2D array of the pixels of the frame, or a list of bands of lines that make up the frame, \
+                of :class:`np.uint16`, or :class:`np.uint8` for the high byte of each pixel. \
+                They are copied by the writer thread, so they must not be modified once recorded.
+            scan_parameters: Parameters the frame was scanned with, such as ``x_range`` and ``dwell_time``, \
+                stored in the description of its page
+
+        Returns:
+            bool: True if the frame was queued, False if it was dropped
+        """
+        if self._closed or self.error is not None:
+            return False
+        ## dropped frames leave gaps in the index
+        description = {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "index": self._index,
+            **scan_parameters
+        }
+        self._index += 1
+        try:
+            self._queue.put_nowait((lines, description))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self._logger.debug(f"queue full, dropped frame ({self.dropped} dropped)")
+            return False
+
+    def _run(self):
+        try:
+            with tifffile.TiffWriter(self.path, bigtiff=True) as tif:
+                while (item := self._queue.get()) is not None:
+                    lines, description = item
+                    canvas = np.concatenate(lines) if isinstance(lines, list) else np.array(lines)
+                    if canvas.dtype == np.uint8:
+                        canvas = np.left_shift(canvas.astype(np.uint16), 8)
+                    tif.write(canvas, description=json.dumps(description, default=_to_json), metadata=None,
+                              datetime=datetime.datetime.fromisoformat(description["timestamp"]),
+                              compression=self.compression)
+                    self.recorded += 1
+        except Exception as e:
+            self._logger.error(f"recording to {self.path} stopped: {e}")
+            self.error = e
+            ## keep draining the queue, so that close() does not wait forever
+            while self._queue.get() is not None:
+                pass
+
+    def close(self):
+        """
+        Write the frames that are still queued, and close the file. Blocks until done.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._logger.debug(f"closed {self!r}")
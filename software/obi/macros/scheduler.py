@@ -0,0 +1,422 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import json
+import os
+from dataclasses import dataclass, field
+
+import tifffile
+
+from obi.commands import *
+from obi.transfer import Connection, TransferError
+from .raster import MultiRegionScanCommand, ScanRegion
+from .frame_buffer import Frame
+from .pattern import PatternWriteCommand
+from .pattern_file import PatternFile
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["JobState", "Job", "ScanJob", "PatternJob", "AcquisitionScheduler"]
+
+class JobState(enum.Enum):
+    Queued = "queued"
+    Running = "running"
+    Done = "done"
+    Failed = "failed"
+    Cancelled = "cancelled"
+
+
+@dataclass(kw_only=True)
+class Job:
+    """
+    A unit of work for :class:`AcquisitionScheduler`.
+
+    Args:
+        priority: Jobs with a higher priority run first. Jobs of equal priority run in the order they were submitted.
+        name: Name of the job, used in logs and to name saved files
+
+    Attributes:
+        state (JobState):
+        error (str | None): Reason the job failed
+    """
+    priority: int = 0
+    name: str = ""
+    state: JobState = JobState.Queued
+    error: str | None = None
+
+    _kinds = {}
+
+    def __init_subclass__(cls, kind:str, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.kind = kind
+        Job._kinds[kind] = cls
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "priority": self.priority, "name": self.name}
+
+    @classmethod
+    def from_dict(cls, data:dict) -> "Job":
+        data = dict(data)
+        return Job._kinds[data.pop("kind")]._from_dict(data)
+
+
+def _range_to_dict(dac_range:DACCodeRange) -> dict:
+    return {"start": dac_range.start, "count": dac_range.count, "step": dac_range.step}
+
+
+@dataclass(kw_only=True)
+class ScanJob(Job, kind="scan"):
+    """
+    Scan one or more regions, and capture each into a :class:`Frame`.
+    A single frame, a set of ROIs, and a series of repeated frames are all scan jobs.
+
+    Args:
+        regions: Regions to scan, in order
+        repeat: Number of times to scan all regions
+        save_dir: If given, each frame is saved to this directory as a 16-bit TIFF file once the job is done
+
+    Attributes:
+        frames (list[Frame]): One frame for each region of each repetition, filled as the job runs
+    """
+    regions: list[ScanRegion]
+    repeat: int = 1
+    save_dir: str | None = None
+    frames: list[Frame] = field(default_factory=list, repr=False)
+
+    @classmethod
+    def frame(cls, x_range:DACCodeRange, y_range:DACCodeRange, dwell_time:DwellTime, **kwargs):
+        """
+        Scan a single frame.
+        """
+        return cls(regions=[ScanRegion(x_range=x_range, y_range=y_range, dwell_time=dwell_time)], **kwargs)
+
+    @property
+    def scan_regions(self) -> list[ScanRegion]:
+        return self.regions*self.repeat
+
+    def to_dict(self) -> dict:
+        return {
+            **super().to_dict(),
+            "regions": [{
+                "x_range": _range_to_dict(region.x_range),
+                "y_range": _range_to_dict(region.y_range),
+                "dwell_time": region.dwell_time,
+            } for region in self.regions],
+            "repeat": self.repeat,
+            "save_dir": self.save_dir,
+        }
+
+    @classmethod
+    def _from_dict(cls, data:dict):
+        data["regions"] = [ScanRegion(
+            x_range=DACCodeRange(**region["x_range"]),
+            y_range=DACCodeRange(**region["y_range"]),
+            dwell_time=region["dwell_time"]
+        ) for region in data["regions"]]
+        return cls(**data)
+
+
+@dataclass(kw_only=True)
+class PatternJob(Job, kind="pattern"):
+    """
+    Write a compiled pattern.
+
+    Args:
+        path: Path of a :class:`PatternFile`
+
+    Attributes:
+        elapsed_dwell (int): Total dwell time of the part of the pattern that has been written
+    """
+    path: str
+    elapsed_dwell: int = 0
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "path": self.path}
+
+    @classmethod
+    def _from_dict(cls, data:dict):
+        return cls(**data)
+
+
+class AcquisitionScheduler:
+    """
+    Run acquisition jobs on a :class:`Connection` in order of priority, keeping the beam busy between jobs.
+
+    While a job runs, the commands of the job expected to run next are encoded in an executor,
+    so that it can start as soon as the current job is done. Consecutive scan jobs are chained into
+    a single :class:`MultiRegionScanCommand`, so that they run back to back after one synchronization,
+    and the beam is only blanked after the last of them. Frames are saved in the executor as well.
+
+    If ``state_path`` is given, the queue is saved to it every time it changes.
+    Jobs that were queued or running when it was saved can be resubmitted with :meth:`load_state`.
+
+    Args:
+        conn: Connection to run jobs on
+        state_path: Path of a JSON file to save the queue to
+        chain_limit: Maximum number of scan jobs to chain together
+        latency: Latency of scan commands, as in :meth:`FrameBuffer.capture_frame`
+        executor: :class:`concurrent.futures.Executor` to encode commands and save frames in. \
+            Defaults to the default executor of the event loop.
+
+    Attributes:
+        history (list[Job]): Jobs that have finished running, in the order they finished
+
+    Example:
+        >>> scheduler = AcquisitionScheduler(conn, state_path="queue.json")
+        >>> scheduler.submit(ScanJob.frame(x_range, y_range, dwell_time=8, repeat=100, save_dir="series"))
+        >>> scheduler.submit(PatternJob(path="pattern.obip", priority=1))
+        >>> await scheduler.run()
+    """
+    _logger = logger.getChild("AcquisitionScheduler")
+
+    def __init__(self, conn:Connection, *, state_path:str|None=None, chain_limit:int=16,
+                 latency:int=65536, executor=None):
+        self.conn = conn
+        self.state_path = state_path
+        self.chain_limit = chain_limit
+        self.latency = latency
+        self.executor = executor
+        self.history = []
+        self._queue = []
+        self._order = itertools.count()
+        self._running = []
+        self._command = None
+        self._prepared = {}
+        self._saving = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def __repr__(self):
+        return f"AcquisitionScheduler: {len(self._queue)} queued, {len(self._running)} running, {len(self.history)} finished"
+
+    @property
+    def pending(self) -> list[Job]:
+        """
+        Queued jobs, in the order they will run
+        """
+        return [job for _, _, job in sorted(self._queue)]
+
+    @property
+    def running(self) -> list[Job]:
+        return list(self._running)
+
+    def submit(self, job:Job) -> Job:
+        """
+        Add a job to the queue.
+
+        Returns:
+            The job
+        """
+        job.state = JobState.Queued
+        heapq.heappush(self._queue, (-job.priority, next(self._order), job))
+        self._logger.debug(f"submit {job!r}")
+        self.save_state()
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job:Job) -> bool:
+        """
+        Remove a queued job from the queue. Use :meth:`abort` to stop a running job.
+
+        Returns:
+            True if the job was queued
+        """
+        for entry in self._queue:
+            if entry[2] is job:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                job.state = JobState.Cancelled
+                for key in [key for key in self._prepared if id(job) in key]:
+                    self._release_prepared(self._prepared.pop(key))
+                self.history.append(job)
+                self.save_state()
+                return True
+        return False
+
+    def abort(self):
+        """
+        Stop the running jobs, leaving the beam blanked. Queued jobs continue to run.
+        """
+        if self._command is not None:
+            self._command.abort.set()
+
+    def stop(self):
+        """
+        Make :meth:`run` return once the running jobs are done.
+        """
+        self._stopping = True
+        self._wakeup.set()
+
+    def _next_batch(self) -> list[Job]:
+        candidates = [job for _, _, job in heapq.nsmallest(self.chain_limit, self._queue)]
+        if not candidates:
+            return []
+        batch = [candidates[0]]
+        if isinstance(batch[0], ScanJob):
+            for job in candidates[1:]:
+                if not isinstance(job, ScanJob):
+                    break
+                batch.append(job)
+        return batch
+
+    def _encode(self, batch:list[Job], cookie:int):
+        if isinstance(batch[0], ScanJob):
+            command = MultiRegionScanCommand(
+                regions=[region for job in batch for region in job.scan_regions], cookie=cookie)
+            command.prepare(self.latency)
+        else:
+            command = PatternWriteCommand(PatternFile.load(batch[0].path), cookie=cookie)
+        return command
+
+    def _prepare(self, batch:list[Job]) -> asyncio.Future:
+        key = tuple(id(job) for job in batch)
+        if key not in self._prepared:
+            self._logger.debug(f"prepare {[job.name for job in batch]}")
+            loop = asyncio.get_running_loop()
+            self._prepared[key] = loop.run_in_executor(self.executor, self._encode, batch, self.conn.get_cookie())
+        return self._prepared[key]
+
+    @staticmethod
+    def _release_prepared(future:asyncio.Future):
+        """
+        Close the pattern of a prepared command that will not run, once it has been encoded.
+        """
+        def close(future):
+            if not future.cancelled() and future.exception() is None:
+                command = future.result()
+                if isinstance(command, PatternWriteCommand):
+                    command._pattern.close()
+        future.add_done_callback(close)
+
+    def _evict_prepared(self):
+        for future in self._prepared.values():
+            self._release_prepared(future)
+        self._prepared.clear()
+
+    async def _run_scans(self, batch:list[ScanJob], command:MultiRegionScanCommand):
+        targets = []
+        for job in batch:
+            job.frames = [Frame.from_DAC_ranges(region.x_range, region.y_range) for region in job.scan_regions]
+            targets += job.frames
+        filled = [0]*len(targets)
+
+        await self.conn.transfer(BlankCommand(enable=False, inline=True))
+        async for index, chunk in self.conn.transfer_multiple(command, latency=self.latency):
+            frame = targets[index]
+            frame.canvas.reshape(-1)[filled[index]:filled[index] + len(chunk)] = chunk
+            filled[index] += len(chunk)
+
+    async def _run_pattern(self, job:PatternJob, command:PatternWriteCommand):
+        try:
+            async for elapsed_dwell, _ in self.conn.transfer_multiple(command):
+                job.elapsed_dwell = elapsed_dwell
+        finally:
+            command._pattern.close()
+
+    def _save_frames(self, job:ScanJob):
+        loop = asyncio.get_running_loop()
+        def save():
+            os.makedirs(job.save_dir, exist_ok=True)
+            for index, frame in enumerate(job.frames):
+                tifffile.imwrite(os.path.join(job.save_dir, f"{job.name or 'scan'}_{index:04d}.tif"), frame.as_uint16())
+        future = loop.run_in_executor(self.executor, save)
+        self._saving.add(future)
+        future.add_done_callback(self._saving.discard)
+
+    async def run(self, *, forever:bool=False):
+        """
+        Run queued jobs.
+
+        Args:
+            forever: Wait for new jobs when the queue is empty, until :meth:`stop` is called. \
+                Otherwise, return when the queue is empty.
+        """
+        self._stopping = False
+        while not self._stopping:
+            if not self._queue:
+                if not forever:
+                    break
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            batch = self._next_batch()
+            for job in batch:
+                self._queue.remove(next(entry for entry in self._queue if entry[2] is job))
+            heapq.heapify(self._queue)
+            self._running = batch
+            for job in batch:
+                job.state = JobState.Running
+            self.save_state()
+
+            try:
+                command = await self._prepare(batch)
+                ## anything else that was prepared may no longer be next in line
+                del self._prepared[tuple(id(job) for job in batch)]
+                self._evict_prepared()
+                following = self._next_batch()
+                if following:
+                    self._prepare(following)
+                self._command = command
+                self._logger.debug(f"run {[job.name for job in batch]}")
+                if isinstance(command, MultiRegionScanCommand):
+                    await self._run_scans(batch, command)
+                else:
+                    await self._run_pattern(batch[0], command)
+            except (TransferError, OSError, ValueError) as e:
+                self._logger.warning(f"jobs {[job.name for job in batch]} failed: {e}")
+                self._evict_prepared()
+                for job in batch:
+                    job.state = JobState.Failed
+                    job.error = str(e)
+            else:
+                aborted = command.abort.is_set()
+                for job in batch:
+                    job.state = JobState.Cancelled if aborted else JobState.Done
+                    if not aborted and isinstance(job, ScanJob) and job.save_dir is not None:
+                        self._save_frames(job)
+            finally:
+                self._command = None
+                self._running = []
+                self.history.extend(batch)
+                self.save_state()
+
+        self._evict_prepared()
+        if self._saving:
+            await asyncio.gather(*self._saving)
+
+    def save_state(self, path:str|None=None):
+        """
+        Save the running and queued jobs as JSON.
+
+        Args:
+            path: Defaults to ``state_path``. If neither is given, nothing is saved.
+        """
+        path = path or self.state_path
+        if path is None:
+            return
+        state = {
+            "jobs": [job.to_dict() for job in self._running + self.pending],
+            "history": [{"name": job.name, "kind": job.kind, "state": job.state.value, "error": job.error}
+                        for job in self.history],
+        }
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def load_state(self, path:str|None=None) -> list[Job]:
+        """
+        Submit the jobs that were running or queued when the state was saved.
+
+        Args:
+            path: Defaults to ``state_path``
+
+        Returns:
+            The jobs that were submitted
+        """
+        path = path or self.state_path
+        with open(path) as f:
+            state = json.load(f)
+        return [self.submit(Job.from_dict(data)) for data in state["jobs"]]
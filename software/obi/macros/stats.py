@@ -0,0 +1,144 @@
+import numpy as np
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["FrameStatistics"]
+
+class FrameStatistics:
+    """
+    Statistics of a frame, updated incrementally as bands of whole lines are received,
+    so that they can be read at any time without touching the full frame.
+
+    Sharpness is measured as gradient energy: the mean of the squared differences
+    between horizontally and vertically adjacent pixels. It increases as the image comes into focus,
+    and is suitable for comparing frames of the same region during a focus sweep.
+
+    Attributes:
+        histogram (np.ndarray): Number of pixels with each of the 65536 possible values
+        count (int): Number of pixels received
+        lines (int): Number of lines received
+        min (int | None): Smallest pixel value, or None if no pixels have been received
+        max (int | None): Largest pixel value, or None if no pixels have been received
+
+    Example:
+        >>> frame = await fb.capture_frame(x_range=r, y_range=r, dwell_time=dwell)
+        >>> low, high = fb.stats.auto_levels()
+        >>> score = fb.stats.sharpness
+    """
+    _logger = logger.getChild("FrameStatistics")
+
+    def __init__(self):
+        self.histogram = np.zeros(65536, dtype=np.int64)
+        self.reset()
+
+    def __repr__(self):
+        if self.count == 0:
+            return "FrameStatistics: empty"
+        return (f"FrameStatistics: {self.count} pixels in {self.lines} lines, "
+                f"range={self.min}..{self.max}, mean={self.mean:.1f}, std={self.std:.1f}, "
+                f"sharpness={self.sharpness:.1f}")
+
+    def reset(self):
+        """
+        Discard all statistics, before receiving a new frame.
+        """
+        self.histogram[:] = 0
+        self.count = 0
+        self.lines = 0
+        self.min = None
+        self.max = None
+        self._sum = 0
+        self._sum_sq = 0
+        self._gradient_sum = 0
+        self._gradient_count = 0
+        self._last_line = None
+
+    def update(self, lines:np.ndarray):
+        """
+        Add a band of lines, which continues the band that was added last.
+
+        Args:
+            lines: 2D array of :class:`np.uint16`, of shape (lines, pixels per line)
+        """
+        lines = np.asarray(lines)
+        if lines.size == 0:
+            return
+        if lines.ndim != 2:
+            raise ValueError(f"expected 2D array of lines, got {lines.ndim}D")
+        if self._last_line is not None and self._last_line.shape[0] != lines.shape[1]:
+            raise ValueError(f"expected lines of {self._last_line.shape[0]} pixels, got {lines.shape[1]} pixels")
+        self.histogram += np.bincount(lines.ravel(), minlength=65536)
+        self.count += lines.size
+        self.lines += lines.shape[0]
+        band_min, band_max = int(lines.min()), int(lines.max())
+        self.min = band_min if self.min is None else min(self.min, band_min)
+        self.max = band_max if self.max is None else max(self.max, band_max)
+
+        values = lines.astype(np.int64)
+        self._sum += int(values.sum())
+        self._sum_sq += int((values*values).sum())
+        dx = np.diff(values, axis=1)
+        ## the first line of this band is vertically adjacent to the last line of the previous band
+        if self._last_line is not None:
+            dy = np.diff(np.concatenate([self._last_line[None, :], values]), axis=0)
+        else:
+            dy = np.diff(values, axis=0)
+        self._gradient_sum += int((dx*dx).sum()) + int((dy*dy).sum())
+        self._gradient_count += dx.size + dy.size
+        self._last_line = values[-1]
+
+    @property
+    def mean(self) -> float:
+        if self.count == 0:
+            return 0.
+        return self._sum/self.count
+
+    @property
+    def variance(self) -> float:
+        if self.count == 0:
+            return 0.
+        ## computed from exact integer sums, so there is no loss of precision
+        return (self._sum_sq*self.count - self._sum*self._sum)/(self.count*self.count)
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    @property
+    def sharpness(self) -> float:
+        """
+        Gradient energy of the lines received so far
+        """
+        if self._gradient_count == 0:
+            return 0.
+        return self._gradient_sum/self._gradient_count
+
+    def percentile(self, q:float) -> int:
+        """
+        Args:
+            q: Percentile, from 0 to 100
+
+        Returns:
+            int: Smallest pixel value such that at least ``q`` percent of pixels are less than or equal to it
+        """
+        if self.count == 0:
+            return 0
+        cumulative = np.cumsum(self.histogram)
+        rank = max(1, int(np.ceil(q/100*self.count)))
+        return int(np.searchsorted(cumulative, rank))
+
+    def auto_levels(self, low:float=0.5, high:float=99.5) -> tuple[int, int]:
+        """
+        Display levels that stretch the contrast of the frame, ignoring outliers.
+
+        Args:
+            low: Percentile of pixels to display as black
+            high: Percentile of pixels to display as white
+
+        Returns:
+            tuple[int, int]: Black and white levels, as 16-bit pixel values
+        """
+        black = self.percentile(low)
+        white = self.percentile(high)
+        return black, max(white, black + 1)
@@ -0,0 +1,21 @@
+import struct
+
+from obi.commands import *
+from obi.transfer import TransferError
+
+
+class SynchronizeMixin:
+    """
+    Synchronization for macros that end batches of commands with a :class:`SynchronizeCommand`
+    carrying their ``_cookie``, and wait for its response before sending more.
+    """
+    def _synchronize(self, output_mode:OutputMode, *, raster:bool=False) -> bytes:
+        ## the device flushes its response to a synchronization without a `FlushCommand`
+        return bytes(SynchronizeCommand(cookie=self._cookie, raster=raster, output=output_mode))
+
+    async def _recv_sync(self, stream):
+        res = bytes(await stream.read(4))
+        expected = struct.pack(">HH", 0xffff, self._cookie)
+        if res != expected:
+            raise TransferError(f"expected synchronization {expected.hex()}, got {res.hex()}")
+        self._reset_unpacker()
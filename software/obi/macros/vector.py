@@ -2,10 +2,49 @@ import asyncio
 import struct
 import array
 
+import numpy as np
+
 from obi.commands import *
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
+#: Structured array layout of vector points, with the same fields as :class:`VectorPixelCommand`
+VECTOR_POINT = np.dtype([("x_coord", np.uint16), ("y_coord", np.uint16), ("dwell_time", np.uint16)])
+
+def encode_vector_pixels(x_coords, y_coords, dwells) -> np.ndarray:
+    """
+    Encode arrays of vector points as a packed command stream, without constructing
+    a :class:`VectorPixelCommand` for each point.
+
+    Points with a dwell time of 0 or 1 are encoded as :class:`VectorPixelMinDwellCommand` (5 bytes),
+    and all other points as :class:`VectorPixelCommand` (7 bytes), exactly as
+    :meth:`VectorPixelCommand.pack` does.
+
+    Args:
+        x_coords: Array of X coordinates (u14)
+        y_coords: Array of Y coordinates (u14)
+        dwells: Array of dwell times (u16)
+
+    Returns:
+        np.ndarray: uint8 array of the encoded commands
+    """
+    x_coords = np.asarray(x_coords, dtype=np.uint16)
+    y_coords = np.asarray(y_coords, dtype=np.uint16)
+    dwells = np.asarray(dwells, dtype=np.uint16)
+    min_dwell = dwells <= 1
+    encoded = np.empty((len(dwells), 7), dtype=np.uint8)
+    encoded[:, 0] = np.where(min_dwell, CmdType.VectorPixelMinDwell << 4, CmdType.VectorPixel << 4)
+    encoded[:, 1] = x_coords >> 8
+    encoded[:, 2] = x_coords & 0xff
+    encoded[:, 3] = y_coords >> 8
+    encoded[:, 4] = y_coords & 0xff
+    encoded[:, 5] = dwells >> 8
+    encoded[:, 6] = dwells & 0xff
+    ## drop the dwell time bytes of min dwell points
+    keep = np.ones(encoded.shape, dtype=bool)
+    keep[min_dwell, 5:] = False
+    return encoded[keep]
+
 def default_iter():
     for x in range(2048):
         for y in range(2048):
@@ -78,7 +117,7 @@ class VectorScanCommand(BaseCommand):
             for commands, pixel_count in self._iter_chunks(latency):
                 self._logger.debug(f"sender: tokens={tokens}")
                 if tokens == 0:
-                    await FlushCommand().transfer(stream)
+                    await stream.flush()
                     await token_fut
                 if self.abort.is_set():
                     ## go to a blanked state after an aborted frame
@@ -88,12 +127,16 @@ class VectorScanCommand(BaseCommand):
                 if self.abort.is_set():
                     break
                 await asyncio.sleep(0)
-            await FlushCommand().transfer(stream)
+            if self._output_mode in PACKED_OUTPUT_MODES:
+                ## makes the device send the last partial byte
+                await stream.write(bytes(SynchronizeCommand(cookie=self._cookie, raster=False, output=self._output_mode)))
+            await stream.flush()
 
         await SynchronizeCommand(cookie=self._cookie, raster=False, output = self._output_mode).transfer(stream)
         asyncio.create_task(sender())
 
         cookie = await stream.read(4) #just assume these are exactly FFFF + cookie, and discard them
+        self._reset_unpacker()
         ## TODO: assert against synchronization result
         for commands, pixel_count in self._iter_chunks(latency):
             tokens += 1
@@ -105,4 +148,6 @@ class VectorScanCommand(BaseCommand):
                     break
             self._logger.debug(f"recver: tokens={tokens}")
             yield await self.recv_res(pixel_count, stream, self._output_mode)
+        else:
+            await self.recv_packed_end(stream, self._output_mode)
 
@@ -6,6 +6,9 @@ __all__ += ["Stream", "Connection", "TransferError"]
 from .support import setup_logging, dump_hex
 __all__ += ["setup_logging", "dump_hex"]
 
+from .latency import LatencyMonitor
+__all__ += ["LatencyMonitor"]
+
 from .direct import GlasgowStream, GlasgowConnection
 __all__ += ["GlasgowStream", "GlasgowConnection"]
 
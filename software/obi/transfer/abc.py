@@ -8,12 +8,15 @@ logger = logging.getLogger()
 from . import *
 
 from obi.commands import *
+from .latency import LatencyMonitor
 
 class TransferError(Exception):
     pass
 
 class Stream(metaclass = ABCMeta):
     _logger = logger.getChild("Stream")
+    #: :class:`LatencyMonitor` that receives the timestamp records read from this stream, if any
+    latency = None
     @abstractmethod
     async def write(self, data: bytes | bytearray | memoryview):
         ...
@@ -38,6 +41,7 @@ class Connection(metaclass = ABCMeta):
         self._stream = None
         self._synchronized = False
         self._next_cookie = random.randrange(0, 0x10000, 2) # even cookies only
+        self.latency = LatencyMonitor()
     
     @property
     def connected(self):
@@ -65,6 +69,7 @@ class Connection(metaclass = ABCMeta):
     async def _synchronize(self):
         if not self.connected:
             await self._connect()
+        self._stream.latency = self.latency
         if self.synchronized:
             self._logger.debug("already synced")
             return
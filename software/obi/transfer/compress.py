@@ -0,0 +1,72 @@
+import zlib
+
+import numpy as np
+
+__all__ = ["BANNER", "OPT_IN", "WireEncoder", "WireDecoder"]
+
+#: Sent by a server that supports compression as soon as a client connects.
+#: Clients that do not support compression discard it while synchronizing.
+BANNER = b"OBI compress zlib-delta 1\n"
+#: Sent by a client, as the first bytes of the connection, to enable compression in both directions
+OPT_IN = b"OBI compress on\n"
+
+
+class _DeltaCoder:
+    """
+    Replaces each byte with its difference from the byte two positions earlier, modulo 256.
+    For 16-bit pixels, this is the difference between the high bytes and the low bytes of neighboring pixels,
+    which is close to zero for smooth images and compresses much better than the pixels themselves.
+    """
+    def __init__(self):
+        self._last = np.zeros(2, dtype=np.uint8)
+
+    def encode(self, data) -> bytes:
+        values = np.concatenate([self._last, np.frombuffer(data, dtype=np.uint8)])
+        self._last = values[-2:].copy()
+        return (values[2:] - values[:-2]).tobytes()
+
+    def decode(self, data) -> bytes:
+        deltas = np.frombuffer(data, dtype=np.uint8)
+        values = np.empty(len(deltas), dtype=np.uint8)
+        for lane in range(2):
+            ## bytes at even and odd positions are each a running sum of their deltas
+            values[lane::2] = np.cumsum(np.concatenate([self._last[lane:lane + 1], deltas[lane::2]]), dtype=np.uint8)[1:]
+        self._last = np.concatenate([self._last, values])[-2:]
+        return values.tobytes()
+
+
+class WireEncoder:
+    """
+    Compresses one direction of a connection as a single zlib stream. Every call to :meth:`encode`
+    ends with a sync flush, so the other end can decode everything sent so far without waiting for more data.
+
+    Args:
+        delta: Apply delta coding before compressing, for image data
+        level: zlib compression level. Low levels keep up with the device on slow CPUs.
+    """
+    def __init__(self, *, delta:bool=False, level:int=1):
+        self._compressor = zlib.compressobj(level)
+        self._delta = _DeltaCoder() if delta else None
+
+    def encode(self, data) -> bytes:
+        if self._delta is not None:
+            data = self._delta.encode(data)
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class WireDecoder:
+    """
+    Decodes the output of :class:`WireEncoder`, in chunks of any size.
+
+    Args:
+        delta: Undo delta coding after decompressing
+    """
+    def __init__(self, *, delta:bool=False):
+        self._decompressor = zlib.decompressobj()
+        self._delta = _DeltaCoder() if delta else None
+
+    def decode(self, data) -> bytes:
+        data = self._decompressor.decompress(data)
+        if self._delta is not None:
+            data = self._delta.decode(data)
+        return data
@@ -0,0 +1,109 @@
+import collections
+
+from obi.commands import TimestampRecord, TIMESTAMP_CLOCK
+
+import logging
+logger = logging.getLogger()
+
+__all__ = ["LatencyMonitor"]
+
+class LatencyMonitor:
+    """
+    Measures end-to-end latency and throughput from the timestamp records a device sends
+    when it is built with ``--timestamp-interval``. Records are stripped from the pixels
+    by :meth:`BaseCommand.recv_res` and added to the monitor of the connection.
+
+    The clocks of the device and the host are not synchronized, so latency is measured relative to
+    the record that arrived soonest after it was sent: a latency of 0 is the best case seen so far.
+
+    Args:
+        window: Number of recent records that throughput and :attr:`max_latency` are measured over
+
+    Attributes:
+        records (collections.deque[TimestampRecord]): Recent records, since the last synchronization
+
+    Example:
+        >>> conn = TCPConnection("localhost", 2224)
+        >>> frame = await fb.capture_frame(x_range=r, y_range=r, dwell_time=dwell)
+        >>> print(conn.latency)
+    """
+    _logger = logger.getChild("LatencyMonitor")
+
+    def __init__(self, window:int=256):
+        self.records = collections.deque(maxlen=window)
+        self.reset()
+
+    def __repr__(self):
+        if len(self.records) < 2:
+            return f"LatencyMonitor: {len(self.records)} records"
+        return (f"LatencyMonitor: latency={self.latency*1e3:.2f} ms, max={self.max_latency*1e3:.2f} ms, "
+                f"throughput={(self.throughput or 0)/1e6:.2f} Mpx/s, device={(self.device_throughput or 0)/1e6:.2f} Mpx/s")
+
+    def reset(self):
+        """
+        Forget all records, and the best case latency.
+        """
+        self.records.clear()
+        self._min_offset = None
+        self._wraps = 0
+
+    def _offset(self, record:TimestampRecord) -> float:
+        return record.host_time - record.device_time
+
+    def add(self, records:list[TimestampRecord]):
+        for record in records:
+            if self.records:
+                last = self.records[-1]
+                ## the timestamp counter has 42 bits, and wraps around after a day
+                if record.device_cycles + self._wraps < last.device_cycles:
+                    self._wraps += 1 << 42
+                ## the sequence number restarts at every synchronization
+                if record.sequence <= last.sequence:
+                    self.records.clear()
+            record.device_cycles += self._wraps
+            offset = self._offset(record)
+            if self._min_offset is None or offset < self._min_offset:
+                self._min_offset = offset
+            self.records.append(record)
+
+    @property
+    def latency(self) -> float | None:
+        """
+        Latency of the last record, in seconds, relative to the best case
+        """
+        if not self.records:
+            return None
+        return self._offset(self.records[-1]) - self._min_offset
+
+    @property
+    def max_latency(self) -> float | None:
+        """
+        Largest latency of the recent records, in seconds, relative to the best case
+        """
+        if not self.records:
+            return None
+        return max(self._offset(record) for record in self.records) - self._min_offset
+
+    @property
+    def throughput(self) -> float | None:
+        """
+        Pixels received by the host per second, over the recent records
+        """
+        if len(self.records) < 2:
+            return None
+        first, last = self.records[0], self.records[-1]
+        if last.host_time == first.host_time:
+            return None
+        return (last.sequence - first.sequence)/(last.host_time - first.host_time)
+
+    @property
+    def device_throughput(self) -> float | None:
+        """
+        Pixels sent by the device per second, over the recent records
+        """
+        if len(self.records) < 2:
+            return None
+        first, last = self.records[0], self.records[-1]
+        if last.device_cycles == first.device_cycles:
+            return None
+        return (last.sequence - first.sequence)*TIMESTAMP_CLOCK/(last.device_cycles - first.device_cycles)
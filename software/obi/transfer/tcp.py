@@ -13,6 +13,8 @@ logger = logging.getLogger()
 from .abc import Stream, Connection, TransferError
 from obi.commands import Command, SynchronizeCommand, FlushCommand, OutputMode
 from .support import dump_hex
+from .latency import LatencyMonitor
+from .compress import BANNER, OPT_IN, WireEncoder, WireDecoder
 
 BIG_ENDIAN = (struct.pack('@H', 0x1234) == struct.pack('>H', 0x1234))
 
@@ -55,16 +57,72 @@ class TCPStream(Stream):
         await self.send(data)
         return await self.recv(recv_length)
 
+class CompressedTCPStream(TCPStream):
+    """
+    A :class:`TCPStream` whose commands are compressed, and whose responses are delta coded and compressed,
+    after :data:`OPT_IN` has been sent.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        super().__init__(reader, writer)
+        self._encoder = WireEncoder()
+        self._decoder = WireDecoder(delta=True)
+        self._buffer = bytearray()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    async def write(self, data: bytes | bytearray | memoryview):
+        encoded = self._encoder.encode(data)
+        self._logger.debug(f"send: {len(data)} bytes as {len(encoded)} compressed bytes")
+        self.bytes_sent += len(encoded)
+        self._writer.write(encoded)
+
+    async def _fill(self):
+        data = await self._reader.read(0x10000)
+        if len(data) == 0:
+            raise asyncio.IncompleteReadError(bytes(self._buffer), None)
+        self.bytes_received += len(data)
+        self._buffer.extend(self._decoder.decode(data))
+
+    async def read(self, length: int) -> memoryview:
+        self._logger.debug(f"recv: length={length}")
+        while len(self._buffer) < length:
+            await self._fill()
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return memoryview(data)
+
+    async def readuntil(self, separator=b'\n') -> memoryview:
+        while (index := self._buffer.find(separator)) == -1:
+            await self._fill()
+        end = index + len(separator)
+        data = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return memoryview(data)
+
 class TCPConnection(Connection):
     _logger = logger.getChild("Connection")
-    def __init__(self, host: str, port: int, *, read_buffer_size=0x10000*128):
+    def __init__(self, host: str, port: int, *, read_buffer_size=0x10000*128,
+                 compression:bool=False, negotiation_timeout:float=1.0):
+        """
+        Args:
+            host
+            port
+            read_buffer_size
+            compression: Compress the connection, if the server supports it. \
+                Worthwhile when the server is on another machine.
+            negotiation_timeout: Time to wait for the server to offer compression, in seconds, \
+                before continuing without it
+        """
         self.host = host
         self.port = port
         self.read_buffer_size = read_buffer_size
+        self.compression = compression
+        self.negotiation_timeout = negotiation_timeout
 
         self._stream = None
         self._synchronized = False
         self._next_cookie = random.randrange(0, 0x10000, 2) # even cookies only
+        self.latency = LatencyMonitor()
 
         self._interrupt = asyncio.Event()
 
@@ -80,11 +138,28 @@ class TCPConnection(Connection):
 
     async def _connect(self):
         assert not self.connected
-        self._stream = TCPStream(*await asyncio.open_connection(
-            self.host, self.port, limit=self.read_buffer_size))
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=self.read_buffer_size)
+        if self.compression and await self._negotiate(reader, writer):
+            self._stream = CompressedTCPStream(reader, writer)
+        else:
+            self._stream = TCPStream(reader, writer)
 
         peername = self._stream._writer.get_extra_info('peername')
-        self._logger.info(f"connected to server at {peername}")
+        compressed = isinstance(self._stream, CompressedTCPStream)
+        self._logger.info(f"connected to server at {peername}, {'with' if compressed else 'without'} compression")
+
+    async def _negotiate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        ## servers without compression send nothing until they receive a command
+        try:
+            banner = await asyncio.wait_for(reader.readexactly(len(BANNER)), self.negotiation_timeout)
+        except asyncio.TimeoutError:
+            self._logger.info("server does not offer compression")
+            return False
+        if banner != BANNER:
+            raise TransferError(f"unexpected data from server: {banner!r}")
+        writer.write(OPT_IN)
+        await writer.drain()
+        return True
 
     def _interrupt_scan(self):
         print(f'Scan interrupted externally')
@@ -0,0 +1,41 @@
+import unittest
+import asyncio
+import struct
+
+from obi.commands import *
+from .test_packing import BufferStream
+
+
+def counter_bytes(cycles, skid, counts):
+    words = []
+    for value in cycles:
+        words += [value >> 16, value & 0xffff]
+    words.append(skid)
+    for value in counts:
+        words += [value >> 16, value & 0xffff]
+    return struct.pack(f">{len(words)}H", *words)
+
+
+class PerformanceCountersTest(unittest.TestCase):
+    def test_read(self):
+        data = counter_bytes([0x12345678, 2, 3], 5, range(16))
+        counters = asyncio.run(ReadCountersCommand().transfer(BufferStream(data)))
+        self.assertEqual(counters.fetch_idle_cycles, 0x12345678)
+        self.assertEqual(counters.dac_starved_cycles, 2)
+        self.assertEqual(counters.output_stalled_cycles, 3)
+        self.assertEqual(counters.skid_buffer_max_level, 5)
+        self.assertEqual(counters.commands[CmdType.RasterPixelRun], CmdType.RasterPixelRun.value)
+
+    def test_difference(self):
+        before = PerformanceCounters.from_bytes(counter_bytes([0xffff_fff0, 0, 0], 3, [0xffff_ffff]*16))
+        after = PerformanceCounters.from_bytes(counter_bytes([0x10, 5, 0], 2, [1]*16))
+        diff = after - before
+        ## counters wrap around at 32 bits
+        self.assertEqual(diff.fetch_idle_cycles, 0x20)
+        self.assertEqual(diff.dac_starved_cycles, 5)
+        self.assertEqual(diff.skid_buffer_max_level, 2)
+        self.assertEqual(set(diff.commands.values()), {2})
+
+    def test_length(self):
+        with self.assertRaises(ValueError):
+            PerformanceCounters.from_bytes(bytes(2*COUNTER_WORDS - 2))
@@ -0,0 +1,109 @@
+import unittest
+import array
+import asyncio
+import math
+import random
+
+from obi.commands import *
+from obi.transfer.mock import MockStream
+
+
+def pack(codes, width):
+    ## reference packer: first pixel in the most significant bit, last byte padded with zeros
+    value, bits = 0, 0
+    for code in codes:
+        value = (value << width) | code
+        bits += width
+    value <<= -bits % 8
+    return value.to_bytes((bits + 7) // 8, "big")
+
+
+class BufferStream(MockStream):
+    def __init__(self, data):
+        self.data = memoryview(data)
+
+    async def read(self, length):
+        chunk, self.data = self.data[:length], self.data[length:]
+        assert len(chunk) == length, "read past end of data"
+        return chunk
+
+
+class PixelUnpackerTest(unittest.TestCase):
+    def check_mode(self, output_mode, scale):
+        width = PACKED_OUTPUT_MODES[output_mode]
+        codes = [random.randrange(1 << width) for _ in range(1000)]
+        data = pack(codes, width)
+        unpacker = PixelUnpacker(output_mode)
+        pixels = array.array(unpacker.unpack(b"", 0).typecode)
+        offset = 0
+        for count in [1, 2, 3, 5, 7, 8, 13, 100, 861]:
+            needed = unpacker.bytes_needed(count)
+            pixels.extend(unpacker.unpack(data[offset:offset + needed], count))
+            offset += needed
+        self.assertEqual(offset, len(data))
+        self.assertEqual(list(pixels), [code << scale for code in codes])
+
+    def test_fourteen_bit(self):
+        self.check_mode(OutputMode.FourteenBitPacked, 2)
+        self.assertEqual(len(pack([0]*4, 14)), 7)
+
+    def test_four_bit(self):
+        self.check_mode(OutputMode.FourBit, 4)
+
+    def test_one_bit(self):
+        self.check_mode(OutputMode.OneBit, 7)
+
+    def test_recv_res(self):
+        codes = [random.randrange(1 << 14) for _ in range(10)]
+        ## the last byte is padded before the synchronization response
+        stream = BufferStream(pack(codes[:3], 14) + b"\xff\xff\x00\x7b" + pack(codes[3:], 14))
+        cmd = SynchronizeCommand(cookie=123, raster=True, output=OutputMode.FourteenBitPacked)
+        async def recv():
+            first = await cmd.recv_res(3, stream, OutputMode.FourteenBitPacked)
+            ## continues from a new byte after each synchronization
+            await cmd.recv_packed_end(stream, OutputMode.FourteenBitPacked)
+            return first + await cmd.recv_res(7, stream, OutputMode.FourteenBitPacked)
+        self.assertEqual(list(asyncio.run(recv())), [code << 2 for code in codes])
+
+
+def encode(pixels):
+    ## reference encoder, as in ImageSerializer
+    data = bytearray()
+    prev = 0
+    for pixel in pixels:
+        rotated = (pixel >> 2) | ((pixel & 3) << 14)
+        delta = (rotated - prev) & 0xffff
+        prev = rotated
+        signed = delta - 0x10000 if delta & 0x8000 else delta
+        if -64 <= signed < 64:
+            data.append(signed & 0x7f)
+        elif -1024 <= signed < 1024:
+            data.extend([0xc0 | ((signed >> 6) & 0x1f), 0x80 | (signed & 0x3f)])
+        else:
+            data.extend([0xe0 | (delta >> 12), 0x80 | ((delta >> 6) & 0x3f), 0x80 | (delta & 0x3f)])
+    return bytes(data)
+
+
+class DeltaDecoderTest(unittest.TestCase):
+    def test_exact(self):
+        ## smooth ADC codes, with a few jumps and pixels that are not multiples of 4
+        pixels = [(8000 + int(300*math.sin(n/50)) + random.randrange(-3, 4)) << 2 for n in range(2000)]
+        pixels[100] = 0xffff
+        pixels[101] = 0
+        pixels[500] = 12345
+        pixels[501] = pixels[500] + 4*700
+        stream = BufferStream(encode(pixels))
+        cmd = SynchronizeCommand(cookie=123, raster=True, output=OutputMode.Compressed)
+        async def recv():
+            res = array.array('H')
+            for count in [1, 99, 2, 398, 1000, 500]:
+                res.extend(await cmd.recv_res(count, stream, OutputMode.Compressed))
+            return res
+        self.assertEqual(list(asyncio.run(recv())), pixels)
+        self.assertEqual(len(stream.data), 0)
+        ## most pixels take 1 byte instead of 2
+        self.assertLess(len(encode(pixels)), len(pixels)*2*0.6)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            DeltaDecoder().decode(b"\xf0\x80\x80\x80", 1)
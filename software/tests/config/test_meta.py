@@ -17,6 +17,14 @@ class ParseMetaTest(unittest.TestCase):
         self.assertEqual(pinout_i.blank_enable, "B2#")
         self.assertEqual(pinout_i.blank, "B3:4")
 
+    def test_timings(self):
+        s = ScopeSettings.from_toml_file("tests/config/test_full.toml")
+        self.assertEqual(s.ext_switch_delay, 20)
+        self.assertEqual(s.flush_timeout, 50)
+        self.assertEqual(s.to_dict()["timings"], {"ext_switch_delay_ms": 20, "flush_timeout_us": 50})
+        s = ScopeSettings.from_toml_file("tests/config/test_minimal.toml")
+        self.assertIsNone(s.flush_timeout)
+
     def test_load(self):
         get_applet_args("tests/config/test_full.toml")
         get_applet_args("tests/config/test_minimal.toml") 
@@ -24,3 +32,12 @@ class ParseMetaTest(unittest.TestCase):
         for file in os.listdir("configs"):
             get_applet_args(f"configs/{file}")
 
+
+class MagCalTest(unittest.TestCase):
+    def test_pixel_size(self):
+        mag_cal = MagCal(path="", m_per_fov={100: 1e-3, 10000: 1e-5})
+        self.assertAlmostEqual(mag_cal.fov_at(100), 1e-3)
+        self.assertAlmostEqual(mag_cal.fov_at(1000), 1e-4)
+        self.assertAlmostEqual(mag_cal.fov_at(20000), 5e-6)
+        self.assertAlmostEqual(mag_cal.pixel_size(1000, 1024), 1e-4/1024)
+        self.assertIsNone(MagCal(path="", m_per_fov={}).pixel_size(1000, 1024))
@@ -5,6 +5,7 @@ from amaranth.sim import Simulator, Tick
 from amaranth import *
 from amaranth import DriverConflict
 from amaranth.lib import wiring
+from amaranth.lib.fifo import SyncFIFOBuffered
 from abc import ABCMeta, abstractmethod
 import asyncio
 import numpy as np
@@ -20,8 +21,10 @@ from obi.applet.open_beam_interface.modules.raster_scanner import RasterRegion
 from obi.applet.open_beam_interface.modules.supersampler import PowerOfTwoDetector
 from obi.applet.open_beam_interface.modules import CommandParser
 from obi.applet.open_beam_interface.modules import BusController
-from obi.applet.open_beam_interface import CommandExecutor
+from obi.applet.open_beam_interface.modules import FlushTimer
+from obi.applet.open_beam_interface import CommandExecutor, ImageSerializer
 from obi.commands import *
+from obi.macros import FreeRunScanCommand
 
 
 ## support functions for prettier output
@@ -121,6 +124,30 @@ async def get_stream(ctx, stream, payload, timeout_steps=10):
     assert data == wrapped_payload, f"{prettier_diff(data, payload)}"
     ctx.set(stream.ready, 0)
 
+class QueuedExecutor(Elaboratable):
+    """
+    A `CommandParser` whose commands are queued for a `CommandExecutor`, as in `OBIComponent`.
+    """
+    def __init__(self, **kwargs):
+        self.parser = CommandParser()
+        self.executor = CommandExecutor(**kwargs)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.parser = self.parser
+        m.submodules.executor = self.executor
+        m.submodules.cmd_fifo = cmd_fifo = SyncFIFOBuffered(width=Shape.cast(Command).width, depth=16)
+        m.d.comb += [
+            cmd_fifo.w_data.eq(self.parser.cmd_stream.payload),
+            cmd_fifo.w_en.eq(self.parser.cmd_stream.valid),
+            self.parser.cmd_stream.ready.eq(cmd_fifo.w_rdy),
+            self.executor.cmd_stream.payload.eq(cmd_fifo.r_data),
+            self.executor.cmd_stream.valid.eq(cmd_fifo.r_rdy),
+            cmd_fifo.r_en.eq(self.executor.cmd_stream.ready),
+        ]
+        return m
+
+
 class OBIAppletTestCase(unittest.TestCase):
     '''
     Creates a simulation with a set of testbenches
@@ -179,6 +206,39 @@ class OBIAppletTestCase(unittest.TestCase):
         test_one_cycle()
         test_multi_cycle()
         
+    def test_bus_controller_skip_y_write(self):
+        dut = BusController(adc_half_period=2, adc_latency=6, skip_y_write=True)
+        pixels = [(1, 5), (2, 5), (3, 5), (4, 6), (5, 6)]
+
+        async def put_testbench(ctx):
+            for x, y in pixels:
+                await put_stream(ctx, dut.dac_stream, {"dac_x_code": x, "dac_y_code": y, "last": 1}, timeout_steps=20)
+
+        async def bus_testbench(ctx):
+            x_writes, y_writes, rising = [], [], []
+            adc_clk = 0
+            for cycle in range(80):
+                _, _, clk, x_le, y_le, data_o = await ctx.tick().sample(
+                    dut.bus.adc_clk, dut.bus.dac_x_le_clk, dut.bus.dac_y_le_clk, dut.bus.data_o)
+                if x_le:
+                    x_writes.append(data_o)
+                if y_le:
+                    y_writes.append(data_o)
+                if clk and not adc_clk:
+                    rising.append(cycle)
+                adc_clk = clk
+            assert [x for x, _ in pixels] == [x for x in x_writes if x][:len(pixels)], x_writes
+            ## the Y DAC is only written when the code changes, stretching the ADC period by 2 cycles
+            assert y_writes == [5, 6], y_writes
+            periods = [b - a for a, b in zip(rising, rising[1:])]
+            assert set(periods) == {4, 6} and periods.count(6) <= len(y_writes), periods
+
+        async def get_testbench(ctx):
+            for _ in pixels:
+                await get_stream(ctx, dut.adc_stream, {"adc_code": 0, "last": 1}, timeout_steps=100)
+
+        self.simulate(dut, [put_testbench, bus_testbench, get_testbench], name="bus_controller_skip_y")
+
     def test_bus_controller_transforms(self):
         def test_xflip(xin: int, xout: int):
             dut = BusController(adc_half_period=3, adc_latency=6, transforms = Transforms(xflip=True, yflip=False, rotate90=False))
@@ -310,26 +370,60 @@ class OBIAppletTestCase(unittest.TestCase):
                 await put_stream(ctx, dut.super_adc_stream,
                     {"adc_code": 999, "adc_ovf": 0, "last": 0})
 
-            def get_closest_p2(n):
-                i = 1
-                while pow(2,i) < n:
-                    i += 1
-                if n != pow(2,i):
-                    i -= 1
-                return max(1, pow(2,i))
-
             async def get_testbench(ctx):
-                closest_p2 = get_closest_p2(nvals)
-                print(f"for {nvals} values, average first {closest_p2}")
+                ## all samples are averaged; counts other than powers of 2 take 7 more cycles to divide
                 await get_stream(ctx, dut.adc_stream,
-                    {"adc_code": (sum(list(vals)[:closest_p2]))//closest_p2}, timeout_steps = nvals*3)
+                    {"adc_code": sum(vals.tolist())//nvals}, timeout_steps = nvals*3 + Supersampler.DIVIDE_CYCLES)
+                assert ctx.get(dut.adc_sum) == sum(vals.tolist())
                 assert ctx.get(dut.adc_stream.valid) == 0
 
             self.simulate(dut, [put_testbench, get_testbench], name = f"ss_avg_rand_{nvals}")
         
-        for n in [1,2,4,5,8,16,24, 32,64,128]:
+        for n in [1,2,3,4,5,7,8,16,24, 32,64,100,128]:
             check_avg_random_samples(n)
     
+    def test_supersampler_average_overlap(self):
+        dut = Supersampler()
+        pixels = [[100, 200, 301], [7, 8, 9, 10, 11], [5, 6]]
+
+        async def put_testbench(ctx):
+            ## the samples of each pixel arrive while the previous one is being divided
+            for samples in pixels:
+                for n, sample in enumerate(samples):
+                    await put_stream(ctx, dut.super_adc_stream,
+                        {"adc_code": sample, "adc_ovf": 0, "last": int(n + 1 == len(samples))}, timeout_steps=50)
+
+        async def get_testbench(ctx):
+            for samples in pixels:
+                await get_stream(ctx, dut.adc_stream,
+                    {"adc_code": sum(samples)//len(samples)}, timeout_steps=50)
+
+        self.simulate(dut, [put_testbench, get_testbench], name = "ss_avg_overlap")
+
+    def test_supersampler_average_throughput(self):
+        dut = Supersampler()
+        ## the shortest divided pixels, at the shortest ADC period
+        adc_period = 4
+        pixels = [[100, 200, 301], [7, 8, 9], [16383, 16383, 16382], [5, 6, 8]]
+
+        async def put_testbench(ctx):
+            for samples in pixels:
+                for n, sample in enumerate(samples):
+                    ctx.set(dut.super_adc_stream.payload,
+                        {"adc_code": sample, "adc_ovf": 0, "last": int(n + 1 == len(samples))})
+                    ctx.set(dut.super_adc_stream.valid, 1)
+                    _, _, ready = await ctx.tick().sample(dut.super_adc_stream.ready)
+                    assert ready, "sample had to wait for the divider"
+                    ctx.set(dut.super_adc_stream.valid, 0)
+                    await ctx.tick().repeat(adc_period - 1)
+
+        async def get_testbench(ctx):
+            for samples in pixels:
+                await get_stream(ctx, dut.adc_stream,
+                    {"adc_code": sum(samples)//len(samples)}, timeout_steps=50)
+
+        self.simulate(dut, [put_testbench, get_testbench], name = "ss_avg_throughput")
+
     # Raster Scanner
     def test_raster_scanner(self):
 
@@ -360,6 +454,140 @@ class OBIAppletTestCase(unittest.TestCase):
 
         self.simulate(dut, [get_testbench,put_testbench], name = "raster_scanner")  
 
+    def test_raster_scanner_serpentine(self):
+        dut = RasterScanner()
+        ## fractional steps, which are retraced exactly in reverse
+        x_codes = [5, 6, 8, 9]
+        lines = [x_codes, x_codes[::-1], x_codes]
+
+        async def put_testbench(ctx):
+            await put_stream(ctx, dut.roi_stream, {
+                "x_start": 5, "x_count": 4, "x_step": 0x1_80,
+                "y_start": 9, "y_count": 3, "y_step": 0x5_00,
+                "serpentine": 1,
+            })
+            for _ in range(12):
+                await put_stream(ctx, dut.dwell_stream, {"dwell_time": 1})
+
+        async def get_testbench(ctx):
+            for y, line in zip([9, 14, 19], lines):
+                for x in line:
+                    await get_stream(ctx, dut.dac_stream, {"dac_x_code": x, "dac_y_code": y, "dwell_time": 1})
+            assert ctx.get(dut.roi_stream.ready) == 1
+
+        self.simulate(dut, [get_testbench, put_testbench], name = "raster_scanner_serpentine")
+
+    def test_raster_scanner_line_sync(self):
+        dut = RasterScanner()
+        trigger_cycles = [20, 30, 60]
+
+        async def put_testbench(ctx):
+            await put_stream(ctx, dut.roi_stream, {
+                "x_start": 5, "x_count": 2, "x_step": 0x1_00,
+                "y_start": 9, "y_count": 3, "y_step": 0x1_00,
+                "line_sync": 1,
+            })
+            for _ in range(6):
+                await put_stream(ctx, dut.dwell_stream, {"dwell_time": 1}, timeout_steps=100)
+
+        async def trigger_testbench(ctx):
+            for cycle in range(80):
+                ctx.set(dut.line_trigger, cycle in trigger_cycles)
+                await ctx.tick()
+
+        async def get_testbench(ctx):
+            ctx.set(dut.dac_stream.ready, 1)
+            line_starts = []
+            for cycle in range(80):
+                _, _, valid, payload = await ctx.tick().sample(dut.dac_stream.valid, dut.dac_stream.payload)
+                if valid and payload.dac_x_code == 5:
+                    line_starts.append(cycle)
+            ## each line starts on the cycle after an edge
+            assert [start - trigger for start, trigger in zip(line_starts, trigger_cycles)] == [1, 1, 1], \
+                f"{line_starts=}"
+
+        self.simulate(dut, [get_testbench, put_testbench, trigger_testbench], name = "raster_scanner_line_sync")
+
+    ## Flush Timer
+    def test_flush_timer(self):
+        dut = FlushTimer(timeout=4)
+        sent_cycles = [2, 3, 5, 20]
+        flushed_cycles = [21]
+
+        async def put_testbench(ctx):
+            for cycle in range(40):
+                ctx.set(dut.data_sent, cycle in sent_cycles)
+                ctx.set(dut.flushed, cycle in flushed_cycles)
+                await ctx.tick()
+
+        async def get_testbench(ctx):
+            flushes = []
+            for cycle in range(40):
+                _, _, flush = await ctx.tick().sample(dut.flush)
+                if flush:
+                    flushes.append(cycle)
+            ## 4 cycles after the last byte, and not again after the next byte has been flushed otherwise
+            assert flushes == [9], f"{flushes=}"
+
+        self.simulate(dut, [get_testbench, put_testbench], name = "flush_timer")
+
+    ## Image Serializer
+    def test_image_serializer_packed(self):
+        def run_test(output_mode, width, codes):
+            dut = ImageSerializer()
+            ## first pixel in the most significant bit, padded to a whole byte
+            value = 0
+            for code in codes:
+                value = (value << width) | code
+            bits = width*len(codes)
+            expected = list((value << (-bits % 8)).to_bytes((bits + 7)//8, "big")) + [0xff, 0xff]
+            
+            async def put_testbench(ctx):
+                ctx.set(dut.output_mode, output_mode)
+                for code in codes:
+                    await put_stream(ctx, dut.img_stream, code << (16 - width), timeout_steps=100)
+                ## synchronization response is always sent as 16 bits
+                ctx.set(dut.output_mode, OutputMode.SixteenBit)
+                await put_stream(ctx, dut.img_stream, 0xffff, timeout_steps=100)
+
+            async def get_testbench(ctx):
+                for byte in expected:
+                    await get_stream(ctx, dut.usb_stream, byte, timeout_steps=100)
+
+            self.simulate(dut, [put_testbench, get_testbench], name="serializer_packed")
+
+        run_test(OutputMode.FourteenBitPacked, 14, [0x3fff, 0x0001, 0x1234, 0x2aaa, 0x0155])
+        run_test(OutputMode.FourBit, 4, [0xf, 0x1, 0x8])
+        run_test(OutputMode.OneBit, 1, [1, 0, 1, 1, 0, 0, 1, 0, 1, 1])
+
+    def test_image_serializer_compressed(self):
+        dut = ImageSerializer()
+        pixels = [100 << 2, 101 << 2, 90 << 2, 700 << 2, 16383 << 2, 16383 << 2, 0x0003]
+        ## differences of the rotated pixels; the last pixel rotates to 0xc000
+        expected = [
+            0xc1, 0xa4,         # 100
+            0x01,               # 1
+            0x75,               # -11
+            0xc9, 0xa2,         # 610
+            0xe3, 0xb5, 0x83,   # 15683
+            0x00,               # 0
+            0xe8, 0x80, 0x81,   # 0xc000 - 0x3fff = 0x8001
+            0xff, 0xff,
+        ]
+
+        async def put_testbench(ctx):
+            ctx.set(dut.output_mode, OutputMode.Compressed)
+            for pixel in pixels:
+                await put_stream(ctx, dut.img_stream, pixel, timeout_steps=100)
+            ctx.set(dut.output_mode, OutputMode.SixteenBit)
+            await put_stream(ctx, dut.img_stream, 0xffff, timeout_steps=100)
+
+        async def get_testbench(ctx):
+            for byte in expected:
+                await get_stream(ctx, dut.usb_stream, byte, timeout_steps=100)
+
+        self.simulate(dut, [put_testbench, get_testbench], name="serializer_compressed")
+
     # Command Parser
     def test_command_parser(self):
         dut = CommandParser()
@@ -396,6 +624,8 @@ class OBIAppletTestCase(unittest.TestCase):
         y_range = DACCodeRange(start=9, count=1, step=0x5_00)
 
         test_cmd(RasterRegionCommand(x_range=x_range, y_range=y_range), "cmd_rasterregion")
+        test_cmd(RasterRegionCommand(x_range=x_range, y_range=y_range, serpentine=True), "cmd_rasterregion_serpentine")
+        test_cmd(RasterRegionCommand(x_range=x_range, y_range=y_range, line_sync=True, frame_sync=True), "cmd_rasterregion_sync")
 
         test_cmd(RasterPixelRunCommand(length=5, dwell_time= 6),"cmd_rasterpixelrun")
         
@@ -406,6 +636,10 @@ class OBIAppletTestCase(unittest.TestCase):
         test_cmd(VectorPixelCommand(x_coord=4, y_coord=5, dwell_time= 6),"cmd_vectorpixel")
 
         test_cmd(VectorPixelCommand(x_coord=4, y_coord=5, dwell_time= 1),"cmd_vectorpixelmin")
+
+        test_cmd(PatternLoadCommand(address=3, length=4), "cmd_patternload")
+
+        test_cmd(PatternReplayCommand(address=3, length=9, repeat=99, scale=fp8_8(1.5)), "cmd_patternreplay")
     
         def test_raster_pixels_cmd():
             command = ArrayCommand(cmdtype = CmdType.RasterPixel, array_length = 5)
@@ -575,28 +809,17 @@ class OBIAppletTestCase(unittest.TestCase):
             assert ctx.get(dut.blank_enable) == 1
         
         async def sync_unblank(ctx): #assumes starting from default or blanked state
-            ctx.set(dut.cmd_stream.payload, BlankCommand(enable=False, inline=True).as_dict())
-            ctx.set(dut.cmd_stream.valid, 1)
-            await ctx.tick().until(dut.cmd_stream.ready == 0)
+            await put_stream(ctx, dut.cmd_stream, BlankCommand(enable=False, inline=True).as_dict())
             assert ctx.get(dut.blank_enable) == 1 #shouldn't be unblanked yet
-            ctx.set(dut.cmd_stream.payload, 
-                VectorPixelCommand(x_coord=1, y_coord=1, dwell_time=1).as_dict())
-            ctx.set(dut.cmd_stream.valid, 1)
-            await ctx.tick().until(dut.cmd_stream.ready == 0)
-            ctx.set(dut.cmd_stream.valid, 0)
+            await put_stream(ctx, dut.cmd_stream, VectorPixelCommand(x_coord=1, y_coord=1, dwell_time=1).as_dict())
             await ctx.tick().until(dut.supersampler.super_dac_stream.valid == 1) # bus controller recieves dac codes
             await ctx.tick("dac_clk").repeat(2) # dac codes are latched
             assert ctx.get(dut.blank_enable) == 0
 
         async def sync_blank(ctx): #assumes starting from an unblanked state
-            ctx.set(dut.cmd_stream.payload, BlankCommand(enable=True, inline=True).as_dict())
-            ctx.set(dut.cmd_stream.valid, 1)
-            await ctx.tick().until(dut.cmd_stream.ready == 0)
+            await put_stream(ctx, dut.cmd_stream, BlankCommand(enable=True, inline=True).as_dict())
             assert ctx.get(dut.blank_enable) == 0 #shouldn't be blanked yet
-            ctx.set(dut.cmd_stream.payload, VectorPixelCommand(x_coord=2, y_coord=2, dwell_time=1).as_dict())
-            ctx.set(dut.cmd_stream.valid, 1)
-            await ctx.tick().until(dut.cmd_stream.ready == 0)
-            ctx.set(dut.cmd_stream.valid, 0)
+            await put_stream(ctx, dut.cmd_stream, VectorPixelCommand(x_coord=2, y_coord=2, dwell_time=1).as_dict())
             await ctx.tick().until(dut.supersampler.super_dac_stream.valid == 1) # bus controller recieves dac codes
             await ctx.tick("dac_clk").repeat(2) # dac codes are latched
             assert ctx.get(dut.blank_enable) == 1
@@ -614,6 +837,289 @@ class OBIAppletTestCase(unittest.TestCase):
         self.simulate(dut, [sync_unblank], name="sync_unblank")
         self.simulate(dut, [test_seq_1], name="blank_seq_1")
     
+    def test_command_executor_prefetch(self):
+        dut = CommandExecutor()
+        commands = [VectorPixelCommand(x_coord=n, y_coord=n, dwell_time=0) for n in range(8)]
+
+        async def put_testbench(ctx):
+            ctx.set(dut.cmd_stream.valid, 1)
+            for n, command in enumerate(commands):
+                ctx.set(dut.cmd_stream.payload, command.as_dict())
+                while True:
+                    _, _, ready, executing = await ctx.tick().sample(dut.cmd_stream.ready, dut.is_executing)
+                    ## once started, the next command is latched as soon as the current one retires
+                    assert n == 0 or executing
+                    if ready:
+                        break
+            ctx.set(dut.cmd_stream.valid, 0)
+
+        self.simulate(dut, [put_testbench], name="exec_prefetch")
+
+    def test_command_executor_prefetch_bus_limit(self):
+        ## at the shortest ADC period, parsing a minimum dwell point takes longer than the bus takes to output it
+        dut = QueuedExecutor(adc_half_period=2, skip_y_write=True)
+        points = [VectorPixelCommand(x_coord=n, y_coord=0, dwell_time=0) for n in range(12)]
+        data = bytes(SynchronizeCommand(cookie=123, raster=False, output=OutputMode.NoOutput)) + \
+            bytes(DelayCommand(delay=100)) + b"".join(bytes(point) for point in points)
+
+        async def put_testbench(ctx):
+            for byte in data:
+                await put_stream(ctx, dut.parser.usb_stream, byte, timeout_steps=1000)
+
+        async def dac_testbench(ctx):
+            ## once the points are queued during the delay, the bus takes one every ADC period
+            super_dac_stream = dut.executor.supersampler.super_dac_stream
+            ctx.set(dut.executor.img_stream.ready, 1)
+            handshakes = []
+            for cycle in range(400):
+                _, _, valid, ready, payload = await ctx.tick().sample(
+                    super_dac_stream.valid, super_dac_stream.ready, super_dac_stream.payload)
+                if valid and ready:
+                    assert payload.dac_x_code == len(handshakes)
+                    handshakes.append(cycle)
+            assert len(handshakes) == len(points), f"{handshakes=}"
+            assert np.diff(handshakes).tolist() == [2 * 2] * (len(points) - 1), f"{handshakes=}"
+
+        self.simulate(dut, [put_testbench, dac_testbench], name="exec_prefetch_bus_limit")
+
+    def test_command_executor_pattern_replay(self):
+        dut = CommandExecutor()
+        points = [(1, 2, 3), (4, 5, 6), (7, 8, 300)]
+        commands = [
+            PatternLoadCommand(address=10, length=2),
+            *[VectorPixelCommand(x_coord=x, y_coord=y, dwell_time=dwell) for x, y, dwell in points],
+            PatternReplayCommand(address=10, length=2, repeat=1, scale=fp8_8(0.5)),
+            VectorPixelCommand(x_coord=9, y_coord=9, dwell_time=9),
+            PatternReplayCommand(address=12, length=0, scale=fp8_8(255)),
+        ]
+
+        async def put_testbench(ctx):
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            ## loaded points are not executed, and the dwell time saturates
+            expected = [(x, y, dwell//2) for x, y, dwell in points]*2 + [(9, 9, 9), (7, 8, 0xffff)]
+            ctx.set(dut.img_stream.ready, 1)
+            for x, y, dwell in expected:
+                res = await ctx.tick().sample(dut.supersampler.dac_stream.payload).until(
+                    dut.supersampler.dac_stream.ready & dut.supersampler.dac_stream.valid)
+                assert (res[0].dac_x_code, res[0].dac_y_code, res[0].dwell_time) == (x, y, dwell), \
+                    f"{(res[0].dac_x_code, res[0].dac_y_code, res[0].dwell_time)} != {(x, y, dwell)}"
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_pattern_replay")
+
+    def test_command_executor_pattern_bounds(self):
+        dut = CommandExecutor(pattern_depth=16)
+        points = [(1, 2, 3), (4, 5, 6)]
+        commands = [
+            PatternLoadCommand(address=0, length=1),
+            *[VectorPixelCommand(x_coord=x, y_coord=y, dwell_time=dwell) for x, y, dwell in points],
+            ## the last two points are past the end, and do not wrap around to the first ones
+            PatternLoadCommand(address=14, length=3),
+            *[VectorPixelCommand(x_coord=n, y_coord=n, dwell_time=n + 2) for n in range(4)],
+            PatternReplayCommand(address=15, length=1),
+            PatternReplayCommand(address=14, length=1),
+            PatternReplayCommand(address=0, length=1),
+            VectorPixelCommand(x_coord=9, y_coord=9, dwell_time=9),
+        ]
+
+        async def put_testbench(ctx):
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            ## the replay past the end is skipped
+            expected = [(0, 0, 2), (1, 1, 3), *points, (9, 9, 9)]
+            ctx.set(dut.img_stream.ready, 1)
+            for x, y, dwell in expected:
+                res = await ctx.tick().sample(dut.supersampler.dac_stream.payload).until(
+                    dut.supersampler.dac_stream.ready & dut.supersampler.dac_stream.valid)
+                assert (res[0].dac_x_code, res[0].dac_y_code, res[0].dwell_time) == (x, y, dwell), \
+                    f"{(res[0].dac_x_code, res[0].dac_y_code, res[0].dwell_time)} != {(x, y, dwell)}"
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_pattern_bounds")
+
+    def test_command_executor_counters(self):
+        dut = CommandExecutor()
+        commands = [
+            SynchronizeCommand(cookie=123, raster=False, output=OutputMode.SixteenBit),
+            *[VectorPixelCommand(x_coord=n, y_coord=n, dwell_time=2) for n in range(3)],
+            DelayCommand(delay=5),
+            ReadCountersCommand(),
+        ]
+
+        async def put_testbench(ctx):
+            await ctx.tick().repeat(10)
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            words = []
+            ctx.set(dut.img_stream.ready, 1)
+            while len(words) < 2 + 3 + COUNTER_WORDS:
+                _, _, valid, payload = await ctx.tick().sample(dut.img_stream.valid, dut.img_stream.payload)
+                if valid:
+                    words.append(payload)
+            assert words[:2] == [0xffff, 123]
+            counters = PerformanceCounters.from_bytes(struct.pack(f">{COUNTER_WORDS}H", *words[5:]))
+            assert counters.commands[CmdType.Synchronize] == 1
+            assert counters.commands[CmdType.VectorPixel] == 3
+            assert counters.commands[CmdType.Delay] == 1
+            assert counters.commands[CmdType.Extended] == 0
+            assert counters.fetch_idle_cycles >= 10
+            assert counters.dac_starved_cycles > 0
+            assert counters.output_stalled_cycles == 0
+            assert 0 < counters.skid_buffer_max_level <= dut.adc_latency
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_counters")
+
+    def test_command_executor_free_run_markers(self):
+        dut = CommandExecutor()
+        commands = [
+            SynchronizeCommand(cookie=123, raster=True, output=OutputMode.SixteenBit),
+            RasterRegionCommand(x_range=DACCodeRange(start=5, count=2, step=0x2_00),
+                                y_range=DACCodeRange(start=9, count=2, step=0x5_00)),
+            RasterPixelFreeRunCommand(dwell_time=0),
+        ]
+
+        async def put_testbench(ctx):
+            ctx.set(dut.bus.data_i, 1000)
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            words = []
+            ctx.set(dut.img_stream.ready, 1)
+            while len(words) < 2 + 3*5:
+                _, _, valid, payload = await ctx.tick().sample(dut.img_stream.valid, dut.img_stream.payload)
+                if valid:
+                    words.append(payload)
+            ## every frame of 4 pixels is preceded by a marker
+            assert words[:2] == [0xffff, 123]
+            assert words[2:] == [FRAME_MARKER, 4000, 4000, 4000, 4000]*3
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_free_run_markers")
+
+    def test_command_executor_no_triggers(self):
+        ## without trigger inputs, synchronized scans run instead of waiting for an edge
+        dut = CommandExecutor(has_line_trigger=False, has_frame_trigger=False)
+        commands = [
+            SynchronizeCommand(cookie=123, raster=True, output=OutputMode.SixteenBit),
+            RasterRegionCommand(x_range=DACCodeRange(start=5, count=2, step=0x2_00),
+                                y_range=DACCodeRange(start=9, count=2, step=0x5_00),
+                                line_sync=True, frame_sync=True),
+            RasterPixelRunCommand(length=3, dwell_time=0),
+        ]
+
+        async def put_testbench(ctx):
+            ctx.set(dut.bus.data_i, 1000)
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            for word in [0xffff, 123, 4000, 4000, 4000, 4000]:
+                await get_stream(ctx, dut.img_stream, word, timeout_steps=1000)
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_no_triggers")
+
+    def test_free_run_scan_macro(self):
+        ## the bytes that `FreeRunScanCommand` sends to start a live view, up to its first frame
+        class StartStream:
+            def __init__(self):
+                self.written = bytearray()
+                self.responses = [struct.pack(">HH", 0xffff, 123)]
+            async def write(self, data):
+                self.written.extend(data)
+            async def flush(self):
+                pass
+            async def read(self, length):
+                if self.responses:
+                    return memoryview(self.responses.pop(0))
+                return memoryview(struct.pack(">H", FRAME_MARKER) * (length // 2))
+
+        async def start_scan():
+            scan = FreeRunScanCommand(cookie=123, x_range=DACCodeRange(start=5, count=2, step=0x2_00),
+                                      y_range=DACCodeRange(start=9, count=2, step=0x5_00), dwell_time=0)
+            frames = scan.transfer(start_stream, chunk_size=4)
+            await anext(frames)
+            await frames.aclose()
+        start_stream = StartStream()
+        asyncio.run(start_scan())
+
+        dut = QueuedExecutor()
+
+        async def put_testbench(ctx):
+            ctx.set(dut.executor.bus.data_i, 1000)
+            for byte in start_stream.written:
+                await put_stream(ctx, dut.parser.usb_stream, byte, timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            ## the scan keeps running once all commands are sent
+            words = []
+            ctx.set(dut.executor.img_stream.ready, 1)
+            for _ in range(3000):
+                _, _, valid, payload = await ctx.tick().sample(dut.executor.img_stream.valid, dut.executor.img_stream.payload)
+                if valid:
+                    words.append(payload)
+            assert words[:2] == [0xffff, 123]
+            assert words[2:2 + 3*5] == [FRAME_MARKER, 4000, 4000, 4000, 4000]*3, f"{words=}"
+
+        self.simulate(dut, [put_testbench, get_testbench], name="free_run_scan_macro")
+
+    def test_command_executor_raw_sum(self):
+        dut = CommandExecutor(ext_delay_cyc=10)
+        commands = [
+            SynchronizeCommand(cookie=123, raster=True, output=OutputMode.RawSum),
+            RasterRegionCommand(x_range=DACCodeRange(start=5, count=5, step=0x2_00),
+                                y_range=DACCodeRange(start=9, count=2, step=0x5_00)),
+            RasterPixelCommand(dwell_time=2),
+            RasterPixelCommand(dwell_time=6),
+        ]
+
+        async def put_testbench(ctx):
+            ctx.set(dut.bus.data_i, 10000)
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            ## the sum of the samples, high word first
+            for word in [0xffff, 123, 0, 30000, 1, 70000 - 65536]:
+                await get_stream(ctx, dut.img_stream, word, timeout_steps=1000)
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_raw_sum")
+
+    def test_command_executor_timestamps(self):
+        dut = CommandExecutor(ext_delay_cyc=10, timestamp_interval=4)
+        commands = [
+            SynchronizeCommand(cookie=123, raster=True, output=OutputMode.SixteenBit),
+            RasterRegionCommand(x_range=DACCodeRange(start=5, count=5, step=0x2_00),
+                                y_range=DACCodeRange(start=9, count=2, step=0x5_00)),
+            RasterPixelRunCommand(length=9, dwell_time=0),
+        ]
+
+        async def put_testbench(ctx):
+            for command in commands:
+                await put_stream(ctx, dut.cmd_stream, command.as_dict(), timeout_steps=1000)
+
+        async def get_testbench(ctx):
+            words = []
+            ctx.set(dut.img_stream.ready, 1)
+            while len(words) < 2 + 10 + 2*TIMESTAMP_RECORD_WORDS:
+                _, _, valid, payload = await ctx.tick().sample(dut.img_stream.valid, dut.img_stream.payload)
+                if valid:
+                    words.append(payload)
+            assert words[:2] == [0xffff, 123]
+            records = [words[6:13], words[17:24]]
+            assert words[2:6] == words[13:17] == [0]*4 and words[24:] == [0]*2, words
+            for record, sequence in zip(records, [4, 8]):
+                assert record[0] == TIMESTAMP_MARKER
+                assert record[4:] == [0, 0, sequence << 2], record
+            ## the timestamp increases between records
+            assert records[1][1:4] > records[0][1:4]
+
+        self.simulate(dut, [put_testbench, get_testbench], name="exec_timestamps")
+
     def test_command_executor_sequences(self):
         BUS_CYCLES = 6 #combined ADC and DAC latching cycles
         class TestCommand:
@@ -739,13 +1245,16 @@ class OBIAppletTestCase(unittest.TestCase):
                 assert dwell == self.command.dwell_time, f"{dwell} != {self.command.dwell_time}"
         
         class TestRasterPixelFreeRunCommand(TestCommand, command=RasterPixelFreeRunCommand):
-            def __init__(self, *, dwell_time, test_samples):
+            def __init__(self, *, dwell_time, test_samples, frame_markers=()):
                 super().__init__(dwell_time = dwell_time)
                 self.test_samples = test_samples
+                self.frame_markers = frame_markers
 
             @property
             def response(self):
-                return [0]*self.test_samples
+                ## a frame marker is sent before the pixels that start a frame
+                return [word for n in range(self.test_samples)
+                        for word in ([FRAME_MARKER, 0] if n in self.frame_markers else [0])]
             @property
             def exec_cycles(self):
                 return self.command.dwell_time*self.test_samples*BUS_CYCLES
@@ -781,7 +1290,7 @@ class OBIAppletTestCase(unittest.TestCase):
                                                 y_range=DACCodeRange(start=9, count=3, step=0x5_00)))
             test_seq.add(TestRasterPixelRunCommand(length=6, dwell_time=1))
             test_seq.add(TestSyncCommand(cookie=502, raster=True, output=OutputMode.SixteenBit))
-            test_seq.add(TestRasterPixelFreeRunCommand(dwell_time=1, test_samples = 6))
+            test_seq.add(TestRasterPixelFreeRunCommand(dwell_time=1, test_samples = 6, frame_markers=[2]))
             test_seq.add(TestSyncCommand(cookie=502, raster=True, output=OutputMode.SixteenBit))
             test_seq.add(TestSyncCommand(cookie=102, raster=True, output=OutputMode.SixteenBit))
 
@@ -808,11 +1317,11 @@ class OBIAppletTestCase(unittest.TestCase):
             test_seq.add(TestDelayCommand(delay=960))
             test_seq.add(TestRasterRegionCommand(x_range=DACCodeRange(start=5, count=10, step=0x2_00),
                                                 y_range=DACCodeRange(start=9, count=2, step=0x5_00)))
-            test_seq.add(TestRasterPixelFreeRunCommand(dwell_time=1, test_samples=20))
+            test_seq.add(TestRasterPixelFreeRunCommand(dwell_time=1, test_samples=20, frame_markers=[0]))
             test_seq.add(TestSyncCommand(cookie=502, raster=True, output=OutputMode.SixteenBit))
             test_seq.add(TestRasterRegionCommand(x_range=DACCodeRange(start=5, count=10, step=0x2_00),
                                                 y_range=DACCodeRange(start=9, count=2, step=0x5_00)))
-            test_seq.add(TestRasterPixelFreeRunCommand(dwell_time=1, test_samples=20))
+            test_seq.add(TestRasterPixelFreeRunCommand(dwell_time=1, test_samples=20, frame_markers=[0]))
             test_seq.add(TestExternalCtrlCommand(enable=True))
             test_seq.add(TestBeamSelectCommand(beam_type=BeamType.Electron))
             test_seq.add(TestDelayCommand(delay=960))
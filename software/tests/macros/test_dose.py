@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from obi.macros.dose import compile_dose_map, dwell_for_dose, dose_for_dwell
+from obi.macros.vector import encode_vector_pixels
+
+class DoseCompilerTest(unittest.TestCase):
+    beam_current = 1e-9
+    pixel_size = 10e-9
+
+    def delivered_cycles(self, pattern, shape):
+        ## executing a dwell time of d takes d + 1 cycles
+        scale = 16384/max(shape)
+        cycles = np.zeros(shape, dtype=np.int64)
+        rows = np.rint(pattern.points["y_coord"]/scale).astype(int)
+        cols = np.rint(pattern.points["x_coord"]/scale).astype(int)
+        np.add.at(cycles, (rows, cols), pattern.points["dwell_time"].astype(np.int64) + 1)
+        return cycles
+
+    def test_dwell_for_dose(self):
+        ## 1 nA for 1 µs over a 10 nm pixel is 10 C/m², or 1 mC/cm²
+        self.assertAlmostEqual(float(dwell_for_dose(1e-3, 1e-9, 10e-9)), 8)
+        self.assertAlmostEqual(float(dose_for_dwell(8, 1e-9, 10e-9)), 1e-3)
+
+    def test_single_pass(self):
+        dose_map = np.array([[0, 1e-3], [2e-3, 4e-3]])
+        pattern = compile_dose_map(dose_map, self.beam_current, self.pixel_size)
+        self.assertEqual(pattern.passes, 1)
+        self.assertEqual(pattern.cycles.tolist(), [[0, 8], [16, 32]])
+        np.testing.assert_array_equal(self.delivered_cycles(pattern, dose_map.shape), pattern.cycles)
+        self.assertAlmostEqual(pattern.max_dose_error, 0)
+
+    def test_multi_pass(self):
+        cycles = np.array([[1000, 65536], [65537, 200000]])
+        dose_map = dose_for_dwell(cycles, self.beam_current, self.pixel_size)
+        pattern = compile_dose_map(dose_map, self.beam_current, self.pixel_size)
+        self.assertEqual(pattern.passes, 4)
+        self.assertEqual([len(points) for points in pattern.iter_passes()], [4, 2, 1, 1])
+        self.assertLessEqual(int(pattern.points["dwell_time"].max()), 65535)
+        np.testing.assert_array_equal(self.delivered_cycles(pattern, cycles.shape), cycles)
+
+    def test_min_dwell(self):
+        cycles = np.array([[0.4, 1.6], [2.5, 5]])
+        dose_map = dose_for_dwell(cycles, self.beam_current, self.pixel_size)
+        pattern = compile_dose_map(dose_map, self.beam_current, self.pixel_size, min_dwell=4)
+        self.assertEqual(pattern.cycles.tolist(), [[0, 0], [4, 5]])
+        ## 2 cycles cannot be encoded as one point
+        pattern = compile_dose_map(dose_map, self.beam_current, self.pixel_size)
+        self.assertEqual(pattern.cycles.tolist(), [[0, 2], [2, 5]])
+        np.testing.assert_array_equal(self.delivered_cycles(pattern, cycles.shape), pattern.cycles)
+        self.assertEqual(len(pattern.encode()),
+            len(encode_vector_pixels(pattern.points["x_coord"], pattern.points["y_coord"], pattern.points["dwell_time"])))
@@ -0,0 +1,40 @@
+import unittest
+import asyncio
+
+import numpy as np
+
+from obi.macros.drift import measure_shift, DriftTracker
+from obi.commands import DACCodeRange
+
+def blobs(shape, shift=(0, 0), seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:shape[0], 0:shape[1]]
+    image = np.zeros(shape)
+    for cy, cx in rng.uniform(0.2, 0.8, (12, 2))*shape:
+        image += np.exp(-((y - cy - shift[0])**2 + (x - cx - shift[1])**2)/20)
+    return (image*20000).astype(np.uint16)
+
+class DriftTest(unittest.TestCase):
+    def test_measure_shift(self):
+        reference = blobs((128, 160))
+        for shift in [(0, 0), (3, -5), (-7.5, 2.25), (0.4, 10.6)]:
+            measured = measure_shift(reference, blobs((128, 160), shift))
+            np.testing.assert_allclose(measured, shift, atol=0.2)
+
+    def test_tracker(self):
+        async def track():
+            tracker = DriftTracker(downsample=2)
+            x_range = DACCodeRange.from_roi(2048, 500, 160)
+            y_range = DACCodeRange.from_roi(2048, 500, 128)
+            tracker.submit(blobs((128, 160)))
+            x, y = tracker.correct(x_range, y_range)
+            self.assertEqual((x.start, y.start), (x_range.start, y_range.start))
+            await tracker.submit(blobs((128, 160), (4, -6)))
+            np.testing.assert_allclose(tracker.offset, (4, -6), atol=0.5)
+            x, y = tracker.correct(x_range, y_range)
+            self.assertAlmostEqual((x.start - x_range.start)/8, -6, delta=0.5)
+            self.assertAlmostEqual((y.start - y_range.start)/8, 4, delta=0.5)
+            ## a frame acquired with the correction applied only has residual drift
+            await tracker.submit(blobs((128, 160), (1, 0)))
+            np.testing.assert_allclose(tracker.offset, (5, -6), atol=0.5)
+        asyncio.run(track())
@@ -2,13 +2,16 @@ import unittest
 import array
 import asyncio
 import time
+import struct
+
+import numpy as np
 
 import logging
 logger = logging.getLogger()
 
 from obi.macros import Frame, FrameBuffer
-from obi.commands import DACCodeRange
-from obi.transfer import MockConnection, setup_logging
+from obi.commands import DACCodeRange, OutputMode, FRAME_MARKER
+from obi.transfer import MockConnection, MockStream, setup_logging
 
 class FrameTest(unittest.TestCase):
     def test_fill_overflow(self):
@@ -32,6 +35,38 @@ class FrameTest(unittest.TestCase):
         self.assertEqual(f.y_ptr, 2048)
         f.fill_lines(test_pixels)
         self.assertEqual(f.y_ptr, 48)
+    def test_fill_eight_bit(self):
+        test_range = DACCodeRange.from_resolution(256)
+        f = Frame.from_DAC_ranges(x_range=test_range, y_range=test_range, output_mode=OutputMode.EightBit)
+        f.fill_lines(array.array('B', [x for x in range(256)]*256))
+        self.assertEqual(f.canvas.dtype, np.uint8)
+        self.assertIs(f.as_uint8(), f.canvas)
+        self.assertEqual(f.as_uint16().dtype, np.uint16)
+        self.assertEqual(f.as_uint16()[0, 255], 255 << 8)
+    def test_fill_serpentine(self):
+        f = Frame(4, 3, serpentine=True)
+        expected = np.arange(12, dtype=np.uint16).reshape(3, 4)
+        ## odd lines arrive from right to left
+        scanned = expected.copy()
+        scanned[1] = scanned[1, ::-1]
+        scanned = array.array('H', scanned.ravel().tobytes())
+        f.fill_lines(scanned[:4])
+        f.fill_lines(scanned[4:])
+        np.testing.assert_array_equal(f.canvas, expected)
+        ## the next frame starts from the left again
+        f.fill_lines(scanned[:8])
+        np.testing.assert_array_equal(f.canvas, expected)
+        f.fill(scanned)
+        np.testing.assert_array_equal(f.canvas, expected)
+
+class ScriptedStream(MockStream):
+    def __init__(self, words):
+        self.data = bytearray(struct.pack(f">{len(words)}H", *words))
+
+    async def read(self, length):
+        data, self.data = self.data[:length], self.data[length:]
+        return memoryview(bytes(data).ljust(length, b"\0"))
+
 
 class FrameBufferTest(unittest.TestCase):
     def test_raster_abort(self):
@@ -70,6 +105,23 @@ class FrameBufferTest(unittest.TestCase):
                 pass
         asyncio.run(test_fn())
 
+    def test_raster_rois(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            fb = FrameBuffer(conn)
+            fb._set_current_frame(2048, 2048)
+            fb.current_frame.canvas[:] = 1
+            rois = [dict(x_start=100, x_count=100, y_start=100, y_count=100, dwell_time=200),
+                    dict(x_start=1000, x_count=20, y_start=10, y_count=500, dwell_time=2)]
+            async for frame in fb.capture_frame_rois(x_res=2048, y_res=2048, rois=rois):
+                pass
+            ## the mock connection returns zeros, which are filled into each region
+            self.assertEqual(int(frame.canvas[100:200, 100:200].sum()), 0)
+            self.assertEqual(int(frame.canvas[10:510, 1000:1020].sum()), 0)
+            self.assertEqual(int(frame.canvas.sum()), 2048*2048 - 100*100 - 20*500)
+        asyncio.run(test_fn())
+
     def test_vector(self):
         async def test_fn():
             conn = MockConnection()
@@ -80,5 +132,64 @@ class FrameBufferTest(unittest.TestCase):
             # import dis
             # print(dis.dis(fb.capture_vector_frame()))
         asyncio.run(test_fn())
-        
 
+    def test_fill_stats(self):
+        fb = FrameBuffer(None)
+        frame = Frame(16, 8)
+        pixels = array.array('H', range(16*6))
+        fb._fill_lines(frame, pixels)
+        self.assertEqual(fb.stats.lines, 6)
+        self.assertIsNone(fb.last_stats)
+        ## roll over to the top of the frame
+        fb._fill_lines(frame, pixels)
+        self.assertEqual(fb.last_stats.lines, 8)
+        self.assertEqual(fb.stats.lines, 4)
+        self.assertEqual(fb.stats.max, 16*6 - 1)
+
+    def test_raster_eight_bit(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            fb = FrameBuffer(conn)
+            async for frame in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=1,
+                                                     output_mode=OutputMode.EightBit):
+                pass
+            self.assertEqual(fb.current_frame.canvas.dtype, np.uint8)
+            self.assertEqual(fb.stats.count, 256*256)
+            ## a photo after live view starts a new 16-bit frame
+            async for frame in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=1):
+                pass
+            self.assertEqual(fb.current_frame.canvas.dtype, np.uint16)
+        asyncio.run(test_fn())
+
+    def test_raster_raw_sum(self):
+        ## sums of samples do not fit the 16-bit statistics and display, so frames are not scanned with them
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            fb = FrameBuffer(conn)
+            with self.assertRaises(ValueError):
+                async for frame in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=1,
+                                                         output_mode=OutputMode.RawSum):
+                    pass
+            self.assertIsNone(fb.current_frame)
+            with self.assertRaises(ValueError):
+                fb._fill_lines(Frame(16, 8, OutputMode.RawSum), array.array('I', range(16*8)))
+        asyncio.run(test_fn())
+
+    def test_live(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            ## the second frame lost pixels, so the third one starts early
+            conn._stream = ScriptedStream([0xffff, 123, 8, FRAME_MARKER, *[4]*128*128,
+                                           FRAME_MARKER, *[8]*(128*3 + 5), FRAME_MARKER, *[12]*128*128])
+            fb = FrameBuffer(conn)
+            lines = []
+            async for frame in fb.capture_live(x_res=128, y_res=128, dwell_time=1):
+                lines.append(frame.y_ptr)
+                if frame.y_ptr == 128 and frame.canvas[0, 0] == 12:
+                    fb.abort_scan()
+            self.assertEqual(lines, [127, 128, 3, 124, 128])
+            self.assertTrue((fb.current_frame.canvas == 12).all())
+        asyncio.run(test_fn())
@@ -0,0 +1,46 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+import numpy as np
+import tifffile
+
+from obi.macros import Frame, ImageWriter, ImageMetadata
+
+class ImageWriterTest(unittest.TestCase):
+    def test_save(self):
+        async def test_fn():
+            with tempfile.TemporaryDirectory() as directory:
+                writer = ImageWriter()
+                frame = Frame(32, 16)
+                frame.canvas[:] = np.arange(32, dtype=np.uint16)*1000
+                save = writer.save(frame, os.path.join(directory, "photo"),
+                    ImageMetadata(dwell_time=7, beam="electron", magnification=1000, pixel_size=2e-9),
+                    bit_depth_8=True)
+                ## the frame can be overwritten as soon as saving has started
+                frame.canvas[:] = 0
+                path = await save
+                writer.close()
+                with tifffile.TiffFile(path) as tif:
+                    self.assertTrue(tif.is_ome)
+                    self.assertTrue((tif.asarray() == np.arange(32)*1000).all())
+                    self.assertIn('PhysicalSizeX="0.002"', tif.ome_metadata)
+                    self.assertIn('<M K="DwellTimeSeconds">1e-06</M>', tif.ome_metadata)
+                    self.assertIn('<M K="Beam">electron</M>', tif.ome_metadata)
+                eight_bit = tifffile.imread(os.path.join(directory, "photo_8bit.tif"))
+                self.assertEqual(eight_bit.dtype, np.uint8)
+                self.assertEqual(eight_bit[0, 31], 31000 >> 8)
+        asyncio.run(test_fn())
+
+    def test_close(self):
+        async def test_fn():
+            with tempfile.TemporaryDirectory() as directory:
+                with ImageWriter() as writer:
+                    saves = [writer.save(Frame(64, 64), os.path.join(directory, f"photo{n}")) for n in range(4)]
+                ## leaving the context waits for every file
+                self.assertEqual(len(os.listdir(directory)), 4)
+                with self.assertRaises(RuntimeError):
+                    writer.save(Frame(64, 64), os.path.join(directory, "late"))
+                await asyncio.gather(*saves)
+        asyncio.run(test_fn())
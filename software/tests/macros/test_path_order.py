@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from obi.macros.path_order import PathOrder, order_points, path_stats
+
+class PathOrderTest(unittest.TestCase):
+    def test_permutation(self):
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 16384, 2000)
+        y = rng.integers(0, 16384, 2000)
+        for order in PathOrder:
+            indices = order_points(x, y, order)
+            self.assertEqual(sorted(indices.tolist()), list(range(2000)), order)
+
+    def test_serpentine(self):
+        x = np.array([0, 1, 2, 0, 1, 2, 0, 1, 2])
+        y = np.array([0, 0, 0, 5, 5, 5, 9, 9, 9])
+        indices = order_points(x, y, PathOrder.Serpentine)
+        self.assertEqual(x[indices].tolist(), [0, 1, 2, 2, 1, 0, 0, 1, 2])
+        self.assertEqual(path_stats(x[indices], y[indices], jump_threshold=5).jumps, 0)
+
+    def test_hilbert(self):
+        ## every step along a Hilbert curve over a full grid moves to an adjacent point
+        x, y = np.meshgrid(np.arange(16), np.arange(16))
+        x, y = x.ravel(), y.ravel()
+        indices = order_points(x, y, PathOrder.Hilbert)
+        steps = np.abs(np.diff(x[indices])) + np.abs(np.diff(y[indices]))
+        self.assertTrue((steps == 1).all())
+
+    def test_contour(self):
+        ## two concentric square outlines
+        x, y = [], []
+        for size in (10, 20):
+            for i in range(size):
+                x += [i, size, size - i, 0]
+                y += [0, i, size, size - i]
+        x, y = np.array(x)*16, np.array(y)*16
+        raster = path_stats(*[a[order_points(x, y, PathOrder.Raster)] for a in (x, y)], jump_threshold=16)
+        contour = path_stats(*[a[order_points(x, y, PathOrder.Contour)] for a in (x, y)], jump_threshold=16)
+        self.assertEqual(contour.jumps, 1)
+        self.assertLess(contour.settle_time, raster.settle_time)
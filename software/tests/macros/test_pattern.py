@@ -0,0 +1,110 @@
+import unittest
+import asyncio
+import struct
+
+from obi.macros import PatternFile, PatternWriteCommand
+from obi.transfer import MockStream, TransferError
+from obi.commands import *
+
+class SyncStream(MockStream):
+    """
+    Records written data, and acknowledges every synchronization with the given cookie.
+    """
+    def __init__(self, cookie):
+        self.written = bytearray()
+        self.ack = struct.pack(">HH", 0xffff, cookie)
+
+    async def write(self, data):
+        self.written.extend(data)
+
+    async def read(self, length):
+        if length == 4:
+            return memoryview(self.ack)
+        return memoryview(bytes(length))
+
+
+def make_pattern(lines=20, points_per_line=4, dwell=100):
+    stream = bytearray()
+    offsets, dwells, pixels = [], [], []
+    for y in range(lines):
+        offsets.append(len(stream))
+        for x in range(points_per_line):
+            stream.extend(bytes(VectorPixelCommand(x_coord=x, y_coord=y, dwell_time=dwell)))
+        dwells.append(points_per_line*dwell)
+        pixels.append(points_per_line)
+    offsets.append(len(stream))
+    stream.extend(bytes(BlankCommand(enable=True)))
+    dwells.append(0)
+    pixels.append(0)
+    return PatternFile(bytes(stream), offsets, dwells, pixels)
+
+
+class PatternWriteTest(unittest.TestCase):
+    sync = bytes(SynchronizeCommand(cookie=123, raster=False, output=OutputMode.NoOutput))
+
+    async def write(self, cmd, stream, abort_after=None, **kwargs):
+        progress = []
+        async for elapsed_dwell, res in cmd.transfer(stream, **kwargs):
+            progress.append(elapsed_dwell)
+            if abort_after is not None and len(progress) == abort_after:
+                cmd.abort.set()
+        return progress
+
+    def test_write(self):
+        pattern = make_pattern()
+        cmd = PatternWriteCommand(pattern, cookie=123, max_pipeline=2)
+        stream = SyncStream(123)
+        progress = asyncio.run(self.write(cmd, stream, latency=2000))
+        ## the final chunk only blanks the beam
+        self.assertEqual(progress, [2000, 4000, 6000, 8000, 8000])
+        self.assertEqual(cmd.progress, 1.)
+        ## every chunk is followed by synchronization, and the stream contains the whole pattern
+        self.assertEqual(stream.written.replace(self.sync, b""), bytes(pattern.stream))
+        self.assertEqual(stream.written.count(self.sync), 6)
+
+    def test_readback(self):
+        pattern = make_pattern()
+        cmd = PatternWriteCommand(pattern, cookie=123, output_mode=OutputMode.SixteenBit)
+        async def readback():
+            return [res async for _, res in cmd.transfer(SyncStream(123), latency=2000)]
+        self.assertEqual([len(res) for res in asyncio.run(readback())], [20, 20, 20, 20, 0])
+
+    def test_abort(self):
+        pattern = make_pattern()
+        cmd = PatternWriteCommand(pattern, cookie=123, max_pipeline=1)
+        stream = SyncStream(123)
+        progress = asyncio.run(self.write(cmd, stream, abort_after=1, latency=400))
+        self.assertLess(cmd.progress, 1.)
+        ## the last chunk acknowledged is the blanking sequence
+        self.assertEqual(progress[-1], progress[-2])
+        self.assertTrue(stream.written.endswith(bytes(BlankCommand(enable=True, inline=False)) + self.sync))
+
+    def test_pipeline_depth(self):
+        class DepthStream(SyncStream):
+            def __init__(self, cookie, sync):
+                super().__init__(cookie)
+                self.sync = sync
+                self.depth = self.max_depth = 0
+
+            async def write(self, data):
+                await super().write(data)
+                self.depth += bytes(data).count(self.sync)
+                self.max_depth = max(self.max_depth, self.depth)
+
+            async def read(self, length):
+                if length == 4:
+                    self.depth -= 1
+                return await super().read(length)
+
+        cmd = PatternWriteCommand(make_pattern(), cookie=123, max_pipeline=2)
+        stream = DepthStream(123, self.sync)
+        progress = asyncio.run(self.write(cmd, stream, abort_after=1, latency=400))
+        self.assertEqual(stream.max_depth, 2)
+        ## no chunk is sent once the abort has been seen, only the blanking sequence
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(stream.depth, 0)
+
+    def test_desynchronized(self):
+        cmd = PatternWriteCommand(make_pattern(), cookie=123)
+        with self.assertRaises(TransferError):
+            asyncio.run(self.write(cmd, SyncStream(456)))
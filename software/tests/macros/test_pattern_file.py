@@ -0,0 +1,115 @@
+import unittest
+import unittest.mock
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from obi.macros import BitmapVectorPattern, PatternFile, PatternCache
+from obi.macros import PathOrder
+from obi.commands import VectorPixelCommand
+
+class PatternFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_round_trip(self):
+        stream = bytes(range(32))
+        pattern = PatternFile(stream, [0, 4, 20], [0, 100, 7], [0, 50, 1], content_hash=b"\x5a"*32)
+        path = os.path.join(self.tmpdir.name, "test.obip")
+        pattern.save(path)
+        loaded = PatternFile.load(path)
+        self.assertEqual(bytes(loaded.stream), stream)
+        self.assertEqual(loaded.content_hash, b"\x5a"*32)
+        self.assertEqual(loaded.total_dwell, 107)
+        self.assertEqual(loaded.total_pixels, 51)
+        chunks = [(bytes(chunk), dwell, pixels) for chunk, dwell, pixels in loaded.iter_chunks()]
+        self.assertEqual(chunks, [(stream[0:4], 0, 0), (stream[4:20], 100, 50), (stream[20:], 7, 1)])
+        loaded.close()
+
+    def test_load_invalid(self):
+        path = os.path.join(self.tmpdir.name, "bad.obip")
+        with open(path, "wb") as f:
+            f.write(b"\x00"*128)
+        self.assertRaises(ValueError, lambda: PatternFile.load(path))
+
+    def test_cache(self):
+        im_path = os.path.join(self.tmpdir.name, "pattern.png")
+        Image.fromarray(np.arange(64, dtype=np.uint8).reshape(8, 8)*4).save(im_path)
+        bmp = BitmapVectorPattern(im_path)
+        bmp.rescale(8, 10, False)
+        bmp.vector_convert(lambda p: None)
+        cache = PatternCache(os.path.join(self.tmpdir.name, "cache"))
+        self.assertIsNone(cache.get(bmp.content_hash))
+        cache.put(bmp.to_pattern_file())
+        content_hash = PatternFile.hash_source(im_path, resolution=8, max_dwell=10, invert=False,
+                                               order=PathOrder.Raster.name)
+        cached = cache.get(content_hash)
+        self.assertEqual(bytes(cached.stream), bytes(bmp.pattern_seq))
+        cached.close()
+        ## the same points in another order are not found in the cache
+        bmp.vector_convert(lambda p: None, PathOrder.Serpentine)
+        self.assertNotEqual(bmp.content_hash, content_hash)
+        self.assertIsNone(cache.get(bmp.content_hash))
+
+    def test_cache_default_directory(self):
+        ## the cache is found the same way regardless of the working directory
+        cache_home = os.path.join(self.tmpdir.name, "cache_home")
+        with unittest.mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache_home}):
+            cwd = os.getcwd()
+            try:
+                os.chdir(self.tmpdir.name)
+                directory = PatternCache().directory
+            finally:
+                os.chdir(cwd)
+        if os.name != "nt":
+            self.assertEqual(directory, os.path.join(cache_home, "obi", "patterns"))
+        self.assertTrue(os.path.isabs(directory))
+
+
+class BitmapVectorPatternTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def convert(self, pixels, resolution, max_dwell, invert=False):
+        path = os.path.join(self.tmpdir.name, "pattern.png")
+        Image.fromarray(pixels).save(path)
+        bmp = BitmapVectorPattern(path)
+        bmp.rescale(resolution, max_dwell, invert)
+        bmp.vector_convert(lambda p: None)
+        return bmp
+
+    def test_encoding(self):
+        pixels = (np.arange(24*16, dtype=np.uint16).reshape(24, 16) % 5 * 63).astype(np.uint8)
+        bmp = self.convert(pixels, 24, 4)
+        scale = 16384/24
+        expected = bytearray()
+        for y, row in enumerate(bmp.pattern_array):
+            for x in np.nonzero(row)[0]:
+                expected.extend(bytes(VectorPixelCommand(x_coord=int(x*scale), y_coord=int(y*scale), dwell_time=int(row[x]))))
+        chunks = [bytes(chunk) for chunk, _, _ in bmp.to_pattern_file().iter_chunks()]
+        self.assertEqual(b"".join(chunks[1:-1]), bytes(expected))
+        self.assertEqual(len(chunks), 24 + 2)
+
+    def test_16_bit(self):
+        pixels = np.array([[0, 0x8000], [0xffff, 1]], dtype=np.uint16)
+        bmp = self.convert(pixels, 2, 1000)
+        np.testing.assert_array_equal(bmp.pattern_array, [[0, 500], [1000, 0]])
+        bmp = self.convert(pixels, 2, 1000, invert=True)
+        np.testing.assert_array_equal(bmp.pattern_array, [[1000, 499], [0, 999]])
+
+    def test_path_order(self):
+        pixels = np.zeros((32, 32), dtype=np.uint8)
+        pixels[4:28, 4] = pixels[4:28, 27] = pixels[4, 4:28] = pixels[27, 4:28] = 255
+        raster = self.convert(pixels, 32, 10)
+        for order in PathOrder:
+            bmp = self.convert(pixels, 32, 10)
+            bmp.vector_convert(lambda p: None, order=order)
+            pattern = bmp.to_pattern_file()
+            self.assertEqual(pattern.total_dwell, raster.to_pattern_file().total_dwell)
+            self.assertEqual(len(bmp.pattern_seq), len(raster.pattern_seq))
+        self.assertGreater(bmp.path_report.travel_saved, 0)
+        self.assertGreater(bmp.path_report.settle_time_saved, 0)
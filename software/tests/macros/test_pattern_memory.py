@@ -0,0 +1,59 @@
+import unittest
+import asyncio
+import struct
+
+from obi.macros import PatternReplayMacro
+from obi.commands import *
+from .test_pattern import SyncStream
+
+
+class PatternReplayTest(unittest.TestCase):
+    sync = bytes(SynchronizeCommand(cookie=123, raster=False, output=OutputMode.NoOutput))
+
+    async def replay(self, cmd, stream, abort_after=None):
+        progress = []
+        async for completed_passes, res in cmd.transfer(stream):
+            progress.append(completed_passes)
+            if abort_after is not None and len(progress) == abort_after:
+                cmd.abort.set()
+        return progress
+
+    def test_replay(self):
+        cmd = PatternReplayMacro([1, 2, 3], [4, 5, 6], [7, 8, 9], passes=40, cookie=123, passes_per_chunk=16)
+        stream = SyncStream(123)
+        progress = asyncio.run(self.replay(cmd, stream))
+        self.assertEqual(progress, [16, 32, 40])
+        self.assertEqual(cmd.progress, 1.)
+        ## the points are sent once, followed by one replay for each chunk
+        load = bytes(PatternLoadCommand(address=0, length=2)) + \
+            bytes(ArrayCommand(cmdtype=CmdType.VectorPixel, array_length=2)) + \
+            struct.pack(">9H", 1, 4, 7, 2, 5, 8, 3, 6, 9)
+        self.assertEqual(bytes(stream.written), self.sync + load + self.sync +
+            bytes(PatternReplayCommand(address=0, length=2, repeat=15)) + self.sync +
+            bytes(PatternReplayCommand(address=0, length=2, repeat=15)) + self.sync +
+            bytes(PatternReplayCommand(address=0, length=2, repeat=7)) + self.sync)
+
+    def test_dwell_scales(self):
+        cmd = PatternReplayMacro([1], [1], [100], passes=3, cookie=123, dwell_scales=[1, 0.5, 2], address=5)
+        stream = SyncStream(123)
+        self.assertEqual(asyncio.run(self.replay(cmd, stream)), [1, 2, 3])
+        for scale in [1, 0.5, 2]:
+            self.assertIn(bytes(PatternReplayCommand(address=5, length=0, scale=fp8_8(scale))), stream.written)
+
+    def test_readback(self):
+        cmd = PatternReplayMacro([1, 2, 3], [1, 2, 3], [1, 1, 1], passes=3, cookie=123,
+                                 output_mode=OutputMode.SixteenBit, passes_per_chunk=2)
+        async def readback():
+            return [res async for _, res in cmd.transfer(SyncStream(123))]
+        self.assertEqual([len(res) for res in asyncio.run(readback())], [6, 3])
+
+    def test_abort(self):
+        cmd = PatternReplayMacro([1], [1], [100], passes=10, cookie=123, passes_per_chunk=1)
+        stream = SyncStream(123)
+        progress = asyncio.run(self.replay(cmd, stream, abort_after=2))
+        self.assertEqual(progress, [1, 2])
+        self.assertTrue(stream.written.endswith(bytes(BlankCommand(enable=True, inline=False)) + self.sync))
+
+    def test_too_long(self):
+        with self.assertRaises(ValueError):
+            PatternReplayMacro([0]*10, [0]*10, [1]*10, passes=1, cookie=123, address=PATTERN_MEMORY_DEPTH - 5)
@@ -1,14 +1,15 @@
 import unittest
 import array
 import asyncio
+import struct
 
 import logging
 logger = logging.getLogger()
 
-from obi.macros import RasterScanCommand
-from obi.commands import DACCodeRange
+from obi.macros import RasterScanCommand, MultiRegionScanCommand, ScanRegion, FreeRunScanCommand
+from obi.commands import *
 
-from obi.transfer.mock import MockConnection
+from obi.transfer.mock import MockConnection, MockStream
 from obi.transfer import dump_hex
 
 
@@ -26,4 +27,83 @@ class RasterScanTest(unittest.TestCase):
         asyncio.run(self.scan())
         self.assertTrue(True)
 
-        
\ No newline at end of file
+        
+
+
+class RecordingStream(MockStream):
+    def __init__(self):
+        self.written = bytearray()
+
+    async def write(self, data):
+        self.written.extend(data)
+
+
+class MultiRegionScanTest(unittest.TestCase):
+    def test_scan(self):
+        regions = [
+            ScanRegion(x_range=DACCodeRange.from_roi(2048, 100, 10), y_range=DACCodeRange.from_roi(2048, 100, 20), dwell_time=2),
+            ScanRegion(x_range=DACCodeRange.from_roi(2048, 900, 300), y_range=DACCodeRange.from_roi(2048, 50, 300), dwell_time=10),
+            ScanRegion(x_range=DACCodeRange.from_roi(2048, 0, 1), y_range=DACCodeRange.from_roi(2048, 0, 1), dwell_time=65535),
+        ]
+        test_cmd = MultiRegionScanCommand(cookie=123, regions=regions)
+        stream = RecordingStream()
+        async def scan():
+            pixels = [0]*len(regions)
+            async for index, chunk in test_cmd.transfer(stream, latency=65536):
+                pixels[index] += len(chunk)
+            return pixels
+        pixels = asyncio.run(scan())
+        self.assertEqual(pixels, [200, 90000, 1])
+        ## all regions are scanned behind a single synchronization
+        sync = bytes(SynchronizeCommand(cookie=123, raster=True, output=OutputMode.SixteenBit))
+        self.assertTrue(stream.written.startswith(sync))
+        self.assertEqual(stream.written.count(sync), 1)
+        for region in regions:
+            self.assertIn(bytes(RasterRegionCommand(x_range=region.x_range, y_range=region.y_range)), stream.written)
+
+    def test_scan_packed(self):
+        region = ScanRegion(x_range=DACCodeRange.from_roi(2048, 0, 11), y_range=DACCodeRange.from_roi(2048, 0, 3), dwell_time=2)
+        test_cmd = MultiRegionScanCommand(cookie=123, regions=[region], output_mode=OutputMode.FourteenBitPacked)
+        stream = RecordingStream()
+        async def scan():
+            pixels = 0
+            async for index, chunk in test_cmd.transfer(stream, latency=8):
+                self.assertEqual(chunk.typecode, 'H')
+                pixels += len(chunk)
+            return pixels
+        self.assertEqual(asyncio.run(scan()), 33)
+        ## a second synchronization makes the device send the last partial byte
+        sync = bytes(SynchronizeCommand(cookie=123, raster=True, output=OutputMode.FourteenBitPacked))
+        self.assertEqual(stream.written.count(sync), 2)
+
+
+class FreeRunStream(RecordingStream):
+    def __init__(self, words):
+        super().__init__()
+        self.data = bytearray(struct.pack(f">{len(words)}H", *words))
+
+    async def read(self, length):
+        data, self.data = self.data[:length], self.data[length:]
+        return memoryview(bytes(data).ljust(length, b"\0"))
+
+
+class FreeRunScanTest(unittest.TestCase):
+    def test_scan(self):
+        test_range = DACCodeRange.from_resolution(256)
+        test_cmd = FreeRunScanCommand(cookie=123, x_range=test_range, y_range=test_range, dwell_time=0)
+        ## pixels from before the scan started are dropped until the first frame marker
+        stream = FreeRunStream([0xffff, 123, 4, 8, FRAME_MARKER, 12, 16, 20, 24, FRAME_MARKER, 28, 32])
+        async def scan():
+            segments = []
+            async for frame_start, pixels in test_cmd.transfer(stream, chunk_size=5):
+                segments.append((frame_start, pixels.tolist()))
+                if len(segments) == 4:
+                    test_cmd.abort.set()
+            return segments
+        self.assertEqual(asyncio.run(scan()),
+            [(True, [12, 16]), (False, [20, 24]), (True, [28, 32]), (False, [0]*5)])
+        self.assertIn(bytes(RasterPixelFreeRunCommand(dwell_time=0)), stream.written)
+        ## the scan is ended by blanking the beam
+        self.assertTrue(stream.written.endswith(
+            bytes(BlankCommand(enable=True, inline=False)) +
+            bytes(SynchronizeCommand(cookie=123, raster=True, output=OutputMode.SixteenBit))))
@@ -0,0 +1,112 @@
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+import tifffile
+
+from obi.macros import FrameBuffer, FrameRecorder, ScanRegion
+from obi.commands import DACCodeRange, FRAME_MARKER
+from obi.transfer import MockConnection, MockStream
+
+class FrameRecorderTest(unittest.TestCase):
+    def test_record(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "live.tif")
+            recorder = FrameRecorder(path)
+            for n in range(3):
+                lines = np.full((4, 8), n, dtype=np.uint16)
+                self.assertTrue(recorder.record(lines, dwell_time=n))
+            ## a frame made of bands of lines, with 8-bit pixels
+            self.assertTrue(recorder.record([np.full((1, 8), 1, dtype=np.uint8), np.full((3, 8), 2, dtype=np.uint8)]))
+            recorder.close()
+            self.assertEqual(recorder.recorded, 4)
+            with tifffile.TiffFile(path) as tif:
+                self.assertEqual(len(tif.pages), 4)
+                for n, page in enumerate(tif.pages[:3]):
+                    self.assertEqual(page.asarray()[0, 0], n)
+                    self.assertEqual(json.loads(page.description)["dwell_time"], n)
+                self.assertEqual(tif.pages[3].asarray()[:, 0].tolist(), [0x100, 0x200, 0x200, 0x200])
+
+    def test_drop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = FrameRecorder(os.path.join(directory, "live.tif"), max_queue=2)
+            ## hold up the writer thread, as a slow disk would
+            blocked = threading.Event()
+            write = recorder._queue.get
+            def slow_get():
+                blocked.wait()
+                return write()
+            recorder._queue.get = slow_get
+            results = [recorder.record(np.zeros((4, 8), dtype=np.uint16)) for _ in range(5)]
+            self.assertEqual(results.count(False), recorder.dropped)
+            self.assertGreaterEqual(recorder.dropped, 2)
+            blocked.set()
+            recorder.close()
+            self.assertEqual(recorder.recorded + recorder.dropped, 5)
+
+    def test_capture_full_frame(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            fb = FrameBuffer(conn)
+            with tempfile.TemporaryDirectory() as directory:
+                fb.recorder = FrameRecorder(os.path.join(directory, "live.tif"))
+                for _ in range(2):
+                    async for frame in fb.capture_full_frame(x_res=256, y_res=256, dwell_time=1):
+                        pass
+                fb.recorder.close()
+                self.assertEqual(fb.recorder.recorded, 2)
+        asyncio.run(test_fn())
+
+    def test_capture_live(self):
+        class LiveStream(MockStream):
+            ## two complete frames of 128 x 128 pixels, then the first lines of a third
+            def __init__(self):
+                words = [0xffff, 123]
+                for n in range(2):
+                    words += [FRAME_MARKER, *[4*(n + 1)]*128*128]
+                words += [FRAME_MARKER, *[12]*128*4]
+                self.data = bytearray(np.array(words, dtype=">u2").tobytes())
+
+            async def read(self, length):
+                data, self.data = self.data[:length], self.data[length:]
+                return memoryview(bytes(data).ljust(length, b"\0"))
+
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            conn._stream = LiveStream()
+            fb = FrameBuffer(conn)
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "live.tif")
+                fb.recorder = FrameRecorder(path)
+                async for frame in fb.capture_live(x_res=128, y_res=128, dwell_time=1):
+                    if frame.canvas[0, 0] == 12:
+                        fb.abort_scan()
+                fb.recorder.close()
+                ## the incomplete frame is not recorded
+                self.assertEqual(fb.recorder.recorded, 2)
+                with tifffile.TiffFile(path) as tif:
+                    self.assertEqual([int(page.asarray().max()) for page in tif.pages], [4, 8])
+        asyncio.run(test_fn())
+
+    def test_capture_regions(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            fb = FrameBuffer(conn)
+            regions = [ScanRegion(x_range=DACCodeRange.from_roi(2048, 0, 10), y_range=DACCodeRange.from_roi(2048, 0, 20),
+                                  dwell_time=2) for _ in range(3)]
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "regions.tif")
+                fb.recorder = FrameRecorder(path)
+                await fb.capture_regions(regions=regions)
+                fb.recorder.close()
+                self.assertEqual(fb.recorder.recorded, 3)
+                with tifffile.TiffFile(path) as tif:
+                    self.assertEqual(tif.pages[0].shape, (20, 10))
+        asyncio.run(test_fn())
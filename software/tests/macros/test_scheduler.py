@@ -0,0 +1,77 @@
+import unittest
+import asyncio
+import os
+import tempfile
+
+from obi.macros.scheduler import AcquisitionScheduler, ScanJob, PatternJob, JobState, Job
+from obi.macros import ScanRegion, PatternFile
+from obi.commands import DACCodeRange
+from obi.transfer import MockConnection
+
+def make_job(resolution, **kwargs):
+    r = DACCodeRange.from_resolution(resolution)
+    return ScanJob.frame(r, r, dwell_time=1, **kwargs)
+
+class SchedulerTest(unittest.TestCase):
+    def test_priority(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            scheduler = AcquisitionScheduler(conn)
+            low = scheduler.submit(make_job(256, name="low"))
+            pattern = scheduler.submit(PatternJob(path="missing.obip", name="pattern", priority=1))
+            high = scheduler.submit(make_job(512, name="high", priority=2, repeat=3))
+            self.assertEqual([job.name for job in scheduler.pending], ["high", "pattern", "low"])
+            await scheduler.run()
+            self.assertEqual([job.name for job in scheduler.history], ["high", "pattern", "low"])
+            self.assertEqual(high.state, JobState.Done)
+            self.assertEqual([frame.np_shape for frame in high.frames], [(512, 512)]*3)
+            ## a job that fails does not stop the queue
+            self.assertEqual(pattern.state, JobState.Failed)
+            self.assertEqual(low.state, JobState.Done)
+            self.assertEqual(low.frames[0].np_shape, (256, 256))
+        asyncio.run(test_fn())
+
+    def test_chain(self):
+        async def test_fn():
+            conn = MockConnection()
+            await conn._connect()
+            scheduler = AcquisitionScheduler(conn, chain_limit=2)
+            for n in range(3):
+                scheduler.submit(make_job(256, name=str(n)))
+            self.assertEqual([job.name for job in scheduler._next_batch()], ["0", "1"])
+            await scheduler.run()
+            self.assertTrue(all(job.state == JobState.Done for job in scheduler.history))
+        asyncio.run(test_fn())
+
+    def test_cancel_prepared(self):
+        async def test_fn(path):
+            scheduler = AcquisitionScheduler(MockConnection())
+            job = scheduler.submit(PatternJob(path=path, name="pattern"))
+            command = await scheduler._prepare([job])
+            self.assertIsNotNone(command._pattern.stream)
+            scheduler.cancel(job)
+            await asyncio.sleep(0)
+            ## the pattern that will not run is no longer mapped
+            self.assertIsNone(command._pattern.stream)
+            self.assertEqual(scheduler._prepared, {})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "pattern.obip")
+            PatternFile(bytes(16), [0], [0], [0]).save(path)
+            asyncio.run(test_fn(path))
+
+    def test_state(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "queue.json")
+            scheduler = AcquisitionScheduler(None, state_path=path)
+            roi = ScanRegion(x_range=DACCodeRange(start=100, count=20, step=256),
+                             y_range=DACCodeRange(start=200, count=10, step=512), dwell_time=4)
+            scheduler.submit(ScanJob(regions=[roi], name="roi", repeat=2, save_dir="out"))
+            scheduler.submit(PatternJob(path="pattern.obip", name="pattern", priority=5))
+
+            restored = AcquisitionScheduler(None, state_path=path)
+            jobs = restored.load_state()
+            self.assertEqual([job.name for job in restored.pending], ["pattern", "roi"])
+            self.assertEqual(jobs[1].regions, [roi])
+            self.assertEqual((jobs[1].repeat, jobs[1].save_dir), (2, "out"))
+            self.assertEqual(Job.from_dict(jobs[0].to_dict()), jobs[0])
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+
+from obi.macros.stats import FrameStatistics
+
+class FrameStatisticsTest(unittest.TestCase):
+    def test_incremental(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 65536, (64, 48), dtype=np.uint16)
+        stats = FrameStatistics()
+        for start in range(0, 64, 10):
+            stats.update(image[start:start + 10])
+        self.assertEqual(stats.count, image.size)
+        self.assertEqual(stats.lines, 64)
+        self.assertEqual(stats.min, image.min())
+        self.assertEqual(stats.max, image.max())
+        self.assertAlmostEqual(stats.mean, image.mean())
+        self.assertAlmostEqual(stats.variance, image.var(), places=3)
+        self.assertTrue((stats.histogram == np.bincount(image.ravel(), minlength=65536)).all())
+        ## gradients across band boundaries are included
+        values = image.astype(np.int64)
+        dx, dy = np.diff(values, axis=1), np.diff(values, axis=0)
+        self.assertAlmostEqual(stats.sharpness, ((dx*dx).sum() + (dy*dy).sum())/(dx.size + dy.size))
+
+    def test_sharpness(self):
+        edge = np.zeros((32, 32), dtype=np.uint16)
+        edge[:, 16:] = 40000
+        blurred = np.zeros((32, 32), dtype=np.uint16)
+        blurred[:] = np.clip(np.arange(32) - 8, 0, 16)*2500
+        sharp_stats, blurred_stats = FrameStatistics(), FrameStatistics()
+        sharp_stats.update(edge)
+        blurred_stats.update(blurred)
+        self.assertGreater(sharp_stats.sharpness, blurred_stats.sharpness)
+
+    def test_auto_levels(self):
+        image = np.full((100, 100), 1000, dtype=np.uint16)
+        image[:, 50:] = 3000
+        image[0, 0] = 0
+        image[0, 1] = 65535
+        stats = FrameStatistics()
+        stats.update(image)
+        self.assertEqual(stats.auto_levels(), (1000, 3000))
+        self.assertEqual(stats.auto_levels(0, 100), (0, 65535))
+        stats.reset()
+        self.assertEqual(stats.count, 0)
+        self.assertEqual(stats.auto_levels(), (0, 1))
@@ -0,0 +1,71 @@
+import unittest
+import asyncio
+import struct
+
+import numpy as np
+
+from obi.transfer import TCPConnection
+from obi.transfer.tcp import CompressedTCPStream, TCPStream
+from obi.transfer.compress import BANNER, OPT_IN, WireEncoder, WireDecoder
+
+class WireCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        data = rng.integers(0, 256, 10000, dtype=np.uint8).tobytes()
+        for delta in (False, True):
+            encoder, decoder = WireEncoder(delta=delta), WireDecoder(delta=delta)
+            ## chunks of odd sizes, split differently on each side
+            encoded = b"".join(encoder.encode(data[start:start + 333]) for start in range(0, len(data), 333))
+            decoded = b"".join(decoder.decode(encoded[start:start + 101]) for start in range(0, len(encoded), 101))
+            self.assertEqual(decoded, data)
+
+    def test_image_ratio(self):
+        ## a smooth 16-bit image, as the device sends it
+        x, y = np.meshgrid(np.arange(512), np.arange(512))
+        image = ((np.sin(x/40) + np.cos(y/30) + 2)*4000).astype(">u2").tobytes()
+        plain = len(WireEncoder().encode(image))
+        delta = len(WireEncoder(delta=True).encode(image))
+        self.assertLess(delta, plain)
+        self.assertLess(delta, len(image)/3)
+
+
+class CompressedConnectionTest(unittest.TestCase):
+    def run_server(self, handle):
+        async def test_fn():
+            server = await asyncio.start_server(handle, "localhost", 0)
+            port = server.sockets[0].getsockname()[1]
+            conn = TCPConnection("localhost", port, compression=True, negotiation_timeout=0.2)
+            async with server:
+                await conn._connect()
+                await conn._stream.write(b"\x00\x01\x02")
+                await conn._stream.flush()
+                data = bytes(await conn._stream.read(6))
+                conn._stream._writer.close()
+                return conn, data
+        return asyncio.run(test_fn())
+
+    def test_negotiate(self):
+        async def handle(reader, writer):
+            writer.write(BANNER)
+            self.assertEqual(await reader.readexactly(len(OPT_IN)), OPT_IN)
+            decoder, encoder = WireDecoder(), WireEncoder(delta=True)
+            received = b""
+            while len(received) < 3:
+                received += decoder.decode(await reader.read(100))
+            writer.write(encoder.encode(received*2))
+            await writer.drain()
+            writer.close()
+        conn, data = self.run_server(handle)
+        self.assertIsInstance(conn._stream, CompressedTCPStream)
+        self.assertEqual(data, b"\x00\x01\x02"*2)
+
+    def test_fallback(self):
+        ## a server without compression sends nothing until it receives a command
+        async def handle(reader, writer):
+            received = await reader.readexactly(3)
+            writer.write(received*2)
+            await writer.drain()
+            writer.close()
+        conn, data = self.run_server(handle)
+        self.assertIs(type(conn._stream), TCPStream)
+        self.assertEqual(data, b"\x00\x01\x02"*2)
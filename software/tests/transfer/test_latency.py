@@ -0,0 +1,78 @@
+import unittest
+import array
+import asyncio
+
+import numpy as np
+
+from obi.commands import *
+from obi.transfer import LatencyMonitor
+from obi.transfer.mock import MockStream
+
+
+def record(sequence, device_cycles):
+    ## as sent by CommandExecutor: the marker, then 14-bit fields shifted left by 2
+    fields = [(value >> shift) & 0x3fff for value in (device_cycles, sequence) for shift in (28, 14, 0)]
+    return [TIMESTAMP_MARKER] + [field << 2 for field in fields]
+
+
+class BufferStream(MockStream):
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.latency = LatencyMonitor()
+
+    async def read(self, length):
+        chunk, self.data = self.data[:length], self.data[length:]
+        assert len(chunk) == length, "read past end of data"
+        return chunk
+
+
+class TimestampTest(unittest.TestCase):
+    def test_strip(self):
+        words = [1 << 2, 2 << 2] + record(2, 123_456_789_012) + [3 << 2]
+        data = np.array(words, dtype=">u2").tobytes()
+        self.assertEqual(count_timestamps(data), 1)
+        pixels, records = strip_timestamps(data, host_time=1.0)
+        self.assertEqual(list(pixels), [4, 8, 12])
+        self.assertEqual(records, [TimestampRecord(sequence=2, device_cycles=123_456_789_012, host_time=1.0)])
+
+    def test_recv_res(self):
+        pixels = [(n % 16384) << 2 for n in range(100)]
+        words = []
+        for n, pixel in enumerate(pixels):
+            if n and n % 10 == 0:
+                words += record(n, n*1000)
+            words.append(pixel)
+        stream = BufferStream(np.array(words, dtype=">u2").tobytes())
+        cmd = SynchronizeCommand(cookie=123, raster=True, output=OutputMode.SixteenBit)
+        async def recv():
+            res = array.array('H')
+            ## chunks that end in the middle of records
+            for count in [15, 1, 30, 54]:
+                res.extend(await cmd.recv_res(count, stream, OutputMode.SixteenBit))
+            return res
+        self.assertEqual(list(asyncio.run(recv())), pixels)
+        self.assertEqual(len(stream.data), 0)
+        self.assertEqual([record.sequence for record in stream.latency.records], list(range(10, 100, 10)))
+
+
+class LatencyMonitorTest(unittest.TestCase):
+    def test_latency(self):
+        monitor = LatencyMonitor()
+        self.assertIsNone(monitor.latency)
+        ## 1000 pixels every 48000 cycles (1 ms) on the device, received 2 ms apart with a delay
+        monitor.add([TimestampRecord(sequence=1000*n, device_cycles=48000*n, host_time=10 + 0.002*n)
+                     for n in range(1, 5)])
+        self.assertAlmostEqual(monitor.latency, 0.003)
+        self.assertAlmostEqual(monitor.max_latency, 0.003)
+        self.assertAlmostEqual(monitor.throughput, 500_000, delta=1)
+        self.assertAlmostEqual(monitor.device_throughput, 1_000_000, delta=1)
+
+    def test_restart(self):
+        monitor = LatencyMonitor()
+        monitor.add([TimestampRecord(sequence=100, device_cycles=(1 << 42) - 10, host_time=1.0),
+                     TimestampRecord(sequence=200, device_cycles=10, host_time=1.1)])
+        ## the timestamp counter wrapped around
+        self.assertEqual(monitor.records[-1].device_cycles, (1 << 42) + 10)
+        monitor.add([TimestampRecord(sequence=50, device_cycles=100, host_time=1.2)])
+        ## a new synchronization started the sequence over
+        self.assertEqual(len(monitor.records), 1)